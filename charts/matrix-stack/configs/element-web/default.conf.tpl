@@ -14,6 +14,7 @@ SPDX-License-Identifier: AGPL-3.0-only
 # * /health added for k8s
 # * setting a charset
 # * ensuring our security headers include are applied, whether or not paths are in location blocks or not
+# * optional compression, file serving tuning and immutable caching of the content-hashed bundles
 server {
 {{- if has $root.Values.networking.ipFamily (list "ipv4" "dual-stack") }}
   listen       8080;
@@ -28,6 +29,37 @@ server {
   charset utf-8;
 
   include /etc/nginx/security_headers.conf;
+{{- with $root.Values.elementWeb.nginx }}
+{{- if .sendfile }}
+
+  sendfile on;
+  tcp_nopush on;
+{{- end }}
+{{- if .gzip }}
+
+  # Compress responses, serving any pre-compressed .gz files from the image as-is
+  gzip on;
+  gzip_static on;
+  gzip_vary on;
+  gzip_types text/css application/javascript application/json application/wasm image/svg+xml;
+{{- end }}
+{{- with .openFileCache }}
+{{- if .maxFiles }}
+
+  # Nothing in the image changes while nginx is running
+  open_file_cache max={{ .maxFiles }} inactive={{ .inactiveSeconds }}s;
+  open_file_cache_valid {{ .inactiveSeconds }}s;
+{{- end }}
+{{- end }}
+{{- if .immutableBundles }}
+
+  # The bundles are in directories named after the hash of their content, so never change
+  location /bundles/ {
+      add_header Cache-Control "public, max-age=31536000, immutable";
+      include /etc/nginx/security_headers.conf;
+  }
+{{- end }}
+{{- end }}
 
   # Set no-cache for the version, config and index.html
   # so that browsers always check for a new copy of Element Web.
@@ -7,9 +7,26 @@ SPDX-License-Identifier: AGPL-3.0-only
 
 {{- $root := .root -}}
 {{- with required "haproxy/haproxy.cfg.tpl missing context" .context -}}
+{{- $tuning := include "element-io.haproxy.tuning" (dict "root" $root "context" .) | fromJson -}}
 
 global
   log stdout format raw local0 info
+{{- with $tuning.threads }}
+
+  nbthread {{ . }}
+{{- end }}
+{{- with .maxConnections }}
+
+  # Connections above this wait in the kernel's accept queue rather than using memory HAProxy doesn't have
+  maxconn {{ . }}
+{{- end }}
+{{- with .bufferSizeBytes }}
+
+  tune.bufsize {{ . }}
+{{- end }}
+{{- with .maxHeaders }}
+  tune.http.maxhdr {{ . }}
+{{- end }}
 
   # Allow for rewriting HTTP headers (e.g. Authorization) up to 4k
   # https://github.com/haproxy/haproxy/issues/1743
@@ -74,6 +91,17 @@ defaults
   # Use a consistent hashing scheme so that worker with balancing going down doesn't cause
   # the traffic for all others to be shuffled around.
   hash-type consistent sdbm
+{{- with .cache }}
+{{- if .enabled }}
+
+cache ess
+  total-max-size {{ .totalMaxSizeMB }}
+  max-age {{ .maxAgeSeconds }}
+{{- with .maxObjectSizeBytes }}
+  max-object-size {{ . }}
+{{- end }}
+{{- end }}
+{{- end }}
 
 resolvers kubedns
   parse-resolv-conf
@@ -114,6 +142,10 @@ frontend http-blackhole
 {{ tpl ($root.Files.Get "configs/synapse/partial-haproxy.cfg.tpl") (dict "root" $root "context" $root.Values.synapse) }}
 {{ end }}
 
+{{ if (include "element-io.matrix-authentication-service.synapseViaHAProxy" (dict "root" $root)) }}
+{{ tpl ($root.Files.Get "configs/matrix-authentication-service/partial-haproxy.cfg.tpl") (dict "root" $root "context" $root.Values.matrixAuthenticationService) }}
+{{ end }}
+
 {{ if $root.Values.wellKnownDelegation.enabled }}
 {{ tpl ($root.Files.Get "configs/well-known/partial-haproxy.cfg.tpl") (dict "root" $root "context" $root.Values.wellKnownDelegation) }}
 {{ end }}
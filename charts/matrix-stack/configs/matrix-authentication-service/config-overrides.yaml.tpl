@@ -56,8 +56,10 @@ https://github.com/kubernetes/kubernetes/issues/129043 / https://github.com/kube
   uri: "postgresql://{{ .user }}:${POSTGRES_PASSWORD}@{{ tpl .host $root }}:{{ .port }}/{{ .database }}?{{ with .sslMode }}sslmode={{ . }}&{{ end }}application_name=matrix-authentication-service"
 {{- end }}
 {{- else if $root.Values.postgres.enabled }}
-  uri: "postgresql://matrixauthenticationservice_user:${POSTGRES_PASSWORD}@{{ $root.Release.Name }}-postgres.{{ $root.Release.Namespace }}.svc.{{ $root.Values.clusterDomain }}:5432/matrixauthenticationservice?sslmode=prefer&application_name=matrix-authentication-service"
-{{ end }}
+  uri: "postgresql://matrixauthenticationservice_user:${POSTGRES_PASSWORD}@{{ include "element-io.ess-library.postgres-bundled-host" (dict "root" $root) }}:{{ include "element-io.ess-library.postgres-bundled-port" (dict "root" $root) }}/matrixauthenticationservice?sslmode=prefer&application_name=matrix-authentication-service"
+{{- end }}
+  min_connections: {{ .databasePool.minConnections }}
+  max_connections: {{ .databasePool.maxConnections }}
 
 telemetry:
   metrics:
@@ -0,0 +1,36 @@
+{{- /*
+Copyright 2025 New Vector Ltd
+Copyright 2025 Element Creations Ltd
+
+SPDX-License-Identifier: AGPL-3.0-only
+*/ -}}
+
+{{- $root := .root -}}
+{{- with required "matrix-authentication-service/partial-haproxy.cfg.tpl missing context" .context -}}
+
+frontend matrix-authentication-service-in
+{{- if has $root.Values.networking.ipFamily (list "ipv4" "dual-stack") }}
+  bind *:8011
+{{- end }}
+{{- if has $root.Values.networking.ipFamily (list "ipv6" "dual-stack") }}
+  bind [::]:8011 {{ (eq $root.Values.networking.ipFamily "dual-stack") | ternary "v6only" "v4v6" }}
+{{- end }}
+
+  # same as http log, with %Th (handshake time)
+  log-format "%ci:%cp [%tr] %ft %b/%s %Th/%TR/%Tw/%Tc/%Tr/%Ta %ST %B %CC %CS %tsc %ac/%fc/%bc/%sc/%rc %sq/%bq %hr %hs %{+Q}r"
+
+  default_backend matrix-authentication-service
+
+backend matrix-authentication-service
+  # Introspection requests are short and similar, send each one to the least busy replica
+  balance leastconn
+  default-server maxconn {{ .synapseViaHAProxy.maxConnections | int }}
+
+  option httpchk
+  http-check connect port 8081
+  http-check send meth GET uri /health
+
+  # Use DNS SRV service discovery on the headless service
+  server-template mas {{ .replicas }} _http._tcp.{{ $root.Release.Name }}-matrix-authentication-service-srv.{{ $root.Release.Namespace }}.svc.{{ $root.Values.clusterDomain }} resolvers kubedns init-addr none check
+
+{{- end }}
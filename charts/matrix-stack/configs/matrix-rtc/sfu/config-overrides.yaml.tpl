@@ -25,6 +25,16 @@ logging:
 # WebRTC configuration
 rtc:
   use_external_ip: {{ .useStunToDiscoverPublicIP }}
+  use_ice_lite: {{ .useIceLite }}
+  congestion_control:
+    enabled: {{ .congestionControl.enabled }}
+    allow_pause: {{ .congestionControl.allowPause }}
+{{- with .packetBufferSizeVideo }}
+  packet_buffer_size_video: {{ . | int }}
+{{- end }}
+{{- with .packetBufferSizeAudio }}
+  packet_buffer_size_audio: {{ . | int }}
+{{- end }}
 {{ if or .manualIP (not .useStunToDiscoverPublicIP) }}
   node_ip: ${NODE_IP}
 {{- end }}
@@ -62,5 +72,11 @@ key_file: /conf/keys.yaml
 
 room:
   auto_create: false
+{{- if gt (.replicas | int) 1 }}
+
+redis:
+  address: {{ include "element-io.matrix-rtc-sfu.redisAddress" (dict "root" $root) | quote }}
+  db: {{ .redis.db }}
+{{- end }}
 
 {{ end }}
@@ -0,0 +1,13 @@
+{{- /*
+Copyright 2025 New Vector Ltd
+Copyright 2025 Element Creations Ltd
+
+SPDX-License-Identifier: AGPL-3.0-only
+*/ -}}
+
+{{- with required "postgres/pgbouncer-hba.conf.tpl missing context" .context -}}
+# The exporter is in the same Pod and connects over the Unix socket to read the stats
+local pgbouncer pgbouncer_exporter trust
+host all all 0.0.0.0/0 scram-sha-256
+host all all ::/0 scram-sha-256
+{{- end -}}
@@ -0,0 +1,25 @@
+{{- /*
+Copyright 2025 New Vector Ltd
+Copyright 2025 Element Creations Ltd
+
+SPDX-License-Identifier: AGPL-3.0-only
+*/ -}}
+
+{{- $root := .root -}}
+{{- with required "postgres/pgbouncer-userlist.sh.tpl missing context" .context -}}
+
+#!/bin/sh
+set -e;
+echo '"pgbouncer_exporter" ""' > /userlist/userlist.txt;
+{{- range $key := include "element-io.postgres-pgbouncer.databases" (dict "root" $root) | fromJsonArray }}
+echo "\"{{ $key | lower }}_user\" \"`cat /secrets/{{
+include "element-io.ess-library.init-secret-path" (
+dict "root" $root "context" (
+  dict "secretPath" (printf "postgres.essPasswords.%s" $key)
+        "initSecretKey" (include "element-io.ess-library.postgres-env-var" (dict "root" $root "context" $key))
+        "defaultSecretName" (include "element-io.postgres.secret-name" (dict "root" $root "context"  (dict "isHook" false)))
+        "defaultSecretKey" (printf "ESS_PASSWORD_%s" ($key | upper))
+  )
+) }}`\"" >> /userlist/userlist.txt;
+{{- end }}
+{{- end -}}
@@ -0,0 +1,34 @@
+{{- /*
+Copyright 2025 New Vector Ltd
+Copyright 2025 Element Creations Ltd
+
+SPDX-License-Identifier: AGPL-3.0-only
+*/ -}}
+
+{{- $root := .root -}}
+{{- with required "postgres/pgbouncer.ini.tpl missing context" .context -}}
+{{- $postgresHost := printf "%s-postgres.%s.svc.%s" $root.Release.Name $root.Release.Namespace $root.Values.clusterDomain -}}
+[databases]
+{{- range $key := include "element-io.postgres-pgbouncer.databases" (dict "root" $root) | fromJsonArray }}
+{{ $key | lower }} = host={{ $postgresHost }} port=5432 dbname={{ $key | lower }} pool_size={{ include "element-io.postgres-pgbouncer.poolSize" (dict "root" $root "context" $key) }} pool_mode={{ include "element-io.postgres-pgbouncer.poolMode" (dict "root" $root "context" $key) }}
+{{- end }}
+
+[pgbouncer]
+listen_addr = *
+listen_port = 6432
+unix_socket_dir = /var/run/pgbouncer
+pidfile =
+logfile =
+
+auth_type = hba
+auth_hba_file = /config/pg_hba.conf
+auth_file = /userlist/userlist.txt
+stats_users = pgbouncer_exporter
+
+max_client_conn = {{ .maxClientConnections }}
+pool_mode = {{ .poolMode }}
+# Matrix Authentication Service uses prepared statements
+max_prepared_statements = 200
+# Sent by Matrix Authentication Service, which PgBouncer doesn't otherwise know what to do with
+ignore_startup_parameters = extra_float_digits
+{{- end -}}
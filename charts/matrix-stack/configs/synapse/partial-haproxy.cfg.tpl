@@ -71,6 +71,33 @@ frontend synapse-http-in
   # We also need a http header format to allow us to loadbalance and make decisions:
   http-request set-header X-Access-Token %[var(req.access_token)]
 
+  # Access tokens issued by Synapse are of the form syt_<URL-safe base64 of the localpart>_<random>_<crc>,
+  # so we can balance on the user without having to look the token up. The localpart can itself contain _
+  # but the random part and CRC can't, so everything before the last two fields identifies the user.
+  # All other access tokens (e.g. those issued by Matrix Authentication Service) are treated as their own user.
+  http-request set-var(req.matrix_user) var(req.access_token),field(-3,_,0) if { var(req.access_token) -m beg syt_ }
+  http-request set-var(req.matrix_user) var(req.access_token) unless { var(req.matrix_user) -m found }
+  http-request set-header X-Matrix-User %[var(req.matrix_user)]
+
+{{- with $root.Values.haproxy.cache }}
+{{- if .enabled }}
+
+  # Cache the responses to unauthenticated requests that every client makes when it starts.
+  # The cache filter is declared first so that uncompressed responses are cached and then compressed for each client
+  filter cache ess
+  filter compression
+  acl cacheable_path path /_matrix/client/versions
+{{- if .thumbnails }}
+  acl cacheable_path path_beg /_matrix/media/r0/thumbnail/ /_matrix/media/v3/thumbnail/
+{{- end }}
+  http-request set-var(txn.cacheable) bool(true) if METH_GET cacheable_path !{ var(req.access_token) -m found }
+  http-request cache-use ess if { var(txn.cacheable) -m bool }
+  # Synapse marks its JSON responses as not to be cached
+  http-response set-header Cache-Control "public, max-age={{ .maxAgeSeconds }}" if { var(txn.cacheable) -m bool } { status 200 }
+  http-response cache-store ess if { var(txn.cacheable) -m bool }
+{{- end }}
+{{- end }}
+
   # Disable Google FLoC
   http-response set-header Permissions-Policy "interest-cohort=()"
 
@@ -147,8 +174,9 @@ backend ess-version-static
 
   http-request return status 200 content-type "application/json" file /synapse/ess-version.json
 
+{{- $mainHaproxyBackend := include "element-io.synapse.process.haproxyBackend" (dict "root" $root "context" "main") | fromJson }}
 backend synapse-main
-  default-server maxconn 250
+{{- include "element-io.synapse.haproxyBackendSettings" (dict "root" $root "context" $mainHaproxyBackend) }}
 
   option httpchk
   http-check connect port 8080
@@ -159,7 +187,7 @@ backend synapse-main
 
 {{- if $hasFailoverBackend }}
 backend synapse-main-failover
-  default-server maxconn 250
+{{- include "element-io.synapse.haproxyBackendSettings" (dict "root" $root "context" $mainHaproxyBackend) }}
 
   option httpchk
   http-check connect port 8080
@@ -177,65 +205,28 @@ backend synapse-{{ $workerType }}
   http-check connect port 8080
   http-check send meth GET uri /health
 
+{{- include "element-io.synapse.haproxyBackendSettings" (dict "root" $root "context" (include "element-io.synapse.process.haproxyBackend" (dict "root" $root "context" $workerType) | fromJson)) }}
+
 {{- if eq $workerType "event-creator" }}
-  # We want to balance based on the room, so try and pull it out of the path
+
+  # Pull the room out of the path for balancing on
   http-request set-header X-Matrix-Room %[path]
   http-request replace-header X-Matrix-Room rooms/([^/]+) \1
   http-request replace-header X-Matrix-Room join/([^/]+) \1
 
-  balance hdr(X-Matrix-Room)
-
-{{- else if eq $workerType "federation-inbound" }}
-  # We balance by source IP so the same origin servers go to the same worker.
-  # That should be enough to ensure that transactions from the same origin go
-  # to the same worker, unless they change IP, in which case its not actually
-  # the end of the world if we process the same transaction twice.
-  balance source
+{{- else if eq $workerType "media-repository" }}
 
-{{- else if eq $workerType "federation-reader" }}
-  # we balance by URI principally so that identical state_ids requests go to
-  # the same worker. They are expensive so we want to avoid duplicate work;
-  # on the other hand if we don't include the URI params then all the
-  # requests for a given room go to one worker, which tends to send it into
-  # a death spiral.
-  balance uri whole
+  # Pull the media ID out of the path for balancing on. Uploads don't have one and so are balanced round robin
+  http-request set-header X-Matrix-Media %[path] if { path -m reg /(download|thumbnail)/ }
+  http-request replace-header X-Matrix-Media ^/_matrix/federation/v1/media/(download|thumbnail)/([^/]+)$ \2
+  http-request replace-header X-Matrix-Media ^/_matrix/(media/[^/]+|client/v1/media)/(download|thumbnail)/[^/]+/([^/]+) \3
 
 {{- else if eq $workerType "initial-synchrotron" }}
+
   # increase the server timeout, as it can take a long time to generate and
   # return the initial sync.
   timeout server 180s
 
-  # Balance on hash of access token
-  balance hdr(X-Access-Token)
-
-  # limit the number of concurrent requests to each synchrotron,
-  # to stop the reactor tick time rocketing
-  default-server maxconn 50
-
-{{- else if has $workerType (list "sliding-sync" "synchrotron") }}
-  # Balance on the hash of the access token.
-  # When using stick tables, the stickiness only takes effect once the backend
-  # has responded at least once. If a user keeps timing out on their first
-  # incremental sync in a while, then they will keep 'bouncing' around
-  # different synchrotrons, preventing their sync from making progress.
-  #
-  # We can still use stick tables to ensure that once a client gets assigned
-  # to a Synchrotron it stays on that worker, allowing us to rebalance the
-  # pool without moving existing sessions.
-  #
-  # If the header doesn't exist it will round robin requests,
-  # though in that case they should all just be 4xx'd due
-  # to lack of an access token.
-  balance hdr(X-Access-Token)
-
-  # synchrotrons are long-polled, so we need to allow many
-  # concurrent connections.
-  default-server maxconn 2000
-
-  # if we *do* hit the limit, it's probably better we shed further
-  # requests quickly than let them queue up on the haproxy.
-  timeout queue 5s
-
 {{- end }}
 {{- $maxInstances := ternary 20 1 (hasKey $workerDetails "replicas") }}
 {{- $workerTypeName := include "element-io.synapse.process.workerTypeName" (dict "root" $root "context" $workerType) }}
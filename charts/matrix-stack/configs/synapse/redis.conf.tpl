@@ -1,14 +1,20 @@
-# Copyright 2025 New Vector Ltd
-# Copyright 2025 Element Creations Ltd
-# SPDX-License-Identifier: AGPL-3.0-only
+{{- /*
+Copyright 2025 New Vector Ltd
+Copyright 2025 Element Creations Ltd
 
+SPDX-License-Identifier: AGPL-3.0-only
+*/ -}}
+
+{{- $root := .root -}}
+{{- with required "synapse/redis.conf.tpl missing context" .context -}}
+{{- $tuning := include "element-io.synapse-redis.tuning" (dict "root" $root "context" .) | fromJson -}}
 # This file is based upon https://raw.githubusercontent.com/redis/redis/6.2/redis.conf
 
 # Do not require a password
 protected-mode no
 port 6379
 
-tcp-backlog 511
+tcp-backlog {{ .tcpBacklog }}
 tcp-keepalive 300
 
 # Never close the connection
@@ -28,6 +34,15 @@ stop-writes-on-bgsave-error yes
 # We never save to the disk
 save ''
 
+{{- with $tuning.maxMemoryMB }}
+
+# Nothing stored needs to be kept, so evict keys rather than be OOM killed
+maxmemory {{ . }}mb
+{{- end }}
+maxmemory-policy {{ .maxMemoryPolicy }}
+
+io-threads {{ .ioThreads }}
+
 replica-serve-stale-data yes
 replica-read-only yes
 repl-diskless-sync no
@@ -78,10 +93,10 @@ stream-node-max-entries 100
 activerehashing yes
 client-output-buffer-limit normal 0 0 0
 client-output-buffer-limit replica 256mb 64mb 60
-client-output-buffer-limit pubsub 32mb 8mb 60
+client-output-buffer-limit pubsub {{ $tuning.pubsubHardLimitMB }}mb {{ $tuning.pubsubSoftLimitMB }}mb {{ .pubsubClientOutputBufferLimit.softLimitSeconds }}
 
-# Hz is the freuqency at which background tasks are performed, we keep this low to save CPU
-hz 1
+# Hz is the frequency at which background tasks are performed, by default we keep this low to save CPU
+hz {{ .hz }}
 
 # The hz value is increased to scale with the number of clients connected.
 dynamic-hz yes
@@ -89,3 +104,4 @@ dynamic-hz yes
 aof-rewrite-incremental-fsync yes
 rdb-save-incremental-fsync yes
 jemalloc-bg-thread yes
+{{- end -}}
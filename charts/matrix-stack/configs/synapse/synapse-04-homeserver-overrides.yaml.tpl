@@ -56,8 +56,8 @@ https://github.com/kubernetes/kubernetes/issues/129043 / https://github.com/kube
     user: "synapse_user"
     password: ${SYNAPSE_POSTGRES_PASSWORD}
     database: "synapse"
-    host: "{{ $root.Release.Name }}-postgres.{{ $root.Release.Namespace }}.svc.{{ $root.Values.clusterDomain }}"
-    port: 5432
+    host: "{{ include "element-io.ess-library.postgres-bundled-host" (dict "root" $root) }}"
+    port: {{ include "element-io.ess-library.postgres-bundled-port" (dict "root" $root) }}
     sslmode: prefer
 {{ end }}
 
@@ -102,8 +102,12 @@ matrix_authentication_service:
                         "defaultSecretKey" "SYNAPSE_SHARED_SECRET"
                       )
                   ) }}
+{{- if (include "element-io.matrix-authentication-service.synapseViaHAProxy" (dict "root" $root)) }}
+  endpoint: http://{{ $root.Release.Name }}-haproxy.{{ $root.Release.Namespace }}.svc.{{ $root.Values.clusterDomain }}:8011/
+{{- else }}
   endpoint: http://{{ $root.Release.Name }}-matrix-authentication-service.{{ $root.Release.Namespace }}.svc.{{ $root.Values.clusterDomain }}:8080/
 {{- end }}
+{{- end }}
 
 {{- if or (include "element-io.matrix-authentication-service.readyToHandleAuth" (dict "root" $root)) $root.Values.matrixRTC.enabled }}
 experimental_features:
@@ -170,7 +174,7 @@ send_federation: true
 media_store_path: "/media/media_store"
 max_upload_size: "{{ .media.maxUploadSize }}"
 {{- if dig "media-repository" "enabled" false .workers }}
-media_instance_running_background_jobs: "{{ $root.Release.Name }}-synapse-{{- include "element-io.synapse.process.workerTypeName" (dict "root" $root "context" "media-repository") }}-0"
+media_instance_running_background_jobs: "{{ $root.Release.Name }}-synapse-{{- include "element-io.synapse.process.workerTypeName" (dict "root" $root "context" "media-repository") }}-{{ .media.backgroundJobsReplica }}"
 {{- end }}
 
 {{- if dig "pusher" "enabled" false .workers }}
@@ -80,9 +80,58 @@ worker_listeners:
   - names: [health]
     compress: false
 
+{{- with include "element-io.synapse.process.databasePool" (dict "root" $root "context" .processType) | fromJson }}
+database:
+  args:
+    cp_min: {{ .cpMin }}
+    cp_max: {{ .cpMax }}
+{{- end }}
+
+{{- with include "element-io.synapse.process.gc" (dict "root" $root "context" .processType) | fromJson }}
+{{- with .thresholds }}
+gc_thresholds: {{ . | toJson }}
+{{- end }}
+{{- with .minInterval }}
+gc_min_interval: {{ . | toJson }}
+{{- end }}
+{{- end }}
+
+caches:
+  {{- include "element-io.synapse.process.caches" (dict "root" $root "context" (dict "processType" .processType)) | fromJson | toYaml | nindent 2 }}
 {{- $enabledWorkers := (include "element-io.synapse.enabledWorkers" (dict "root" $root)) | fromJson }}
 {{- if (include "element-io.synapse.process.responsibleForMedia" (dict "root" $root "context" (dict "processType" .processType "enabledWorkerTypes" (keys $enabledWorkers)))) }}
 enable_media_repo: true
+{{- with $root.Values.synapse.media.s3 }}
+{{- if .enabled }}
+
+media_storage_providers:
+- module: s3_storage_provider.S3StorageProviderBackend
+  store_local: true
+  store_remote: {{ .storeRemote }}
+  store_synchronous: {{ not .asynchronousUploads }}
+  config:
+    bucket: {{ .bucket | quote }}
+{{- with .regionName }}
+    region_name: {{ . | quote }}
+{{- end }}
+{{- with .endpointUrl }}
+    endpoint_url: {{ tpl . $root | quote }}
+{{- end }}
+{{- with .prefix }}
+    prefix: {{ . | quote }}
+{{- end }}
+{{- with .storageClass }}
+    storage_class: {{ . | quote }}
+{{- end }}
+{{- with .threadpoolSize }}
+    threadpool_size: {{ . }}
+{{- end }}
+{{- if .accessKeyId }}
+    access_key_id: ${SYNAPSE_S3_ACCESS_KEY_ID}
+    secret_access_key: ${SYNAPSE_S3_SECRET_ACCESS_KEY}
+{{- end }}
+{{- end }}
+{{- end }}
 {{- else }}
 # Stub out the media storage provider for processes not responsible for media
 media_storage_providers:
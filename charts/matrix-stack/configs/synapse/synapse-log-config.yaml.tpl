@@ -6,16 +6,37 @@ SPDX-License-Identifier: AGPL-3.0-only
 */ -}}
 
 {{- $root := .root -}}
+{{- with required "synapse/synapse-log-config.yaml.tpl missing context" .context -}}
+{{- $logging := $root.Values.synapse.logging -}}
+{{- $rootLevel := $logging.rootLevel -}}
+{{- if ne .processType "main" -}}
+{{- $rootLevel = dig .processType "logging" "rootLevel" nil $root.Values.synapse.workers | default $rootLevel -}}
+{{- end }}
 version: 1
 
 formatters:
+{{- if eq $logging.format "json" }}
+  json:
+    class: synapse.logging.TerseJsonFormatter
+{{- else if eq $logging.format "compact" }}
+  compact:
+    format: '%(asctime)s %(levelname)s %(name)s %(request)s %(message)s'
+{{- else }}
   precise:
     format: '%(asctime)s - %(name)s - %(lineno)d - %(levelname)s - %(request)s - %(message)s'
+{{- end }}
 
 handlers:
   console:
     class: logging.StreamHandler
-    formatter: precise
+    formatter: {{ $logging.format | default "precise" }}
+{{- if $logging.queued }}
+  {{- /* Python 3.12+ starts a QueueListener writing to the given handlers from its own thread */}}
+  queued:
+    class: logging.handlers.QueueHandler
+    handlers:
+    - console
+{{- end }}
 
 loggers:
 {{- /*
@@ -23,14 +44,15 @@ Increasing synapse.storage.SQL past INFO will log access tokens. Putting in the
 nuked if an override is set and then if the root level is increased to debug, the access tokens will be logged.
 Putting here means it is an explicit customer choice to override it.
 */}}
-{{- range $logger, $level := mustMergeOverwrite (dict "synapse.storage.SQL" "INFO") $root.Values.synapse.logging.levelOverrides }}
+{{- range $logger, $level := mustMergeOverwrite (dict "synapse.storage.SQL" "INFO") $logging.levelOverrides }}
   {{ $logger }}:
     level: "{{ $level }}"
 {{- end }}
 
 root:
-  level: "{{ $root.Values.synapse.logging.rootLevel }}"
+  level: "{{ $rootLevel }}"
   handlers:
-  - console
+  - {{ $logging.queued | ternary "queued" "console" }}
 
 disable_existing_loggers: false
+{{- end }}
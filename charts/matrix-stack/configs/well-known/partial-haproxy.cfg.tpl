@@ -56,6 +56,11 @@ backend well-known-static
   http-after-response set-header Access-Control-Allow-Origin *
   http-after-response set-header Access-Control-Allow-Methods "GET, POST, PUT, DELETE, OPTIONS"
   http-after-response set-header Access-Control-Allow-Headers "X-Requested-With, Content-Type, Authorization"
+{{- if $root.Values.haproxy.cache.enabled }}
+
+  # These are already served from memory, so let clients and any intermediate caches hold on to them
+  http-after-response set-header Cache-Control "public, max-age={{ $root.Values.haproxy.cache.maxAgeSeconds }}" if { status 200 }
+{{- end }}
 
   http-request return status 200 content-type "application/json" file "/well-known/server" if { path /.well-known/matrix/server }
   http-request return status 200 content-type "application/json" file "/well-known/client" if { path /.well-known/matrix/client }
@@ -142,3 +142,51 @@ env:
 {{- end -}}
 {{- end -}}
 {{- end -}}
+
+{{- /*
+The memory limit of the given resources in MiB, or nothing if there is no memory limit or it can't be parsed.
+Accepts any Kubernetes quantity, e.g. 512M, 1.5Gi, 268435456 or 5e8.
+Used to size settings for processes that don't pick up on the container's memory limit themselves.
+*/ -}}
+{{- define "element-io.ess-library.pods.memoryLimitsMB" -}}
+{{- $root := .root -}}
+{{- with required "element-io.ess-library.pods.memoryLimitsMB missing context" .context -}}
+{{- with dig "limits" "memory" "" (.resources | default dict) -}}
+  {{- $value := . | toString | trimPrefix "+" -}}
+  {{- $multipliers := dict "" "1" "m" "1e-3" "k" "1e3" "M" "1e6" "G" "1e9" "T" "1e12" "P" "1e15" "E" "1e18"
+                           "Ki" "1024" "Mi" "1048576" "Gi" "1073741824" "Ti" "1099511627776"
+                           "Pi" "1125899906842624" "Ei" "1152921504606846976" -}}
+  {{- $number := regexFind "^([0-9]+\\.?[0-9]*|\\.[0-9]+)" $value -}}
+  {{- $suffix := trimPrefix $number $value -}}
+  {{- $multiplier := "" -}}
+  {{- if regexMatch "^[eE][+-]?[0-9]+$" $suffix -}}
+    {{- $multiplier = printf "1%s" $suffix -}}
+  {{- else if hasKey $multipliers $suffix -}}
+    {{- $multiplier = get $multipliers $suffix -}}
+  {{- end -}}
+  {{- if and $number $multiplier -}}
+    {{- $memoryLimitsMB := floor (divf (mulf ($number | float64) ($multiplier | float64)) 1048576) | int64 -}}
+    {{- if gt $memoryLimitsMB 0 -}}
+      {{- $memoryLimitsMB -}}
+    {{- end -}}
+  {{- end -}}
+{{- end -}}
+{{- end -}}
+{{- end -}}
+
+{{- /*
+The CPU limit of the given resources in whole CPUs rounded up, or nothing if there is no CPU limit or it can't be parsed.
+*/ -}}
+{{- define "element-io.ess-library.pods.cpuLimitsCores" -}}
+{{- $root := .root -}}
+{{- with required "element-io.ess-library.pods.cpuLimitsCores missing context" .context -}}
+{{- with dig "limits" "cpu" "" (.resources | default dict) -}}
+  {{- $value := . | toString -}}
+  {{- if $value | hasSuffix "m" }}
+    {{- ceil (divf (trimSuffix "m" $value | float64) 1000) | int64 -}}
+  {{- else if regexMatch "^[0-9]+(\\.[0-9]+)?$" $value }}
+    {{- ceil ($value | float64) | int64 -}}
+  {{- end -}}
+{{- end -}}
+{{- end -}}
+{{- end -}}
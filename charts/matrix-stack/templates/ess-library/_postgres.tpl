@@ -13,7 +13,7 @@ SPDX-License-Identifier: AGPL-3.0-only
 {{- if .postgres -}}
 {{ (tpl .postgres.host $root) }}:{{ .postgres.port | default 5432 }}
 {{- else if $root.Values.postgres.enabled -}}
-{{ $root.Release.Name }}-postgres.{{ $root.Release.Namespace }}.svc.{{ $root.Values.clusterDomain }}:5432
+{{ include "element-io.ess-library.postgres-bundled-host" (dict "root" $root) }}:{{ include "element-io.ess-library.postgres-bundled-port" (dict "root" $root) }}
 {{- else }}
 {{- fail "You need to enable the chart Postgres or configure this component postgres" -}}
 {{- end -}}
@@ -21,6 +21,23 @@ SPDX-License-Identifier: AGPL-3.0-only
 {{- end -}}
 
 
+{{- /* The chart's Postgres, or PgBouncer in front of it if enabled */}}
+{{- define "element-io.ess-library.postgres-bundled-host" -}}
+{{- $root := .root -}}
+{{- if $root.Values.postgres.pgbouncer.enabled -}}
+{{ $root.Release.Name }}-postgres-pgbouncer.{{ $root.Release.Namespace }}.svc.{{ $root.Values.clusterDomain }}
+{{- else -}}
+{{ $root.Release.Name }}-postgres.{{ $root.Release.Namespace }}.svc.{{ $root.Values.clusterDomain }}
+{{- end -}}
+{{- end -}}
+
+
+{{- define "element-io.ess-library.postgres-bundled-port" -}}
+{{- $root := .root -}}
+{{- ternary 6432 5432 (and $root.Values.postgres.pgbouncer.enabled true) -}}
+{{- end -}}
+
+
 {{- define "element-io.ess-library.postgres-env-var" -}}
 {{- $root := .root -}}
 {{- with required "element-io.ess-library.postgres-env-var requires context" .context -}}
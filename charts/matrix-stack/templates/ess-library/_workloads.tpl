@@ -11,19 +11,32 @@ SPDX-License-Identifier: AGPL-3.0-only
 {{- with required "element-io.ess-library.workloads.commonSpec missing context" .context -}}
 {{- $nameSuffix := required "element-io.ess-library.workloads.commonSpec missing context.nameSuffix" .nameSuffix -}}
 {{- $serviceNameSuffix := .serviceNameSuffix | default $nameSuffix -}}
-{{- $maxSurge := ternary .maxSurge 2 (hasKey . "maxSurge") -}}
 {{- $kind := required "element-io.ess-library.workloads.commonSpec missing context.kind" .kind -}}
+{{- /* A maxSurge given here is a requirement of the component and so takes precedence over the values */ -}}
+{{- $requiredMaxSurge := .maxSurge -}}
+{{- $hasRequiredMaxSurge := hasKey . "maxSurge" -}}
 {{- with required "element-io.ess-library.workloads.commonSpec missing context.componentValues" .componentValues -}}
+{{- $rollingUpdate := .rollingUpdate | default dict -}}
+{{- if not (dig "autoscaling" "enabled" false .) }}
 replicas: {{ .replicas | default 1 }}
+{{- end }}
 selector:
   matchLabels:
     app.kubernetes.io/instance: {{ $root.Release.Name }}-{{ $nameSuffix }}
 {{- if eq "Deployment" $kind }}
+{{- $maxSurge := 2 -}}
+{{- if $hasRequiredMaxSurge -}}
+{{- $maxSurge = $requiredMaxSurge -}}
+{{- else if hasKey $rollingUpdate "maxSurge" -}}
+{{- $maxSurge = $rollingUpdate.maxSurge -}}
+{{- end }}
 strategy:
   type: RollingUpdate
   rollingUpdate:
     maxSurge: {{ $maxSurge }}
-{{- if gt $maxSurge 0 }}
+{{- if hasKey $rollingUpdate "maxUnavailable" }}
+    maxUnavailable: {{ $rollingUpdate.maxUnavailable }}
+{{- else if not (has (toString $maxSurge) (list "0" "0%")) }}
   {{- if hasKey . "replicas" }}
     maxUnavailable: {{ min (max 0 (sub .replicas 1)) 1 }}
   {{- else }}
@@ -36,6 +49,10 @@ strategy:
 serviceName: {{ $root.Release.Name }}-{{ $serviceNameSuffix }}
 updateStrategy:
   type: RollingUpdate
+{{- if hasKey $rollingUpdate "partition" }}
+  rollingUpdate:
+    partition: {{ $rollingUpdate.partition }}
+{{- end }}
 {{- if ne "postgres" $nameSuffix }}
 {{- /* Until we have a migration path in https://github.com/element-hq/ess-helm/pull/870 */}}
 # Without this CrashLoopBackoffs due to config failures block pod recreation
@@ -45,3 +62,40 @@ podManagementPolicy: Parallel
 {{- end }}
 {{- end }}
 {{- end }}
+
+{{- define "element-io.ess-library.workloads.podDisruptionBudget" -}}
+{{- $root := .root -}}
+{{- with required "element-io.ess-library.workloads.podDisruptionBudget missing context" .context -}}
+{{- $nameSuffix := required "element-io.ess-library.workloads.podDisruptionBudget missing context.nameSuffix" .nameSuffix -}}
+{{- $name := .name | default $nameSuffix -}}
+{{- $labelsName := .labelsName | default $nameSuffix -}}
+{{- with required "element-io.ess-library.workloads.podDisruptionBudget missing context.componentValues" .componentValues -}}
+{{- if dig "podDisruptionBudget" "enabled" false . }}
+apiVersion: policy/v1
+kind: PodDisruptionBudget
+metadata:
+  labels:
+    {{- include (printf "element-io.%s.labels" $labelsName) (dict "root" $root "context" .) | nindent 4 }}
+  name: {{ $root.Release.Name }}-{{ $name }}
+  namespace: {{ $root.Release.Namespace }}
+spec:
+  selector:
+    matchLabels:
+      app.kubernetes.io/instance: {{ $root.Release.Name }}-{{ $nameSuffix }}
+{{- with .podDisruptionBudget }}
+{{- if and (not (kindIs "invalid" .minAvailable)) (not (kindIs "invalid" .maxUnavailable)) }}
+{{- fail (printf "The PodDisruptionBudget for %s sets both minAvailable and maxUnavailable. Only one can be set" $name) }}
+{{- else if not (kindIs "invalid" .minAvailable) }}
+  minAvailable: {{ .minAvailable }}
+{{- else if not (kindIs "invalid" .maxUnavailable) }}
+  maxUnavailable: {{ .maxUnavailable }}
+{{- else }}
+  maxUnavailable: 1
+{{- end }}
+{{- end }}
+  # Pods that aren't yet healthy can always be evicted, so that they don't block Node drains
+  unhealthyPodEvictionPolicy: AlwaysAllow
+{{- end }}
+{{- end }}
+{{- end }}
+{{- end }}
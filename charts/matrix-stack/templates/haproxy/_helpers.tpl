@@ -25,6 +25,43 @@ placeholder: Ensure there's something after haproxy.cfg for https://github.com/e
 {{- end -}}
 {{- end -}}
 
+{{- /*
+The HAProxy global tuning, as JSON, with threads derived from the CPU limit if not set.
+*/ -}}
+{{- define "element-io.haproxy.tuning" -}}
+{{- $root := .root -}}
+{{- with required "element-io.haproxy.tuning missing context" .context -}}
+{{- $tuning := dict "threads" .threads -}}
+{{- if kindIs "invalid" $tuning.threads -}}
+{{- with include "element-io.ess-library.pods.cpuLimitsCores" (dict "root" $root "context" (dict "resources" .resources)) -}}
+{{- $_ := set $tuning "threads" (. | int64) -}}
+{{- end -}}
+{{- end -}}
+{{- $tuning | toJson -}}
+{{- end -}}
+{{- end -}}
+
+{{- define "element-io.haproxy.validations" }}
+{{- $root := .root -}}
+{{- with required "element-io.haproxy.validations missing context" .context -}}
+{{- $haproxy := . -}}
+{{- $messages := list -}}
+{{- if .cache.enabled -}}
+{{- with include "element-io.ess-library.pods.memoryLimitsMB" (dict "root" $root "context" (dict "resources" $haproxy.resources)) -}}
+{{- if ge ($haproxy.cache.totalMaxSizeMB | int64) (. | int64) -}}
+{{- $messages = append $messages (printf "haproxy.cache.totalMaxSizeMB (%d) must be less than haproxy.resources.limits.memory (%dMB)" ($haproxy.cache.totalMaxSizeMB | int64) (. | int64)) -}}
+{{- end -}}
+{{- end -}}
+{{- with .cache.maxObjectSizeBytes -}}
+{{- if ge (mul (. | int64) 2) (mul ($haproxy.cache.totalMaxSizeMB | int64) 1024 1024) -}}
+{{- $messages = append $messages "haproxy.cache.maxObjectSizeBytes must be less than half of haproxy.cache.totalMaxSizeMB" -}}
+{{- end -}}
+{{- end -}}
+{{- end -}}
+{{ $messages | toJson }}
+{{- end }}
+{{- end }}
+
 {{- define "element-io.haproxy.overrideEnv" }}
 env: []
 {{- end -}}
@@ -15,6 +15,12 @@ SPDX-License-Identifier: AGPL-3.0-only
 {{- if and (not $root.Values.postgres.enabled) (not .postgres) -}}
 {{ $messages = append $messages "matrixAuthenticationService.postgres is required when matrixAuthenticationService.enabled=true but postgres.enabled=false" }}
 {{- end }}
+{{- if and .synapseViaHAProxy.enabled (not $root.Values.synapse.enabled) -}}
+{{ $messages = append $messages "matrixAuthenticationService.synapseViaHAProxy.enabled=true requires synapse.enabled=true" }}
+{{- end }}
+{{- if gt (.databasePool.minConnections | int) (.databasePool.maxConnections | int) -}}
+{{ $messages = append $messages (printf "matrixAuthenticationService.databasePool.minConnections (%d) must not be greater than its maxConnections (%d)" (.databasePool.minConnections | int) (.databasePool.maxConnections | int)) }}
+{{- end }}
 {{ $messages | toJson }}
 {{- end }}
 {{- end }}
@@ -257,6 +263,15 @@ mas-config-overrides.yaml: |
 {{- end -}}
 {{- end -}}
 
+{{- define "element-io.matrix-authentication-service.synapseViaHAProxy" -}}
+{{- $root := .root -}}
+{{- with $root.Values.matrixAuthenticationService -}}
+{{- if and .enabled .synapseViaHAProxy.enabled $root.Values.synapse.enabled -}}
+true
+{{- end -}}
+{{- end -}}
+{{- end -}}
+
 {{- define "element-io.matrix-authentication-service.readyToHandleAuth" -}}
 {{- $root := .root -}}
 {{- /*
@@ -12,6 +12,40 @@ SPDX-License-Identifier: AGPL-3.0-only
 {{- if not .ingress.host -}}
 {{ $messages = append $messages "matrixRTC.ingress.host is required when matrixRTC.enabled=true" }}
 {{- end }}
+{{- with .sfu }}
+{{- $expectedParticipants := .expectedParticipants | int }}
+{{- with .exposedServices.rtcUdp }}
+{{- if and $root.Values.matrixRTC.sfu.enabled .enabled }}
+{{- $portRangeSize := add (sub (.portRange.endPort | int) (.portRange.startPort | int)) 1 }}
+{{- if lt $portRangeSize 1 -}}
+{{ $messages = append $messages "matrixRTC.sfu.exposedServices.rtcUdp.portRange.endPort must not be less than its startPort" }}
+{{- else if $expectedParticipants }}
+{{- $minimumPortRangeSize := mul $expectedParticipants 2 }}
+{{- if lt $portRangeSize $minimumPortRangeSize -}}
+{{ $messages = append $messages (printf "matrixRTC.sfu.exposedServices.rtcUdp.portRange has %d ports but %d expected participants need at least %d, widen the port range or reduce matrixRTC.sfu.expectedParticipants" $portRangeSize $expectedParticipants $minimumPortRangeSize) }}
+{{- end }}
+{{- end }}
+{{- end }}
+{{- end }}
+{{- if and .enabled .udpBuffers.enabled (not .hostNetwork) -}}
+{{ $messages = append $messages "matrixRTC.sfu.udpBuffers.enabled=true requires matrixRTC.sfu.hostNetwork=true as the UDP buffer sysctls can only be set from the node's network namespace" }}
+{{- end }}
+{{- if and .enabled (gt (.replicas | int) 1) }}
+{{- if not (include "element-io.matrix-rtc-sfu.redisAddress" (dict "root" $root)) -}}
+{{ $messages = append $messages "matrixRTC.sfu.replicas > 1 requires matrixRTC.sfu.redis.address. Synapse's Redis can't be used as it evicts keys when full" }}
+{{- end }}
+{{- if .manualIP -}}
+{{ $messages = append $messages "matrixRTC.sfu.replicas > 1 can't be used with matrixRTC.sfu.manualIP as every replica would advertise the same IP" }}
+{{- end }}
+{{- if not .hostNetwork }}
+{{- range $name, $exposedService := .exposedServices }}
+{{- if and $exposedService.enabled (ne $exposedService.portType "HostPort") -}}
+{{ $messages = append $messages (printf "matrixRTC.sfu.replicas > 1 requires matrixRTC.sfu.hostNetwork=true or matrixRTC.sfu.exposedServices.%s.portType=HostPort" $name) }}
+{{- end }}
+{{- end }}
+{{- end }}
+{{- end }}
+{{- end }}
 {{ $messages | toJson }}
 {{- end }}
 {{- end }}
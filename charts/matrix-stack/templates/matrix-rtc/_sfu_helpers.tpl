@@ -27,6 +27,15 @@ app.kubernetes.io/version: {{ include "element-io.ess-library.labels.makeSafe" .
 {{- end }}
 {{- end }}
 
+{{- define "element-io.matrix-rtc-sfu.redisAddress" -}}
+{{- $root := .root -}}
+{{- with $root.Values.matrixRTC.sfu.redis -}}
+{{- with .address -}}
+{{ tpl . $root }}
+{{- end -}}
+{{- end -}}
+{{- end -}}
+
 {{- define "element-io.matrix-rtc-sfu.overrideEnv" }}
 env: []
 {{- end -}}
@@ -25,6 +25,38 @@ SPDX-License-Identifier: AGPL-3.0-only
     {{- end }}
   {{- end }}
 {{- end -}}
+{{- if (include "element-io.postgres-pgbouncer.enabled" (dict "root" $root)) }}
+{{- $poolsSize := 0 }}
+{{- range $key := include "element-io.postgres-pgbouncer.databases" (dict "root" $root) | fromJsonArray }}
+{{- $poolsSize = add $poolsSize (include "element-io.postgres-pgbouncer.poolSize" (dict "root" $root "context" $key)) }}
+{{- end }}
+{{- $availableConnections := include "element-io.postgres.availableConnections" (dict "root" $root "context" $root.Values.postgres) | int64 }}
+{{- if gt $poolsSize $availableConnections -}}
+{{ $messages = append $messages (printf "postgres.pgbouncer pools need %d Postgres connections but Postgres only allows %d after its reserved connections, reduce the pool sizes or increase postgres.resources.limits.memory" $poolsSize $availableConnections) }}
+{{- end }}
+{{- end }}
+{{- if (include "element-io.postgres.enabled" (dict "root" $root)) }}
+{{- $clientConnections := 0 }}
+{{- range $key := include "element-io.postgres-pgbouncer.databases" (dict "root" $root) | fromJsonArray }}
+{{- $clientConnections = add $clientConnections (include "element-io.postgres.clientConnections" (dict "root" $root "context" $key)) }}
+{{- end }}
+{{- if (include "element-io.postgres-pgbouncer.enabled" (dict "root" $root)) }}
+{{- if gt $clientConnections ($root.Values.postgres.pgbouncer.maxClientConnections | int64) -}}
+{{ $messages = append $messages (printf "Database pools need up to %d connections but postgres.pgbouncer.maxClientConnections is %d, reduce the Synapse databasePool cpMax values, matrixAuthenticationService.databasePool.maxConnections or replicas or increase postgres.pgbouncer.maxClientConnections" $clientConnections ($root.Values.postgres.pgbouncer.maxClientConnections | int64)) }}
+{{- end }}
+{{- if has "matrixAuthenticationService" (include "element-io.postgres-pgbouncer.databases" (dict "root" $root) | fromJsonArray) }}
+{{- $masConnections := include "element-io.postgres.clientConnections" (dict "root" $root "context" "matrixAuthenticationService") | int64 }}
+{{- if gt $masConnections ($root.Values.postgres.pgbouncer.matrixAuthenticationServicePoolSize | int64) -}}
+{{ $messages = append $messages (printf "Matrix Authentication Service database pools need up to %d connections but postgres.pgbouncer.matrixAuthenticationServicePoolSize is %d and uses session pooling, reduce matrixAuthenticationService.databasePool.maxConnections or replicas or increase postgres.pgbouncer.matrixAuthenticationServicePoolSize" $masConnections ($root.Values.postgres.pgbouncer.matrixAuthenticationServicePoolSize | int64)) }}
+{{- end }}
+{{- end }}
+{{- else }}
+{{- $availableConnections := include "element-io.postgres.availableConnections" (dict "root" $root "context" $root.Values.postgres) | int64 }}
+{{- if gt $clientConnections $availableConnections -}}
+{{ $messages = append $messages (printf "Database pools need up to %d connections but Postgres only allows %d after its reserved connections, reduce the Synapse databasePool cpMax values, matrixAuthenticationService.databasePool.maxConnections or replicas or increase postgres.resources.limits.memory" $clientConnections $availableConnections) }}
+{{- end }}
+{{- end }}
+{{- end }}
 {{ $messages | toJson }}
 {{- end }}
 {{- end }}
@@ -53,6 +85,90 @@ true
 {{- end }}
 {{- end }}
 
+{{- define "element-io.postgres-pgbouncer.labels" -}}
+{{- $root := .root -}}
+{{- with required "element-io.postgres-pgbouncer.labels missing context" .context -}}
+{{ include "element-io.ess-library.labels.common" (dict "root" $root "context" (dict "labels" .labels "withChartVersion" .withChartVersion)) }}
+app.kubernetes.io/component: matrix-stack-db-pooler
+app.kubernetes.io/name: postgres-pgbouncer
+app.kubernetes.io/instance: {{ $root.Release.Name }}-postgres-pgbouncer
+app.kubernetes.io/version: {{ include "element-io.ess-library.labels.makeSafe" .image.tag }}
+{{- end }}
+{{- end }}
+
+{{- define "element-io.postgres-pgbouncer.enabled" }}
+{{- $root := .root -}}
+{{- if and (include "element-io.postgres.enabled" (dict "root" $root)) $root.Values.postgres.pgbouncer.enabled -}}
+true
+{{- end }}
+{{- end }}
+
+{{- define "element-io.postgres-pgbouncer.databases" -}}
+{{- $root := .root -}}
+{{- $databases := list -}}
+{{- range $key := ($root.Values.postgres.essPasswords | keys | uniq | sortAlpha) -}}
+{{- $component := index $root.Values $key -}}
+{{- if and $component.enabled (not $component.postgres) -}}
+{{- $databases = append $databases $key -}}
+{{- end -}}
+{{- end -}}
+{{ $databases | toJson }}
+{{- end -}}
+
+{{- define "element-io.postgres-pgbouncer.poolSize" -}}
+{{- $root := .root -}}
+{{- with required "element-io.postgres-pgbouncer.poolSize missing context" .context -}}
+{{- if eq . "synapse" -}}
+{{- /* Each of Synapse's connections holds on to a server connection with session pooling */}}
+{{- if eq (include "element-io.postgres-pgbouncer.poolMode" (dict "root" $root "context" .)) "session" -}}
+{{ include "element-io.synapse.databaseConnections" (dict "root" $root) }}
+{{- else -}}
+{{ mul $root.Values.postgres.pgbouncer.synapsePoolSizePerProcess (include "element-io.synapse.processCount" (dict "root" $root)) }}
+{{- end -}}
+{{- else if eq . "matrixAuthenticationService" -}}
+{{ $root.Values.postgres.pgbouncer.matrixAuthenticationServicePoolSize }}
+{{- else -}}
+{{- fail (printf "No PgBouncer pool size for %s" .) -}}
+{{- end -}}
+{{- end -}}
+{{- end -}}
+
+{{- define "element-io.postgres.clientConnections" -}}
+{{- $root := .root -}}
+{{- with required "element-io.postgres.clientConnections missing context" .context -}}
+{{- if eq . "synapse" -}}
+{{ include "element-io.synapse.databaseConnections" (dict "root" $root) }}
+{{- else if eq . "matrixAuthenticationService" -}}
+{{ mul $root.Values.matrixAuthenticationService.databasePool.maxConnections $root.Values.matrixAuthenticationService.replicas }}
+{{- else -}}
+{{- fail (printf "No database connections for %s" .) -}}
+{{- end -}}
+{{- end -}}
+{{- end -}}
+
+{{- define "element-io.postgres-pgbouncer.poolMode" -}}
+{{- $root := .root -}}
+{{- with required "element-io.postgres-pgbouncer.poolMode missing context" .context -}}
+{{- if eq . "matrixAuthenticationService" -}}
+session
+{{- else -}}
+{{ $root.Values.postgres.pgbouncer.poolMode }}
+{{- end -}}
+{{- end -}}
+{{- end -}}
+
+{{- define "element-io.postgres-pgbouncer.configmap-data" -}}
+{{- $root := .root -}}
+{{- with required "element-io.postgres-pgbouncer.configmap-data missing context" .context -}}
+pgbouncer.ini: |
+{{- (tpl ($root.Files.Get "configs/postgres/pgbouncer.ini.tpl") (dict "root" $root "context" .)) | nindent 2 }}
+pg_hba.conf: |
+{{- (tpl ($root.Files.Get "configs/postgres/pgbouncer-hba.conf.tpl") (dict "root" $root "context" .)) | nindent 2 }}
+write-userlist.sh: |
+{{- (tpl ($root.Files.Get "configs/postgres/pgbouncer-userlist.sh.tpl") (dict "root" $root "context" .)) | nindent 2 }}
+{{- end }}
+{{- end }}
+
 {{- define "element-io.postgres.anyEssPasswordHasValue" }}
 {{- $root := .root -}}
 {{- with required "element-io.postgres.anyEssPasswordHasValue missing context" .context -}}
@@ -89,16 +205,8 @@ true
 {{- define "element-io.postgres.memoryLimitsMB" -}}
 {{- $root := .root -}}
 {{- with required "element-io.postgres.memoryLimitsMB missing context" .context -}}
-  {{- $value := .resources.limits.memory }}
-  {{- if  $value | hasSuffix "Mi" }}
-    {{- printf "%d" (trimSuffix "Mi" $value) | int64 -}}
-  {{- else if  $value | hasSuffix "Gi" }}
-    {{- printf "%d" (mul (int64 (trimSuffix "Gi" $value)) 1024) | int64 -}}
-  {{- else if  $value | hasSuffix "Ti" }}
-    {{- printf "%d" (mul (mul (int64 (trimSuffix "Ti" $value)) 1024) 1024) | int64 -}}
-  {{- else -}}
-    {{- fail (printf "Could not compute Postgres memory limits from %s" $value) -}}
-  {{- end -}}
+{{- $value := .resources.limits.memory | required "postgres.resources.limits.memory is required to size Postgres" -}}
+{{- include "element-io.ess-library.pods.memoryLimitsMB" (dict "root" $root "context" (dict "resources" .resources)) | required (printf "Could not compute Postgres memory limits from %v" $value) -}}
 {{- end -}}
 {{- end -}}
 
@@ -106,13 +214,88 @@ true
 {{- define "element-io.postgres.args" -}}
 {{- $root := .root -}}
 {{- with required "element-io.postgres.args missing context" .context -}}
-{{- $memoryLimitsMB := include "element-io.postgres.memoryLimitsMB" (dict "root" $root "context" .) }}
+{{- range $setting := include "element-io.postgres.settings" (dict "root" $root "context" .) | fromJsonArray }}
 - "-c"
-- "max_connections={{ printf "%d" (div $memoryLimitsMB 16) }}"
-- "-c"
-- "shared_buffers={{ printf "%s" (printf "%dMB" (div $memoryLimitsMB 4)) }}"
-- "-c"
-- "effective_cache_size={{ printf "%s" (printf "%dMB" (sub $memoryLimitsMB 256)) }}"
+- {{ $setting | quote }}
+{{- end }}
+{{- end -}}
+{{- end -}}
+
+{{- define "element-io.postgres.maxConnections" -}}
+{{- $root := .root -}}
+{{- with required "element-io.postgres.maxConnections missing context" .context -}}
+{{ div (include "element-io.postgres.memoryLimitsMB" (dict "root" $root "context" .) | int64) 16 }}
+{{- end -}}
+{{- end -}}
+
+{{- /*
+The Postgres connections available to the Synapse and Matrix Authentication Service database pools.
+This leaves out the superuser_reserved_connections, 3 by default, and the postgres-exporter's connection.
+*/ -}}
+{{- define "element-io.postgres.availableConnections" -}}
+{{- $root := .root -}}
+{{- with required "element-io.postgres.availableConnections missing context" .context -}}
+{{ sub (include "element-io.postgres.maxConnections" (dict "root" $root "context" .) | int64) 4 }}
+{{- end -}}
+{{- end -}}
+
+{{- /*
+The Postgres settings for the chosen tuning profile, as a JSON list of name=value.
+Everything is sized from the memory limit, max_connections is the same in every profile
+as it is what the PgBouncer pools are validated against.
+*/}}
+{{- define "element-io.postgres.settings" -}}
+{{- $root := .root -}}
+{{- with required "element-io.postgres.settings missing context" .context -}}
+{{- $memoryLimitsMB := include "element-io.postgres.memoryLimitsMB" (dict "root" $root "context" .) | int64 -}}
+{{- $maxConnections := include "element-io.postgres.maxConnections" (dict "root" $root "context" .) | int64 -}}
+{{- $profile := .tuningProfile | default "default" -}}
+{{- if eq $profile "default" -}}
+{{- list (printf "max_connections=%d" $maxConnections)
+         (printf "shared_buffers=%dMB" (div $memoryLimitsMB 4))
+         (printf "effective_cache_size=%dMB" (sub $memoryLimitsMB 256)) | toJson -}}
+{{- else -}}
+{{- $profiles := dict
+  "small" (dict "sharedBuffersDivisor" 8 "effectiveCachePercent" 50 "workMemDivisor" 3
+                "maintenanceWorkMemDivisor" 32 "effectiveIOConcurrency" 100 "maxWalSize" "1GB")
+  "synapse-heavy" (dict "sharedBuffersDivisor" 4 "effectiveCachePercent" 75 "workMemDivisor" 3
+                        "maintenanceWorkMemDivisor" 16 "effectiveIOConcurrency" 200 "maxWalSize" "4GB"
+                        "autovacuumCostLimit" 1000 "autovacuumMaxWorkers" 4)
+  "large" (dict "sharedBuffersDivisor" 4 "effectiveCachePercent" 75 "workMemDivisor" 2
+                "maintenanceWorkMemDivisor" 16 "effectiveIOConcurrency" 200 "maxWalSize" "8GB"
+                "autovacuumCostLimit" 2000 "autovacuumMaxWorkers" 6)
+-}}
+{{- $tuning := get $profiles $profile -}}
+{{- $sharedBuffersMB := div $memoryLimitsMB $tuning.sharedBuffersDivisor -}}
+{{- $workMemMB := max 1 (div (sub $memoryLimitsMB $sharedBuffersMB) (mul (max 1 $maxConnections) $tuning.workMemDivisor)) -}}
+{{- $settings := list
+  (printf "max_connections=%d" $maxConnections)
+  (printf "shared_buffers=%dMB" $sharedBuffersMB)
+  (printf "effective_cache_size=%dMB" (div (mul $memoryLimitsMB $tuning.effectiveCachePercent) 100))
+  (printf "work_mem=%dMB" $workMemMB)
+  (printf "maintenance_work_mem=%dMB" (min 2048 (max 16 (div $memoryLimitsMB $tuning.maintenanceWorkMemDivisor))))
+-}}
+{{- if eq $profile "small" -}}
+{{- $settings = append $settings "wal_buffers=-1" -}}
+{{- else -}}
+{{- $settings = append $settings (printf "wal_buffers=%dMB" (min 64 (max 1 (div $sharedBuffersMB 32)))) -}}
+{{- end -}}
+{{- $settings = concat $settings (list
+  "checkpoint_completion_target=0.9"
+  "random_page_cost=1.1"
+  (printf "effective_io_concurrency=%d" (int64 $tuning.effectiveIOConcurrency))
+  (printf "max_wal_size=%s" $tuning.maxWalSize)
+) -}}
+{{- with $tuning.autovacuumMaxWorkers -}}
+{{- $settings = concat $settings (list
+  (printf "autovacuum_max_workers=%d" (int64 .))
+  "autovacuum_vacuum_scale_factor=0.02"
+  "autovacuum_analyze_scale_factor=0.01"
+  (printf "autovacuum_vacuum_cost_limit=%d" (int64 $tuning.autovacuumCostLimit))
+) -}}
+{{- end -}}
+{{- $settings | toJson -}}
+{{- end -}}
 {{- end -}}
 {{- end -}}
 
@@ -167,6 +350,14 @@ env:
 {{- end -}}
 {{- end -}}
 
+{{- define "element-io.postgres-pgbouncer.overrideEnv" }}
+env: []
+{{- end -}}
+
+{{- define "element-io.postgres-pgbouncer-exporter.overrideEnv" }}
+env: []
+{{- end -}}
+
 {{- define "element-io.postgres-exporter.overrideEnv" }}
 {{- $root := .root -}}
 {{- with required "element-io.postgres-exporter.overrideEnv missing context" .context -}}
@@ -18,6 +18,61 @@ SPDX-License-Identifier: AGPL-3.0-only
 {{- if and (not $root.Values.postgres.enabled) (not .postgres) -}}
 {{ $messages = append $messages "synapse.postgres is required when synapse.enabled=true but postgres.enabled=false" }}
 {{- end }}
+{{- with .media.s3 }}
+{{- if .enabled }}
+{{- if not .bucket -}}
+{{ $messages = append $messages "synapse.media.s3.bucket is required when synapse.media.s3.enabled=true" }}
+{{- end }}
+{{- if and .accessKeyId (not .secretAccessKey) -}}
+{{ $messages = append $messages "synapse.media.s3.secretAccessKey is required when synapse.media.s3.accessKeyId is set" }}
+{{- end }}
+{{- if and .asynchronousUploads (not .localCache.persistent) -}}
+{{ $messages = append $messages "synapse.media.s3.asynchronousUploads requires synapse.media.s3.localCache.persistent=true so that media isn't lost before it is uploaded" }}
+{{- end }}
+{{- end }}
+{{- end }}
+{{- with index ((include "element-io.synapse.enabledWorkers" (dict "root" $root)) | fromJson) "media-repository" }}
+{{- if ge ($root.Values.synapse.media.backgroundJobsReplica | int) (.replicas | int) -}}
+{{ $messages = append $messages "synapse.media.backgroundJobsReplica must be less than synapse.workers.media-repository.replicas" }}
+{{- end }}
+{{- end }}
+{{- range $workerType, $workerDetails := (include "element-io.synapse.enabledWorkers" (dict "root" $root)) | fromJson }}
+{{- with $workerDetails.autoscaling }}
+{{- if .enabled }}
+{{- if gt (.minReplicas | int) (.maxReplicas | int) -}}
+{{ $messages = append $messages (printf "synapse.workers.%s.autoscaling.minReplicas must not be greater than synapse.workers.%s.autoscaling.maxReplicas" $workerType $workerType) }}
+{{- end }}
+{{- if gt (.maxReplicas | int) 20 -}}
+{{ $messages = append $messages (printf "synapse.workers.%s.autoscaling.maxReplicas must not be greater than 20, the number of servers HAProxy has for each worker type" $workerType) }}
+{{- end }}
+{{- end }}
+{{- end }}
+{{- end }}
+{{- range $processType := concat (list "main") (keys ((include "element-io.synapse.enabledWorkers" (dict "root" $root)) | fromJson) | sortAlpha) }}
+{{- with (include "element-io.synapse.process.databasePool" (dict "root" $root "context" $processType) | fromJson) }}
+{{- if gt (.cpMin | int) (.cpMax | int) -}}
+{{ $messages = append $messages (printf "Synapse %s database pool cpMin (%d) must not be greater than its cpMax (%d)" $processType (.cpMin | int) (.cpMax | int)) }}
+{{- end }}
+{{- end }}
+{{- end }}
+{{- range $processType := concat (list "main") (keys ((include "element-io.synapse.enabledWorkers" (dict "root" $root)) | fromJson) | sortAlpha) }}
+{{- with (include "element-io.synapse.process.caches" (dict "root" $root "context" (dict "processType" $processType)) | fromJson).cache_autotuning }}
+{{- if not (lt (trimSuffix "M" .target_cache_memory_usage | int64) (trimSuffix "M" .max_cache_memory_usage | int64)) -}}
+{{ $messages = append $messages (printf "Synapse %s cache autotuning target memory usage (%s) must be below its max memory usage (%s)" $processType .target_cache_memory_usage .max_cache_memory_usage) }}
+{{- end }}
+{{- end }}
+{{- end }}
+{{- if (include "element-io.synapse.enabledWorkers" (dict "root" $root)) | fromJson }}
+{{- $redisTuning := include "element-io.synapse-redis.tuning" (dict "root" $root "context" .redis) | fromJson }}
+{{- with $redisTuning.memoryLimitsMB }}
+{{- if ge (add ($redisTuning.maxMemoryMB | int64) ($redisTuning.pubsubHardLimitMB | int64)) (. | int64) -}}
+{{ $messages = append $messages (printf "synapse.redis.maxMemoryMB (%d) and synapse.redis.pubsubClientOutputBufferLimit.hardLimitMB (%d) must fit within synapse.redis.resources.limits.memory (%dMi)" ($redisTuning.maxMemoryMB | int64) ($redisTuning.pubsubHardLimitMB | int64) (. | int64)) }}
+{{- end }}
+{{- end }}
+{{- if and (gt ($redisTuning.pubsubHardLimitMB | int64) 0) (gt ($redisTuning.pubsubSoftLimitMB | int64) ($redisTuning.pubsubHardLimitMB | int64)) -}}
+{{ $messages = append $messages "synapse.redis.pubsubClientOutputBufferLimit.softLimitMB must not be greater than synapse.redis.pubsubClientOutputBufferLimit.hardLimitMB" }}
+{{- end }}
+{{- end }}
 {{ $messages | toJson }}
 {{- end }}
 {{- end }}
@@ -101,6 +156,33 @@ env: []
 {{ $enabledWorkers | toJson }}
 {{- end }}
 
+{{- define "element-io.synapse.processCount" -}}
+{{- $root := .root -}}
+{{- $processCount := 1 -}}
+{{- range $workerType, $workerDetails := (include "element-io.synapse.enabledWorkers" (dict "root" $root)) | fromJson }}
+{{- if dig "autoscaling" "enabled" false $workerDetails }}
+{{- $processCount = add $processCount $workerDetails.autoscaling.maxReplicas }}
+{{- else }}
+{{- $processCount = add $processCount ($workerDetails.replicas | default 1) }}
+{{- end }}
+{{- end }}
+{{- $processCount -}}
+{{- end }}
+
+{{- define "element-io.synapse.databaseConnections" -}}
+{{- $root := .root -}}
+{{- $connections := (include "element-io.synapse.process.databasePool" (dict "root" $root "context" "main") | fromJson).cpMax | int -}}
+{{- range $workerType, $workerDetails := (include "element-io.synapse.enabledWorkers" (dict "root" $root)) | fromJson }}
+{{- $replicas := $workerDetails.replicas | default 1 -}}
+{{- if dig "autoscaling" "enabled" false $workerDetails }}
+{{- $replicas = $workerDetails.autoscaling.maxReplicas -}}
+{{- end }}
+{{- $cpMax := (include "element-io.synapse.process.databasePool" (dict "root" $root "context" $workerType) | fromJson).cpMax -}}
+{{- $connections = add $connections (mul $cpMax $replicas) -}}
+{{- end }}
+{{- $connections -}}
+{{- end }}
+
 {{- define "element-io.synapse.pvcName" -}}
 {{- $root := .root -}}
 {{- with required "element-io.synapse.pvcName missing context" .context -}}
@@ -116,8 +198,14 @@ env: []
 {{- $root := .root -}}
 {{- with required "element-io.synapse-python.overrideEnv missing context" .context -}}
 env:
+{{- if .jemalloc.enabled }}
 - name: "LD_PRELOAD"
   value: "libjemalloc.so.2"
+{{- with .jemalloc.mallocConf }}
+- name: "MALLOC_CONF"
+  value: {{ . | quote }}
+{{- end }}
+{{- end }}
 {{- end -}}
 {{- end -}}
 
@@ -176,6 +264,27 @@ env:
 - name: APPLICATION_NAME
   value: >-
     {{ printf "{{ hostname }}" }}
+{{- if $root.Values.synapse.media.s3.enabled }}
+{{- range $credential, $envName := dict "accessKeyId" "SYNAPSE_S3_ACCESS_KEY_ID" "secretAccessKey" "SYNAPSE_S3_SECRET_ACCESS_KEY" }}
+{{- if index $root.Values.synapse.media.s3 $credential }}
+- name: {{ $envName }}
+  value: >-
+    {{
+      printf "{{ readfile \"/secrets/%s\" | quote }}"
+        (
+          include "element-io.ess-library.provided-secret-path" (
+            dict "root" $root
+            "context" (dict
+              "secretPath" (printf "synapse.media.s3.%s" $credential)
+              "defaultSecretName" (include "element-io.synapse.secret-name" (dict "root" $root "context" (dict "isHook" $isHook)))
+              "defaultSecretKey" (trimPrefix "SYNAPSE_" $envName)
+            )
+          )
+        )
+    }}
+{{- end }}
+{{- end }}
+{{- end }}
 {{- end }}
 {{- end }}
 
@@ -207,18 +316,101 @@ env:
 {{- range $workerType, $workerDetails := (include "element-io.synapse.enabledWorkers" (dict "root" $root)) | fromJson }}
 05-{{ $workerType }}.yaml: |
 {{- (tpl ($root.Files.Get "configs/synapse/synapse-05-process-specific.yaml.tpl") (dict "root" $root "context" (dict "processType" $workerType))) | nindent 2 }}
+log_config-{{ $workerType }}.yaml: |
+{{- (tpl ($root.Files.Get "configs/synapse/synapse-log-config.yaml.tpl") (dict "root" $root "context" (dict "processType" $workerType))) | nindent 2 }}
 {{- end }}
 {{- end }}
 log_config.yaml: |
-{{- (tpl ($root.Files.Get "configs/synapse/synapse-log-config.yaml.tpl") (dict "root" $root)) | nindent 2 }}
+{{- (tpl ($root.Files.Get "configs/synapse/synapse-log-config.yaml.tpl") (dict "root" $root "context" (dict "processType" "main"))) | nindent 2 }}
 {{- end }}
 {{- end }}
 
 
+{{- /*
+The caches section of a Synapse process's config, as JSON.
+The worker's caches settings are merged over the global ones key by key so that they can also turn things off.
+*/ -}}
+{{- define "element-io.synapse.process.caches" -}}
+{{- $root := .root -}}
+{{- with required "element-io.synapse.process.caches missing context" .context -}}
+{{- $processType := required "element-io.synapse.process.caches missing context.processType" .processType -}}
+{{- $cachesValues := $root.Values.synapse.caches | deepCopy -}}
+{{- $resources := $root.Values.synapse.resources | deepCopy -}}
+{{- if ne $processType "main" -}}
+{{- $workerDetails := get ((include "element-io.synapse.enabledWorkers" (dict "root" $root)) | fromJson) $processType -}}
+{{- with $workerDetails.resources -}}
+{{- $resources = mustMergeOverwrite $resources (. | deepCopy) -}}
+{{- end -}}
+{{- range $key, $value := ($workerDetails.caches | default dict) -}}
+{{- if and (kindIs "map" $value) (kindIs "map" (get $cachesValues $key)) -}}
+{{- range $subKey, $subValue := $value -}}
+{{- $_ := set (get $cachesValues $key) $subKey $subValue -}}
+{{- end -}}
+{{- else -}}
+{{- $_ := set $cachesValues $key $value -}}
+{{- end -}}
+{{- end -}}
+{{- end -}}
+{{- $caches := dict "expire_caches" $cachesValues.expireCaches "cache_entry_ttl" $cachesValues.cacheEntryTtl -}}
+{{- if not (kindIs "invalid" $cachesValues.globalFactor) -}}
+{{- $_ := set $caches "global_factor" $cachesValues.globalFactor -}}
+{{- end -}}
+{{- with $cachesValues.perCacheFactors -}}
+{{- $_ := set $caches "per_cache_factors" . -}}
+{{- end -}}
+{{- with $cachesValues.autotuning -}}
+{{- if .enabled -}}
+{{- with include "element-io.ess-library.pods.memoryLimitsMB" (dict "root" $root "context" (dict "resources" $resources)) -}}
+{{- $memoryLimitsMB := . | int64 -}}
+{{- $_ := set $caches "cache_autotuning" (dict
+  "max_cache_memory_usage" (printf "%dM" (div (mul $memoryLimitsMB ($cachesValues.autotuning.maxCacheMemoryUsagePercent | int64)) 100))
+  "target_cache_memory_usage" (printf "%dM" (div (mul $memoryLimitsMB ($cachesValues.autotuning.targetCacheMemoryUsagePercent | int64)) 100))
+  "min_cache_ttl" $cachesValues.autotuning.minCacheTtl
+) -}}
+{{- end -}}
+{{- end -}}
+{{- end -}}
+{{- $caches | toJson -}}
+{{- end -}}
+{{- end -}}
+
 {{- define "element-io.synapse-redis.configmap-data" -}}
 {{- $root := .root -}}
 redis.conf: |
-{{- ($root.Files.Get "configs/synapse/redis.conf") | nindent 2 -}}
+{{- (tpl ($root.Files.Get "configs/synapse/redis.conf.tpl") (dict "root" $root "context" $root.Values.synapse.redis)) | nindent 2 -}}
+{{- end -}}
+
+{{- /*
+The Redis memory settings in MiB, as JSON, with those not set in the values derived from the memory limit.
+Without a memory limit Redis can grow without bound and the pubsub limits fall back to the Redis defaults.
+*/ -}}
+{{- define "element-io.synapse-redis.tuning" -}}
+{{- $root := .root -}}
+{{- with required "element-io.synapse-redis.tuning missing context" .context -}}
+{{- $memoryLimitsMB := include "element-io.ess-library.pods.memoryLimitsMB" (dict "root" $root "context" (dict "resources" .resources)) -}}
+{{- $tuning := dict "maxMemoryMB" .maxMemoryMB "pubsubHardLimitMB" .pubsubClientOutputBufferLimit.hardLimitMB "pubsubSoftLimitMB" .pubsubClientOutputBufferLimit.softLimitMB -}}
+{{- if $memoryLimitsMB -}}
+{{- $memoryLimitsMB = $memoryLimitsMB | int64 -}}
+{{- $_ := set $tuning "memoryLimitsMB" $memoryLimitsMB -}}
+{{- if kindIs "invalid" $tuning.maxMemoryMB -}}
+{{- $_ := set $tuning "maxMemoryMB" (div $memoryLimitsMB 2) -}}
+{{- end -}}
+{{- if kindIs "invalid" $tuning.pubsubHardLimitMB -}}
+{{- $_ := set $tuning "pubsubHardLimitMB" (div $memoryLimitsMB 4) -}}
+{{- end -}}
+{{- if kindIs "invalid" $tuning.pubsubSoftLimitMB -}}
+{{- $_ := set $tuning "pubsubSoftLimitMB" (div $memoryLimitsMB 8) -}}
+{{- end -}}
+{{- else -}}
+{{- if kindIs "invalid" $tuning.pubsubHardLimitMB -}}
+{{- $_ := set $tuning "pubsubHardLimitMB" 32 -}}
+{{- end -}}
+{{- if kindIs "invalid" $tuning.pubsubSoftLimitMB -}}
+{{- $_ := set $tuning "pubsubSoftLimitMB" 8 -}}
+{{- end -}}
+{{- end -}}
+{{- $tuning | toJson -}}
+{{- end -}}
 {{- end -}}
 
 
@@ -236,6 +428,21 @@ ess-version.json: |
   {"version": "{{ $root.Chart.Version }}", "edition": "community"}
 {{- end -}}
 
+{{- define "element-io.synapse.haproxyBackendSettings" -}}
+{{- $root := .root -}}
+{{- with required "element-io.synapse.haproxyBackendSettings missing context" .context -}}
+{{- with .balance }}
+  balance {{ . }}
+{{- end }}
+{{- with .queueTimeout }}
+  timeout queue {{ . }}
+{{- end }}
+{{- if or .maxConnections .healthCheckInterval }}
+  default-server{{ with .maxConnections }} maxconn {{ . | int }}{{ end }}{{ with .healthCheckInterval }} inter {{ . }}{{ end }}
+{{- end }}
+{{- end -}}
+{{- end }}
+
 {{- define "element-io.synapse.render-config-container" -}}
 {{- $root := .root -}}
 {{- with required "element-io.synapse.render-config-container missing context" .context }}
@@ -34,6 +34,115 @@ canFallback
 {{- end -}}
 {{- end }}
 
+{{- define "element-io.synapse.process.haproxyBackend" -}}
+{{- $root := .root -}}
+{{- with required "element-io.synapse.process.haproxyBackend missing context" .context -}}
+{{- /* Anything not set here uses the defaults section of configs/haproxy/haproxy.cfg.tpl */}}
+{{- $haproxyBackend := dict -}}
+{{- if eq . "main" -}}
+{{- $haproxyBackend = dict "maxConnections" 250 -}}
+{{- else if eq . "event-creator" -}}
+{{- /* Balance on the room, so that events for a room are created by the same worker */}}
+{{- $haproxyBackend = dict "balance" "hdr(X-Matrix-Room)" -}}
+{{- else if eq . "federation-inbound" -}}
+{{- /* Balance on the source IP, so that transactions from the same origin go to the same worker.
+If an origin changes IP it isn't the end of the world if we process the same transaction twice */}}
+{{- $haproxyBackend = dict "balance" "source" -}}
+{{- else if eq . "federation-reader" -}}
+{{- /* Balance on the whole URI, so that identical (expensive) state_ids requests go to the same worker.
+Without the URI params all the requests for a given room would go to one worker, sending it into a death spiral */}}
+{{- $haproxyBackend = dict "balance" "uri whole" -}}
+{{- else if eq . "media-repository" -}}
+{{- /* Balance on the media ID, so that downloads and thumbnails of a piece of media go to the replica
+that already has it in its local media store */}}
+{{- $haproxyBackend = dict "balance" "hdr(X-Matrix-Media)" -}}
+{{- else if has . (list "initial-synchrotron" "sliding-sync" "synchrotron") -}}
+{{- /* Balance on the user, so that a client stays on the same worker and its sync can make progress
+and so that all of a user's devices share the same worker's per-user caches.
+The user is only known for access tokens issued by Synapse, so balance on the access token
+when Matrix Authentication Service issues them */}}
+{{- $balance := "hdr(X-Matrix-User)" -}}
+{{- if (include "element-io.matrix-authentication-service.readyToHandleAuth" (dict "root" $root)) -}}
+{{- $balance = "hdr(X-Access-Token)" -}}
+{{- end -}}
+{{- if eq . "initial-synchrotron" -}}
+{{- /* Limit the number of concurrent requests to each replica, to stop the reactor tick time rocketing */}}
+{{- $haproxyBackend = dict "balance" $balance "maxConnections" 50 -}}
+{{- else -}}
+{{- /* These requests are long-polled so we allow many concurrent connections, but if we do hit the limit
+it is better to shed further requests quickly than let them queue up on HAProxy */}}
+{{- $haproxyBackend = dict "balance" $balance "maxConnections" 2000 "queueTimeout" "5s" -}}
+{{- end -}}
+{{- end -}}
+{{- $processValues := dict -}}
+{{- if eq . "main" -}}
+{{- $processValues = $root.Values.synapse.haproxyBackend | default dict -}}
+{{- else -}}
+{{- $processValues = dig . "haproxyBackend" dict $root.Values.synapse.workers -}}
+{{- end -}}
+{{- range $key, $value := $processValues -}}
+{{- if not (kindIs "invalid" $value) -}}
+{{- $_ := set $haproxyBackend $key $value -}}
+{{- end -}}
+{{- end -}}
+{{ $haproxyBackend | toJson }}
+{{- end -}}
+{{- end }}
+
+{{- define "element-io.synapse.process.databasePool" -}}
+{{- $root := .root -}}
+{{- with required "element-io.synapse.process.databasePool missing context" .context -}}
+{{- /* Twisted's defaults, for workers that make a steady stream of queries */}}
+{{- $databasePool := dict "cpMin" 3 "cpMax" 5 -}}
+{{- if has . (list "main" "background" "event-persister") -}}
+{{- /* Processes that write most of the data or run long background updates */}}
+{{- $databasePool = dict "cpMin" 5 "cpMax" 10 -}}
+{{- else if has . (list "account-data" "appservice" "encryption" "presence-writer" "push-rules" "receipts" "sso-login" "typing-persister" "user-dir") -}}
+{{- /* Rarely busy workers, so that idle pools don't hold on to Postgres connections */}}
+{{- $databasePool = dict "cpMin" 1 "cpMax" 3 -}}
+{{- end -}}
+{{- $processValues := dict -}}
+{{- if eq . "main" -}}
+{{- $processValues = $root.Values.synapse.databasePool | default dict -}}
+{{- else -}}
+{{- $processValues = dig . "databasePool" dict $root.Values.synapse.workers -}}
+{{- end -}}
+{{- range $key, $value := $processValues -}}
+{{- if not (kindIs "invalid" $value) -}}
+{{- $_ := set $databasePool $key $value -}}
+{{- end -}}
+{{- end -}}
+{{ $databasePool | toJson }}
+{{- end -}}
+{{- end }}
+
+{{- define "element-io.synapse.process.gc" -}}
+{{- $root := .root -}}
+{{- with required "element-io.synapse.process.gc missing context" .context -}}
+{{- $gc := dict -}}
+{{- if has . (list "main" "client-reader" "event-persister" "initial-synchrotron" "sliding-sync" "synchrotron") -}}
+{{- /* Cache-heavy processes have many long-lived objects, so a full collection is expensive and stalls requests.
+Collect the older generations less often */}}
+{{- $gc = dict "thresholds" (list 1000 20 20) "minInterval" (list "1s" "30s" "120s") -}}
+{{- else if has . (list "event-creator" "federation-inbound" "federation-reader" "media-repository") -}}
+{{- /* Request-heavy processes mostly allocate short-lived objects, which are cleared by the younger generations */}}
+{{- $gc = dict "thresholds" (list 700 10 10) "minInterval" (list "1s" "10s" "60s") -}}
+{{- end -}}
+{{- $processValues := dict -}}
+{{- if eq . "main" -}}
+{{- $processValues = $root.Values.synapse.gc | default dict -}}
+{{- else -}}
+{{- $processValues = dig . "gc" dict $root.Values.synapse.workers -}}
+{{- end -}}
+{{- range $key, $value := $processValues -}}
+{{- if not (kindIs "invalid" $value) -}}
+{{- $_ := set $gc $key $value -}}
+{{- end -}}
+{{- end -}}
+{{ $gc | toJson }}
+{{- end -}}
+{{- end }}
+
 {{- define "element-io.synapse.process.workerTypeName" -}}
 {{- $root := .root -}}
 {{- with required "element-io.synapse.process.workerTypeName missing context" .context -}}
@@ -74,6 +183,15 @@ synapse.app.generic_worker
 {{- end -}}
 {{- end }}
 
+{{- define "element-io.synapse.media.persistentLocalStore" -}}
+{{- $root := .root -}}
+{{- with $root.Values.synapse.media -}}
+{{- if not (and .s3.enabled (not .s3.localCache.persistent)) -}}
+persistentLocalStore
+{{- end -}}
+{{- end -}}
+{{- end }}
+
 {{- define "element-io.synapse.process.responsibleForMedia" -}}
 {{- $root := .root -}}
 {{- with required "element-io.synapse.process.responsibleForMedia missing context" .context -}}
@@ -168,6 +286,14 @@ responsibleForMedia
 {{- with .signingKey.secret -}}
 {{ $configSecrets = append $configSecrets (tpl . $root) }}
 {{- end -}}
+{{- if .media.s3.enabled -}}
+{{- with (.media.s3.accessKeyId).secret -}}
+{{ $configSecrets = append $configSecrets (tpl . $root) }}
+{{- end -}}
+{{- with (.media.s3.secretAccessKey).secret -}}
+{{ $configSecrets = append $configSecrets (tpl . $root) }}
+{{- end -}}
+{{- end -}}
 {{- with .additional -}}
 {{- range $key := (. | keys | uniq | sortAlpha) -}}
 {{- $prop := index $root.Values.synapse.additional $key }}
@@ -151,7 +151,7 @@ We have an init container to render & merge the config for several reasons:
 {{- end }}
       - mountPath: /conf/log_config.yaml
         name: plain-config
-        subPath: log_config.yaml
+        subPath: {{ has $processType (list "main" "check-config") | ternary "log_config.yaml" (printf "log_config-%s.yaml" $processType) }}
         readOnly: false
       - mountPath: /media
         name: media
@@ -177,9 +177,15 @@ We have an init container to render & merge the config for several reasons:
 {{- end }}
 {{- end }}
 {{- if (include "element-io.synapse.process.responsibleForMedia" (dict "root" $root "context" (dict "processType" $processType "enabledWorkerTypes" (keys $enabledWorkers)))) }}
+{{- if include "element-io.synapse.media.persistentLocalStore" (dict "root" $root) }}
     - persistentVolumeClaim:
         claimName: {{ include "element-io.synapse.pvcName" (dict "root" $root "context" .) }}
       name: "media"
+{{- else }}
+    - emptyDir:
+        sizeLimit: {{ $root.Values.synapse.media.s3.localCache.sizeLimit }}
+      name: "media"
+{{- end }}
 {{- else }}
     - emptyDir:
         medium: Memory
@@ -39,6 +39,20 @@ data:
   POSTGRES_PASSWORD: {{ . | b64enc }}
 {{- end }}
 {{- end }}
+{{- if .media.s3.enabled }}
+{{- with .media.s3.accessKeyId }}
+{{- include "element-io.ess-library.check-credential" (dict "root" $root "context" (dict "secretPath" "synapse.media.s3.accessKeyId" "initIfAbsent" false)) -}}
+{{- with .value }}
+  S3_ACCESS_KEY_ID: {{ . | b64enc }}
+{{- end }}
+{{- end }}
+{{- with .media.s3.secretAccessKey }}
+{{- include "element-io.ess-library.check-credential" (dict "root" $root "context" (dict "secretPath" "synapse.media.s3.secretAccessKey" "initIfAbsent" false)) -}}
+{{- with .value }}
+  S3_SECRET_ACCESS_KEY: {{ . | b64enc }}
+{{- end }}
+{{- end }}
+{{- end }}
 {{- include "element-io.ess-library.check-credential" (dict "root" $root "context" (dict "secretPath" "synapse.registrationSharedSecret" "initIfAbsent" true)) -}}
 {{- with .registrationSharedSecret.value }}
   REGISTRATION_SHARED_SECRET: {{ . | b64enc }}
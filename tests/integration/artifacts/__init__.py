@@ -3,6 +3,6 @@
 #
 # SPDX-License-Identifier: AGPL-3.0-only
 
-from .certs import CertKey, generate_ca, generate_cert, get_ca
+from .certs import CertKey, generate_ca, generate_cert, get_ca, get_certs
 
-__all__ = ["get_ca", "generate_ca", "generate_cert", "CertKey"]
+__all__ = ["get_ca", "get_certs", "generate_ca", "generate_cert", "CertKey"]
@@ -5,9 +5,12 @@
 
 from __future__ import annotations
 
+import asyncio
 import datetime
+import hashlib
 import os
 import uuid
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any
@@ -16,7 +19,8 @@ import pytz
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from cryptography.hazmat.primitives.asymmetric.ec import EllipticCurvePrivateKey
 from cryptography.hazmat.primitives.asymmetric.rsa import RSAPrivateKey
 from cryptography.hazmat.primitives.serialization import load_pem_private_key
 from cryptography.x509 import Certificate
@@ -28,7 +32,7 @@ from platformdirs import user_cache_dir
 class CertKey:
     ca: CertKey | None
     cert: Certificate
-    key: RSAPrivateKey
+    key: RSAPrivateKey | EllipticCurvePrivateKey
 
     def get_root_ca(self) -> CertKey:
         if self.ca is None:
@@ -72,8 +76,12 @@ class CertKey:
         }
 
 
+def _cache_dir() -> Path:
+    return Path(user_cache_dir("pytest-ess", "element"))
+
+
 def get_ca(name, issuing_ca=None) -> CertKey:
-    ca_filename = Path(user_cache_dir("pytest-ess", "element")) / Path(name.lower().replace(" ", "-"))
+    ca_filename = _cache_dir() / Path(name.lower().replace(" ", "-"))
     cert_path = ca_filename.with_suffix(".crt")
     key_path = ca_filename.with_suffix(".key")
     if not ca_filename.parent.exists():
@@ -159,11 +167,17 @@ def generate_ca(name, issuing_ca=None) -> CertKey:
     return ca
 
 
-def generate_cert(ca, dns_names: list[str]) -> CertKey:
+def generate_cert(ca, dns_names: list[str], key_type: str = "rsa") -> CertKey:
     one_day = datetime.timedelta(1, 0, 0)
 
     # Now we want to generate a cert from that root
-    cert_key = rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+    cert_key: RSAPrivateKey | EllipticCurvePrivateKey
+    if key_type == "rsa":
+        cert_key = rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+    elif key_type == "ecdsa":
+        cert_key = ec.generate_private_key(ec.SECP256R1(), backend=default_backend())
+    else:
+        raise ValueError(f"Unsupported key type {key_type}, expected rsa or ecdsa")
     new_subject = x509.Name(
         [
             x509.NameAttribute(NameOID.COMMON_NAME, dns_names[0]),
@@ -187,3 +201,68 @@ def generate_cert(ca, dns_names: list[str]) -> CertKey:
     cert = x509_certificate.sign(ca.key, hashes.SHA256(), default_backend())
 
     return CertKey(ca=ca, cert=cert, key=cert_key)
+
+
+def _cert_cache_path(ca: CertKey, dns_names: list[str], key_type: str) -> Path:
+    # The issuing CA serial is part of the key so that a regenerated CA invalidates every cert it issued
+    names_digest = hashlib.sha256("\0".join(sorted(dns_names)).encode("utf-8")).hexdigest()[:16]
+    return _cache_dir() / "certs" / f"{ca.cert.serial_number:x}-{names_digest}-{key_type}"
+
+
+def _load_cached_cert(ca: CertKey, cert_filename: Path) -> CertKey | None:
+    cert_path = cert_filename.with_suffix(".crt")
+    key_path = cert_filename.with_suffix(".key")
+    if not (cert_path.exists() and key_path.exists()):
+        return None
+
+    with open(key_path, "rb") as pem_in:
+        private_key = load_pem_private_key(pem_in.read(), None, default_backend())
+        if not isinstance(private_key, (rsa.RSAPrivateKey, ec.EllipticCurvePrivateKey)):
+            return None
+    with open(cert_path, "rb") as pem_in:
+        cert = x509.load_pem_x509_certificate(pem_in.read(), default_backend())
+
+    # Don't hand out a cert that would expire part way through a test run
+    if cert.not_valid_after_utc < pytz.UTC.localize(datetime.datetime.now() + datetime.timedelta(hours=2)):
+        return None
+    return CertKey(ca=ca, cert=cert, key=private_key)
+
+
+def _generate_cert_as_pems(ca_mapping: dict[str, Any], dns_names: list[str], key_type: str) -> tuple[str, str]:
+    # Runs in a worker process, so everything going in or out must be picklable
+    certkey = generate_cert(CertKey.from_dict(ca_mapping), dns_names, key_type)
+    return certkey.cert_as_pem(), certkey.key_as_pem()
+
+
+async def get_certs(ca: CertKey, all_dns_names: list[list[str]], key_type: str = "rsa") -> list[CertKey]:
+    """Get a cert for each list of DNS names, issued by the given CA.
+
+    Certs are cached on disk, keyed by the DNS names and the serial of the issuing CA, and
+    reused whilst valid. Any certs that need generating are generated concurrently in a
+    process pool so that key generation doesn't block the event loop.
+    """
+    cert_filenames = [_cert_cache_path(ca, dns_names, key_type) for dns_names in all_dns_names]
+    certkeys = [_load_cached_cert(ca, cert_filename) for cert_filename in cert_filenames]
+
+    missing = [index for index, certkey in enumerate(certkeys) if certkey is None]
+    if missing:
+        os.makedirs(cert_filenames[0].parent, exist_ok=True)
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(max_workers=min(len(missing), os.cpu_count() or 1)) as executor:
+            generated_pems = await asyncio.gather(
+                *[
+                    loop.run_in_executor(
+                        executor, _generate_cert_as_pems, ca.to_json_mapping(), all_dns_names[index], key_type
+                    )
+                    for index in missing
+                ]
+            )
+        for index, (cert_pem, key_pem) in zip(missing, generated_pems, strict=True):
+            with open(cert_filenames[index].with_suffix(".key"), "wb") as pem_out:
+                pem_out.write(key_pem.encode("utf-8"))
+            with open(cert_filenames[index].with_suffix(".crt"), "wb") as pem_out:
+                pem_out.write(cert_pem.encode("utf-8"))
+            certkeys[index] = _load_cached_cert(ca, cert_filenames[index])
+
+    assert all(certkeys), "Generated certs couldn't be loaded back from the cache"
+    return certkeys  # type: ignore[return-value]
@@ -8,6 +8,7 @@ from .cluster import cluster, ess_namespace, helm_client, ingress, kube_client,
 from .data import ESSData, generated_data
 from .helm import helm_prerequisites, ingress_ready, matrix_stack, secrets_generated
 from .matrix_tools import build_matrix_tools, loaded_matrix_tools
+from .minio import loaded_synapse_s3_storage_provider, minio
 from .users import User, users
 
 __all__ = [
@@ -23,7 +24,9 @@ __all__ = [
     "ingress",
     "kube_client",
     "loaded_matrix_tools",
+    "loaded_synapse_s3_storage_provider",
     "matrix_stack",
+    "minio",
     "prometheus_operator_crds",
     "root_ca",
     "secrets_generated",
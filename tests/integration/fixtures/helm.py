@@ -17,7 +17,7 @@ from lightkube.models.meta_v1 import ObjectMeta
 from lightkube.resources.core_v1 import Namespace, Secret, Service
 from lightkube.resources.networking_v1 import Ingress
 
-from ..artifacts.certs import CertKey, generate_cert
+from ..artifacts.certs import CertKey, get_certs
 from ..lib.helpers import kubernetes_docker_secret, kubernetes_tls_secret, wait_for_endpoint_ready
 from ..lib.utils import DockerAuth, docker_config_json, value_file_has
 from .data import ESSData
@@ -33,6 +33,8 @@ async def helm_prerequisites(
 ):
     resources = []
     setups: list[Awaitable] = []
+    # TLS Secret name suffix -> DNS names. The certs are all fetched together at the end
+    tls_secrets_dns_names: dict[str, list[str]] = {}
 
     # On CI, public runners should login to dockerhub.io to avoid rate-limits
     if os.environ.get("CI") and ("DOCKERHUB_USERNAME" in os.environ) and ("DOCKERHUB_TOKEN" in os.environ):
@@ -53,44 +55,20 @@ async def helm_prerequisites(
         )
 
     if value_file_has("matrixRTC.enabled", True):
-        resources.append(
-            kubernetes_tls_secret(
-                f"{generated_data.release_name}-matrix-rtc-tls",
-                generated_data.ess_namespace,
-                generate_cert(delegated_ca, [f"mrtc.{generated_data.server_name}"]),
-            )
-        )
+        tls_secrets_dns_names["matrix-rtc-tls"] = [f"mrtc.{generated_data.server_name}"]
 
     if value_file_has("elementAdmin.enabled", True):
-        resources.append(
-            kubernetes_tls_secret(
-                f"{generated_data.release_name}-element-admin-tls",
-                generated_data.ess_namespace,
-                generate_cert(delegated_ca, [f"admin.{generated_data.server_name}"]),
-            )
-        )
+        tls_secrets_dns_names["element-admin-tls"] = [f"admin.{generated_data.server_name}"]
 
     if value_file_has("elementWeb.enabled", True):
-        resources.append(
-            kubernetes_tls_secret(
-                f"{generated_data.release_name}-element-web-tls",
-                generated_data.ess_namespace,
-                generate_cert(delegated_ca, [f"element.{generated_data.server_name}"]),
-            )
-        )
+        tls_secrets_dns_names["element-web-tls"] = [f"element.{generated_data.server_name}"]
 
     # if MAS is disabled but syn2mas is enabled, we are going to enable MAS later on during the test
     # So let's initilize everything it needs
     if value_file_has("matrixAuthenticationService.enabled", True) or value_file_has(
         "matrixAuthenticationService.syn2mas.enabled", True
     ):
-        resources.append(
-            kubernetes_tls_secret(
-                f"{generated_data.release_name}-mas-web-tls",
-                generated_data.ess_namespace,
-                generate_cert(delegated_ca, [f"mas.{generated_data.server_name}"]),
-            )
-        )
+        tls_secrets_dns_names["mas-web-tls"] = [f"mas.{generated_data.server_name}"]
         resources.append(
             Secret(
                 metadata=ObjectMeta(
@@ -114,13 +92,7 @@ clients:
         )
 
     if value_file_has("synapse.enabled", True):
-        resources.append(
-            kubernetes_tls_secret(
-                f"{generated_data.release_name}-synapse-web-tls",
-                generated_data.ess_namespace,
-                generate_cert(delegated_ca, [f"synapse.{generated_data.server_name}"]),
-            )
-        )
+        tls_secrets_dns_names["synapse-web-tls"] = [f"synapse.{generated_data.server_name}"]
         resources.append(
             Secret(
                 metadata=ObjectMeta(
@@ -138,12 +110,14 @@ retention:
         )
 
     if value_file_has("wellKnownDelegation.enabled", True):
+        tls_secrets_dns_names["well-known-web-tls"] = [generated_data.server_name]
+
+    certs = await get_certs(
+        delegated_ca, list(tls_secrets_dns_names.values()), os.environ.get("PYTEST_CERTS_KEY_TYPE", "rsa")
+    )
+    for secret_suffix, cert in zip(tls_secrets_dns_names.keys(), certs, strict=True):
         resources.append(
-            kubernetes_tls_secret(
-                f"{generated_data.release_name}-well-known-web-tls",
-                generated_data.ess_namespace,
-                generate_cert(delegated_ca, [generated_data.server_name]),
-            )
+            kubernetes_tls_secret(f"{generated_data.release_name}-{secret_suffix}", generated_data.ess_namespace, cert)
         )
 
     return await asyncio.gather(
@@ -160,6 +134,8 @@ async def matrix_stack(
     ess_namespace: Namespace,
     generated_data: ESSData,
     loaded_matrix_tools: dict,
+    loaded_synapse_s3_storage_provider: dict,
+    minio,
 ):
     with open(os.environ["TEST_VALUES_FILE"]) as stream:
         values = yaml.safe_load(stream)
@@ -172,6 +148,8 @@ async def matrix_stack(
         ]
     values["matrixTools"].setdefault("image", {})
     values["matrixTools"]["image"] = loaded_matrix_tools
+    if loaded_synapse_s3_storage_provider:
+        values["synapse"]["image"] = loaded_synapse_s3_storage_provider
     values["matrixRTC"]["hostAliases"] = [
         {
             "ip": ingress,
@@ -0,0 +1,124 @@
+# Copyright 2025 Element Creations Ltd
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import os
+from pathlib import Path
+
+import pytest
+import yaml
+from lightkube import AsyncClient
+from lightkube.models.apps_v1 import DeploymentSpec
+from lightkube.models.core_v1 import (
+    Container,
+    ContainerPort,
+    EmptyDirVolumeSource,
+    EnvVar,
+    HTTPGetAction,
+    LocalObjectReference,
+    PodSpec,
+    PodTemplateSpec,
+    Probe,
+    ServicePort,
+    ServiceSpec,
+    Volume,
+    VolumeMount,
+)
+from lightkube.models.meta_v1 import LabelSelector, ObjectMeta
+from lightkube.resources.apps_v1 import Deployment
+from lightkube.resources.core_v1 import Service
+from python_on_whales import docker
+
+from ..lib.helpers import wait_for_endpoint_ready
+from ..lib.utils import value_file_has
+from .data import ESSData
+
+MINIO_IMAGE = "docker.io/minio/minio:RELEASE.2025-04-22T22-12-26Z"
+
+
+@pytest.fixture(scope="session")
+async def loaded_synapse_s3_storage_provider(cluster):
+    # The chart's Synapse image doesn't include synapse-s3-storage-provider, so build one that does
+    if not value_file_has("synapse.media.s3.enabled", True):
+        return {}
+
+    project_folder = Path(__file__).parent.parent.parent.parent.resolve()
+    with open(project_folder / "charts" / "matrix-stack" / "values.yaml") as stream:
+        synapse_image = yaml.safe_load(stream)["synapse"]["image"]
+
+    docker.build(
+        Path(__file__).parent / "files" / "images" / "synapse-s3-storage-provider",
+        build_args={
+            "SYNAPSE_IMAGE": f"{synapse_image['registry']}/{synapse_image['repository']}:{synapse_image['tag']}"
+        },
+        tags="localhost:5000/synapse-s3-storage-provider:pytest",
+        load=True,
+    )
+    docker.push("localhost:5000/synapse-s3-storage-provider:pytest")
+    image = docker.image.inspect("localhost:5000/synapse-s3-storage-provider:pytest")
+    return {
+        "repository": "synapse-s3-storage-provider",
+        "registry": "localhost:5000",
+        "digest": image.repo_digests[0].split("@")[-1],
+        "tag": "pytest",
+    }
+
+
+@pytest.fixture(scope="session")
+async def minio(cluster, kube_client: AsyncClient, ess_namespace, generated_data: ESSData):
+    # A local stand-in for S3, with the bucket and credentials that the values file uses for Synapse's media
+    if not value_file_has("synapse.media.s3.enabled", True):
+        return
+
+    with open(os.environ["TEST_VALUES_FILE"]) as stream:
+        s3 = yaml.safe_load(stream)["synapse"]["media"]["s3"]
+
+    name = f"{generated_data.release_name}-pytest-minio"
+    labels = {"app.kubernetes.io/name": "pytest-minio", "app.kubernetes.io/instance": name}
+    pull_secrets = []
+    if os.environ.get("CI") and ("DOCKERHUB_USERNAME" in os.environ) and ("DOCKERHUB_TOKEN" in os.environ):
+        pull_secrets = [LocalObjectReference(name=f"{generated_data.release_name}-dockerhub")]
+
+    deployment = Deployment(
+        metadata=ObjectMeta(
+            name=name,
+            namespace=generated_data.ess_namespace,
+            labels=labels | {"app.kubernetes.io/managed-by": "pytest"},
+        ),
+        spec=DeploymentSpec(
+            selector=LabelSelector(matchLabels=labels),
+            template=PodTemplateSpec(
+                metadata=ObjectMeta(labels=labels),
+                spec=PodSpec(
+                    imagePullSecrets=pull_secrets,
+                    containers=[
+                        Container(
+                            name="minio",
+                            image=MINIO_IMAGE,
+                            # MinIO serves the top-level directories of a single drive as buckets
+                            command=["sh", "-c", f"mkdir -p /data/{s3['bucket']} && exec minio server /data"],
+                            env=[
+                                EnvVar(name="MINIO_ROOT_USER", value=s3["accessKeyId"]["value"]),
+                                EnvVar(name="MINIO_ROOT_PASSWORD", value=s3["secretAccessKey"]["value"]),
+                            ],
+                            ports=[ContainerPort(name="s3", containerPort=9000)],
+                            readinessProbe=Probe(httpGet=HTTPGetAction(path="/minio/health/ready", port="s3")),
+                            volumeMounts=[VolumeMount(name="data", mountPath="/data")],
+                        )
+                    ],
+                    volumes=[Volume(name="data", emptyDir=EmptyDirVolumeSource())],
+                ),
+            ),
+        ),
+    )
+    service = Service(
+        metadata=ObjectMeta(
+            name=name,
+            namespace=generated_data.ess_namespace,
+            labels=labels | {"app.kubernetes.io/managed-by": "pytest"},
+        ),
+        spec=ServiceSpec(selector=labels, ports=[ServicePort(name="s3", port=9000, targetPort="s3")]),
+    )
+    await kube_client.apply(deployment, field_manager="pytest")
+    await kube_client.apply(service, field_manager="pytest")
+    await wait_for_endpoint_ready(name, generated_data.ess_namespace, cluster, kube_client)
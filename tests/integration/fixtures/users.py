@@ -3,17 +3,16 @@
 #
 # SPDX-License-Identifier: AGPL-3.0-only
 
-import asyncio
 from collections.abc import Iterable
 from dataclasses import dataclass, field
 
 import pytest
 
 from ..lib.matrix_authentication_service import (
-    create_mas_user,
+    create_mas_users,
     get_client_token,
 )
-from ..lib.synapse import create_synapse_user
+from ..lib.synapse import create_synapse_users
 from ..lib.utils import value_file_has
 from .data import ESSData
 
@@ -36,37 +35,27 @@ async def users(
     users = request.param
     assert isinstance(users, Iterable)
 
-    wait_for_users = []
     if value_file_has("matrixAuthenticationService.enabled", True):
         admin_token = await get_client_token(f"mas.{generated_data.server_name}", generated_data, ssl_context)
-        for user in users:
-            wait_for_users.append(
-                create_mas_user(
-                    f"mas.{generated_data.server_name}",
-                    f"synapse.{generated_data.server_name}",
-                    user.name,
-                    generated_data.secrets_random,
-                    user.admin,
-                    admin_token,
-                    ssl_context,
-                    pytestconfig,
-                )
-            )
+        tokens = await create_mas_users(
+            f"mas.{generated_data.server_name}",
+            f"synapse.{generated_data.server_name}",
+            [(user.name, user.admin) for user in users],
+            generated_data.secrets_random,
+            admin_token,
+            ssl_context,
+            pytestconfig,
+        )
     else:
         synapse_registration_shared_secret = await secrets_generated("SYNAPSE_REGISTRATION_SHARED_SECRET")
-        for user in request.param:
-            wait_for_users.append(
-                create_synapse_user(
-                    f"synapse.{generated_data.server_name}",
-                    user.name,
-                    generated_data.secrets_random,
-                    user.admin,
-                    synapse_registration_shared_secret,
-                    ssl_context,
-                    pytestconfig,
-                )
-            )
-    tokens = await asyncio.gather(*wait_for_users)
-    for i, user in enumerate(users):
-        user.access_token = tokens[i]
+        tokens = await create_synapse_users(
+            f"synapse.{generated_data.server_name}",
+            [(user.name, user.admin) for user in users],
+            generated_data.secrets_random,
+            synapse_registration_shared_secret,
+            ssl_context,
+            pytestconfig,
+        )
+    for user, token in zip(users, tokens, strict=True):
+        user.access_token = token
     return users
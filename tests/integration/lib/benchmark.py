@@ -0,0 +1,319 @@
+# Copyright 2025 New Vector Ltd
+# Copyright 2025 Element Creations Ltd
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import asyncio
+import bisect
+import json
+import os
+import random
+import time
+import uuid
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from pathlib import Path
+from ssl import SSLContext
+from typing import Any, TypedDict
+
+import aiohttp
+import pytest
+from lightkube import AsyncClient
+from prometheus_client.parser import text_string_to_metric_families
+
+from ..fixtures.data import ESSData
+from .helpers import run_pod_with_args
+from .logs import HAProxyLogRecord, LogPipeline
+
+# The HAProxy per-backend samples we compare before and after a benchmark run
+HAPROXY_BACKEND_METRICS = [
+    "haproxy_backend_http_requests_total",
+    "haproxy_backend_connection_errors_total",
+    "haproxy_backend_queue_time_average_seconds",
+    "haproxy_backend_connect_time_average_seconds",
+    "haproxy_backend_response_time_average_seconds",
+    "haproxy_backend_total_time_average_seconds",
+    "haproxy_backend_max_queue",
+]
+
+
+@dataclass(frozen=True)
+class BenchmarkRequest:
+    # {txn_id} in the path is replaced with a unique value for every request
+    name: str
+    method: str
+    path: str
+    weight: int = 1
+    json: Any = None
+
+
+# A mix of client and federation traffic, weighted roughly like a client-heavy homeserver.
+# Nothing needs to succeed, we're measuring HAProxy's routing, so no auth is needed and identifiers can be made up
+MATRIX_CLIENT_FEDERATION_MIX = [
+    BenchmarkRequest("client-versions", "GET", "/_matrix/client/versions", weight=10),
+    BenchmarkRequest("client-sync", "GET", "/_matrix/client/v3/sync?since=s1&timeout=0", weight=30),
+    BenchmarkRequest("client-initial-sync", "GET", "/_matrix/client/v3/sync", weight=2),
+    BenchmarkRequest(
+        "client-sliding-sync", "POST", "/_matrix/client/unstable/org.matrix.simplified_msc3575/sync", 5, json={}
+    ),
+    BenchmarkRequest("client-messages", "GET", "/_matrix/client/v3/rooms/!aroomid:example.com/messages", weight=10),
+    BenchmarkRequest(
+        "client-send", "PUT", "/_matrix/client/v3/rooms/!aroomid:example.com/send/m.room.message/txn", 10, json={}
+    ),
+    BenchmarkRequest("client-profile", "GET", "/_matrix/client/v3/profile/@someone:example.com", weight=5),
+    BenchmarkRequest("client-login-flows", "GET", "/_matrix/client/v3/login", weight=3),
+    BenchmarkRequest("media-config", "GET", "/_matrix/client/v1/media/config", weight=5),
+    BenchmarkRequest("federation-version", "GET", "/_matrix/federation/v1/version", weight=5),
+    BenchmarkRequest("federation-keys", "GET", "/_matrix/key/v2/server", weight=5),
+    BenchmarkRequest("federation-send", "PUT", "/_matrix/federation/v1/send/atxn", weight=10, json={}),
+]
+
+
+class LatencyHistogram:
+    """
+    A fixed bucket latency histogram, in milliseconds, with the same cumulative semantics as Prometheus.
+    """
+
+    BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value_ms: float):
+        self.counts[bisect.bisect_left(self.BUCKETS_MS, value_ms)] += 1
+        self.count += 1
+        self.sum += value_ms
+
+    def quantile(self, quantile: float) -> float:
+        """
+        The upper bound of the bucket the quantile falls in, or infinity if it is past the largest bucket.
+        """
+        rank = quantile * self.count
+        seen = 0
+        for bucket, bucket_count in zip(self.BUCKETS_MS, self.counts, strict=False):
+            seen += bucket_count
+            if seen >= rank:
+                return bucket
+        return float("inf")
+
+    def as_dict(self) -> dict[str, Any]:
+        cumulative = 0
+        buckets = {}
+        for bucket, bucket_count in zip([*self.BUCKETS_MS, "+Inf"], self.counts, strict=True):
+            cumulative += bucket_count
+            buckets[str(bucket)] = cumulative
+        return {
+            "count": self.count,
+            "sum_ms": self.sum,
+            "mean_ms": self.sum / self.count if self.count else None,
+            "p50_ms": self.quantile(0.5) if self.count else None,
+            "p95_ms": self.quantile(0.95) if self.count else None,
+            "p99_ms": self.quantile(0.99) if self.count else None,
+            "buckets_ms": buckets,
+        }
+
+
+@dataclass
+class LoadSample:
+    request_id: str
+    name: str
+    status: int
+    latency_ms: float
+
+
+@dataclass
+class LoadResult:
+    duration: float
+    samples: list[LoadSample] = field(default_factory=list)
+    errors: Counter[str] = field(default_factory=Counter)
+
+
+async def generate_load(
+    fqdn: str,
+    requests: list[BenchmarkRequest],
+    ssl_context: SSLContext,
+    duration: float,
+    concurrency: int,
+    headers: dict[str, str] | None = None,
+) -> LoadResult:
+    """
+    Replay a weighted random mix of requests against fqdn from concurrency workers for duration seconds.
+
+    Requests aren't retried and any HTTP status is a result. Every request gets a unique User-agent, which is
+    used as the request id in the HAProxy logs, so that it can be attributed to the backend that served it.
+    """
+    weights = [request.weight for request in requests]
+    deadline = time.monotonic() + duration
+    result = LoadResult(duration=duration)
+
+    async def _worker(session: aiohttp.ClientSession):
+        while time.monotonic() < deadline:
+            request = random.choices(requests, weights=weights)[0]
+            request_id = f"ess-helm-benchmark-{uuid.uuid4()}"
+            start = time.perf_counter()
+            try:
+                async with session.request(
+                    request.method,
+                    f"https://127.0.0.1{request.path.replace('{txn_id}', request_id)}",
+                    headers=(headers or {}) | {"Host": fqdn, "User-agent": request_id},
+                    server_hostname=fqdn,
+                    json=request.json,
+                ) as response:
+                    await response.read()
+                    result.samples.append(
+                        LoadSample(request_id, request.name, response.status, (time.perf_counter() - start) * 1000)
+                    )
+            except (aiohttp.ClientError, TimeoutError) as e:
+                result.errors[type(e).__name__] += 1
+
+    start = time.monotonic()
+    async with (
+        aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=ssl_context, limit=concurrency)) as session,
+        asyncio.TaskGroup() as task_group,
+    ):
+        for _ in range(concurrency):
+            task_group.create_task(_worker(session))
+    result.duration = time.monotonic() - start
+    return result
+
+
+def merge_load_results(results: list[LoadResult]) -> LoadResult:
+    """
+    Combine the results of load generated concurrently, e.g. with different users.
+    """
+    merged = LoadResult(duration=max(result.duration for result in results))
+    for result in results:
+        merged.samples += result.samples
+        merged.errors += result.errors
+    return merged
+
+
+class ScalingPoint(TypedDict):
+    """
+    The load results at one number of replicas in a scaling benchmark.
+    """
+
+    replicas: int
+    requests: int
+    throughput_rps: float
+    errors: dict[str, int]
+    by_request: dict[str, Any]
+
+
+def requests_report(result: LoadResult) -> dict[str, Any]:
+    """
+    Report the latency, statuses and throughput of each request in the mix, as seen by the load generator.
+    """
+    latencies: dict[str, LatencyHistogram] = defaultdict(LatencyHistogram)
+    statuses: dict[str, Counter[int]] = defaultdict(Counter)
+    for sample in result.samples:
+        latencies[sample.name].observe(sample.latency_ms)
+        statuses[sample.name][sample.status] += 1
+
+    return {
+        name: {
+            "latency": latencies[name].as_dict(),
+            "statuses": {str(status): count for status, count in sorted(statuses[name].items())},
+            "throughput_rps": latencies[name].count / result.duration,
+            "successful_throughput_rps": sum(count for status, count in statuses[name].items() if 200 <= status < 300)
+            / result.duration,
+        }
+        for name in sorted(latencies)
+    }
+
+
+async def scrape_haproxy_backend_metrics(
+    kube_client: AsyncClient, generated_data: ESSData
+) -> dict[str, dict[str, float]]:
+    """
+    Fetch HAProxy's Prometheus endpoint from inside the cluster and return the samples we care about by backend.
+    """
+    metrics_data = await run_pod_with_args(
+        kube_client,
+        generated_data,
+        "curlimages/curl:latest",
+        "curl",
+        [
+            "-s",
+            "--connect-timeout",
+            "2",
+            "--max-time",
+            "5",
+            f"http://{generated_data.release_name}-haproxy.{generated_data.ess_namespace}.svc.cluster.local:8405/metrics",
+        ],
+        restart_policy="OnFailure",
+    )
+
+    backend_metrics: dict[str, dict[str, float]] = defaultdict(dict)
+    for metric_family in text_string_to_metric_families(metrics_data):
+        for sample in metric_family.samples:
+            if sample.name in HAPROXY_BACKEND_METRICS and "proxy" in sample.labels:
+                backend_metrics[sample.labels["proxy"]][sample.name] = sample.value
+    return dict(backend_metrics)
+
+
+def backend_report(
+    result: LoadResult,
+    haproxy_logs: LogPipeline[HAProxyLogRecord],
+    metrics_before: dict[str, dict[str, float]],
+    metrics_after: dict[str, dict[str, float]],
+) -> dict[str, Any]:
+    """
+    Combine the client-side samples, the HAProxy logs and the HAProxy metrics into a per-backend report.
+
+    Client latency is what the load generator saw. HAProxy overhead is HAProxy's total time for the request
+    minus the time the backend server took to respond, i.e. the time spent in HAProxy itself.
+    """
+    client_latencies: dict[str, LatencyHistogram] = defaultdict(LatencyHistogram)
+    haproxy_overheads: dict[str, LatencyHistogram] = defaultdict(LatencyHistogram)
+    statuses: dict[str, Counter[int]] = defaultdict(Counter)
+    requests_to_backends: dict[str, Counter[str]] = defaultdict(Counter)
+    for sample in result.samples:
+        records = haproxy_logs.records_for(sample.request_id)
+        backend = records[0].backend if records else "unattributed"
+        client_latencies[backend].observe(sample.latency_ms)
+        statuses[backend][sample.status] += 1
+        requests_to_backends[sample.name][backend] += 1
+        if records and records[0].timings.total >= 0 and records[0].timings.response >= 0:
+            haproxy_overheads[backend].observe(records[0].timings.total - records[0].timings.response)
+
+    backends = {}
+    for backend in sorted(client_latencies.keys() | metrics_after.keys()):
+        before = metrics_before.get(backend, {})
+        after = metrics_after.get(backend, {})
+        requests_served = after.get("haproxy_backend_http_requests_total", 0) - before.get(
+            "haproxy_backend_http_requests_total", 0
+        )
+        if backend not in client_latencies and not requests_served:
+            continue
+        backends[backend] = {
+            "client_latency": client_latencies[backend].as_dict(),
+            "haproxy_overhead": haproxy_overheads[backend].as_dict(),
+            "statuses": {str(status): count for status, count in sorted(statuses[backend].items())},
+            "haproxy_requests": requests_served,
+            "haproxy_throughput_rps": requests_served / result.duration,
+            "haproxy_metrics_after": after,
+        }
+
+    return {
+        "duration_seconds": result.duration,
+        "requests": len(result.samples),
+        "throughput_rps": len(result.samples) / result.duration,
+        "errors": dict(result.errors),
+        "backends": backends,
+        "routing": {name: dict(backend_counts) for name, backend_counts in sorted(requests_to_backends.items())},
+    }
+
+
+def write_benchmark_report(name: str, report: dict[str, Any], pytestconfig: pytest.Config) -> Path:
+    if "PYTEST_BENCHMARK_REPORT_DIR" in os.environ:
+        report_dir = Path(os.environ["PYTEST_BENCHMARK_REPORT_DIR"])
+        report_dir.mkdir(parents=True, exist_ok=True)
+    else:
+        report_dir = pytestconfig.cache.mkdir("ess-helm-benchmark-reports")
+    report_path = report_dir / f"{name}-{datetime.now(UTC).strftime('%Y%m%dT%H%M%SZ')}.json"
+    report_path.write_text(json.dumps(report, indent=2, sort_keys=True))
+    return report_path
@@ -0,0 +1,187 @@
+# Copyright 2025 New Vector Ltd
+# Copyright 2025 Element Creations Ltd
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import asyncio
+import re
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Generic, TypeVar
+
+from lightkube import AsyncClient
+
+from .utils import get_pods_matching_labels
+
+T = TypeVar("T")
+
+# Matches our HAProxy log-format of
+# "%ci:%cp [%tr] %ft %b/%s %Th/%TR/%Tw/%Tc/%Tr/%Ta %ST %B %CC %CS %tsc %ac/%fc/%bc/%sc/%rc %sq/%bq %hr %hs %{+Q}r"
+HAPROXY_LOG_LINE = re.compile(
+    r"^(?P<client>\S+) \[(?P<accept_date>[^\]]+)\] (?P<frontend>\S+) (?P<backend>[^/\s]+)/(?P<server>\S+) "
+    r"(?P<handshake>-?\d+)/(?P<idle>-?\d+)/(?P<queue>-?\d+)/(?P<connect>-?\d+)/(?P<response>-?\d+)/"
+    r"\+?(?P<total>-?\d+) (?P<status>-?\d+) \+?(?P<bytes_read>\d+) \S+ \S+ (?P<termination_state>\S+) "
+    r"\S+ \S+(?: \{(?P<request_headers>[^}]*)\})?(?: \{(?P<response_headers>[^}]*)\})?\s+\"(?P<request>[^\"]*)\"$"
+)
+
+
+@dataclass(frozen=True)
+class HAProxyTimings:
+    """
+    The timers from a HAProxy log line in milliseconds. -1 means that the phase never completed.
+    """
+
+    handshake: int
+    idle: int
+    queue: int
+    connect: int
+    response: int
+    total: int
+
+
+@dataclass(frozen=True)
+class HAProxyLogRecord:
+    client: str
+    frontend: str
+    backend: str
+    server: str
+    timings: HAProxyTimings
+    status: int
+    bytes_read: int
+    termination_state: str
+    # In the order of the http-request captures: host, x-forwarded-for, user-agent
+    request_headers: tuple[str, ...]
+    request: str
+    raw: str = field(repr=False)
+
+    @classmethod
+    def parse(cls, line: str) -> "HAProxyLogRecord | None":
+        match = HAPROXY_LOG_LINE.match(line.strip())
+        if not match:
+            return None
+
+        return cls(
+            client=match["client"],
+            frontend=match["frontend"],
+            backend=match["backend"],
+            server=match["server"],
+            timings=HAProxyTimings(
+                handshake=int(match["handshake"]),
+                idle=int(match["idle"]),
+                queue=int(match["queue"]),
+                connect=int(match["connect"]),
+                response=int(match["response"]),
+                total=int(match["total"]),
+            ),
+            status=int(match["status"]),
+            bytes_read=int(match["bytes_read"]),
+            termination_state=match["termination_state"],
+            request_headers=tuple((match["request_headers"] or "").split("|")),
+            request=match["request"],
+            raw=line,
+        )
+
+    @property
+    def host(self) -> str:
+        return self.request_headers[0]
+
+    @property
+    def user_agent(self) -> str:
+        return self.request_headers[2] if len(self.request_headers) > 2 else ""
+
+    @property
+    def request_id(self) -> str:
+        """
+        Tests identify their requests by setting a unique User-agent
+        """
+        return self.user_agent
+
+    @property
+    def path(self) -> str:
+        parts = self.request.split(" ")
+        return parts[1] if len(parts) > 1 else ""
+
+
+class LogSubscription(Generic[T]):
+    """
+    A bounded buffer of the log records matching a predicate.
+
+    If the subscriber falls behind, the oldest records are dropped rather than growing without limit
+    or stalling every other subscriber of the pipeline.
+    """
+
+    def __init__(self, predicate: Callable[[T], bool], maxsize: int):
+        self.predicate = predicate
+        self.dropped = 0
+        self._queue: asyncio.Queue[T] = asyncio.Queue(maxsize=maxsize)
+
+    def offer(self, record: T):
+        if not self.predicate(record):
+            return
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(record)
+
+    async def get(self, timeout: float | None = None) -> T:
+        return await asyncio.wait_for(self._queue.get(), timeout=timeout)
+
+
+class LogPipeline(Generic[T]):
+    """
+    Tails the logs of pods, parsing each line once and fanning the records out to subscribers.
+
+    Lines that the parser returns None for are ignored. Records with a key are indexed so that
+    tests can look them up after the fact. The index only keeps the most recent index_size keys.
+    """
+
+    def __init__(
+        self,
+        parser: Callable[[str], T | None],
+        index_key: Callable[[T], str] | None = None,
+        index_size: int = 1024,
+    ):
+        self.parser = parser
+        self.index_key = index_key
+        self.index_size = index_size
+        self._index: OrderedDict[str, list[T]] = OrderedDict()
+        self._subscriptions: list[LogSubscription[T]] = []
+
+    def subscribe(self, predicate: Callable[[T], bool] = lambda _: True, maxsize: int = 100) -> LogSubscription[T]:
+        subscription = LogSubscription(predicate, maxsize)
+        self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: LogSubscription[T]):
+        self._subscriptions.remove(subscription)
+
+    def records_for(self, key: str) -> list[T]:
+        return list(self._index.get(key, []))
+
+    def publish(self, line: str):
+        record = self.parser(line)
+        if record is None:
+            return
+
+        if self.index_key is not None and (key := self.index_key(record)):
+            self._index.setdefault(key, []).append(record)
+            self._index.move_to_end(key)
+            while len(self._index) > self.index_size:
+                self._index.popitem(last=False)
+
+        for subscription in self._subscriptions:
+            subscription.offer(record)
+
+    async def _tail_pod(self, kube_client: AsyncClient, namespace: str, pod_name: str):
+        async for line in kube_client.log(pod_name, namespace=namespace, follow=True, newlines=False):
+            self.publish(line)
+
+    async def tail_pods_matching_labels(self, kube_client: AsyncClient, namespace: str, labels: dict[str, str]):
+        async with asyncio.TaskGroup() as task_group:
+            async for pod_name in get_pods_matching_labels(kube_client, namespace, labels):
+                task_group.create_task(self._tail_pod(kube_client, namespace, pod_name))
+
+
+def haproxy_log_pipeline(index_size: int = 1024) -> LogPipeline[HAProxyLogRecord]:
+    return LogPipeline(HAProxyLogRecord.parse, index_key=lambda record: record.request_id, index_size=index_size)
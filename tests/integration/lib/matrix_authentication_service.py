@@ -3,6 +3,8 @@
 #
 # SPDX-License-Identifier: AGPL-3.0-only
 
+import asyncio
+from collections.abc import Iterable
 from ssl import SSLContext
 from urllib.parse import urlparse
 
@@ -11,7 +13,8 @@ import pytest
 from aiohttp_retry import RetryClient
 
 from ..fixtures import ESSData
-from .utils import aiohttp_get_json, aiohttp_post_json, retry_options
+from .synapse import USER_PROVISIONING_CONCURRENCY, get_valid_cached_tokens
+from .utils import aiohttp_client, aiohttp_get_json, aiohttp_post_json, retry_options
 
 
 async def get_client_token(mas_fqdn: str, generated_data: ESSData, ssl_context: SSLContext) -> str:
@@ -35,57 +38,45 @@ async def get_client_token(mas_fqdn: str, generated_data: ESSData, ssl_context:
         return (await response.json())["access_token"]
 
 
-async def create_mas_user(
+async def _provision_mas_user(
     mas_fqdn: str,
-    synapse_fqdn: str,
     username: str,
     password: str,
     admin: bool,
-    bearer_token: str,
+    password_login_enabled: bool,
+    headers: dict[str, str],
     ssl_context: SSLContext,
-    pytestconfig: pytest.Config,
+    client: RetryClient,
 ) -> str:
     """
-    Create the user and return their access token
+    Create or update the user and return a new access token for them
     """
-    cached_user_token = pytestconfig.cache.get(f"ess-helm/cached-tokens/{username}", None)
-    if cached_user_token:
-        # Locally the cached token may be from a previous run but we don't know whether it is with the same DB or not
-        # We still want the caching in-case we request this for the same user multiple times in the same run
-        try:
-            headers = {"Authorization": f"Bearer {cached_user_token}"}
-            response = await aiohttp_get_json(
-                f"https://{synapse_fqdn}/_matrix/client/v3/account/whoami", headers=headers, ssl_context=ssl_context
-            )
-            if response["user_id"].split(":")[0] == f"@{username}":
-                return cached_user_token
-        except aiohttp.ClientResponseError:
-            pass
-
-        pytestconfig.cache.set(f"ess-helm/cached-tokens/{username}", None)
-
-    headers = {"Authorization": f"Bearer {bearer_token}"}
     try:
         response = await aiohttp_get_json(
-            f"https://{mas_fqdn}/api/admin/v1/users/by-username/{username}", headers=headers, ssl_context=ssl_context
+            f"https://{mas_fqdn}/api/admin/v1/users/by-username/{username}",
+            headers=headers,
+            ssl_context=ssl_context,
+            client=client,
         )
     except aiohttp.ClientResponseError:
         create_user_data = {"username": username}
         response = await aiohttp_post_json(
-            f"https://{mas_fqdn}/api/admin/v1/users", headers=headers, data=create_user_data, ssl_context=ssl_context
+            f"https://{mas_fqdn}/api/admin/v1/users",
+            headers=headers,
+            data=create_user_data,
+            ssl_context=ssl_context,
+            client=client,
         )
     user_id = response["data"]["id"]
 
-    response = await aiohttp_get_json(
-        f"https://{mas_fqdn}/api/admin/v1/site-config", headers=headers, ssl_context=ssl_context
-    )
-    if response["password_login_enabled"]:
+    if password_login_enabled:
         set_password_data = {"password": password, "skip_password_check": True}
         response = await aiohttp_post_json(
             f"https://{mas_fqdn}/api/admin/v1/users/{user_id}/set-password",
             headers=headers,
             data=set_password_data,
             ssl_context=ssl_context,
+            client=client,
         )
 
     set_admin_data = {"admin": admin}
@@ -94,6 +85,7 @@ async def create_mas_user(
         headers=headers,
         data=set_admin_data,
         ssl_context=ssl_context,
+        client=client,
     )
 
     check_user_query = """
@@ -105,7 +97,7 @@ async def create_mas_user(
     """
     check_user_data = {"query": check_user_query, "variables": {"username": username}}
     response = await aiohttp_post_json(
-        f"https://{mas_fqdn}/graphql", headers=headers, data=check_user_data, ssl_context=ssl_context
+        f"https://{mas_fqdn}/graphql", headers=headers, data=check_user_data, ssl_context=ssl_context, client=client
     )
     graphql_user_id = response["data"]["userByUsername"]["id"]
 
@@ -127,7 +119,80 @@ async def create_mas_user(
     }
 
     response = await aiohttp_post_json(
-        f"https://{mas_fqdn}/graphql", headers=headers, data=add_access_token_data, ssl_context=ssl_context
+        f"https://{mas_fqdn}/graphql",
+        headers=headers,
+        data=add_access_token_data,
+        ssl_context=ssl_context,
+        client=client,
     )
-    pytestconfig.cache.set(f"ess-helm/cached-tokens/{username}", response["data"]["createOauth2Session"]["accessToken"])
     return response["data"]["createOauth2Session"]["accessToken"]
+
+
+async def create_mas_users(
+    mas_fqdn: str,
+    synapse_fqdn: str,
+    users: Iterable[tuple[str, bool]],
+    password: str,
+    bearer_token: str,
+    ssl_context: SSLContext,
+    pytestconfig: pytest.Config,
+) -> list[str]:
+    """
+    Create the (username, admin) users and return their access tokens in order.
+
+    Users with a valid cached access token aren't recreated. The admin API has no bulk endpoint,
+    so users are provisioned with bounded concurrency over a shared connection pool.
+    """
+    users = list(users)
+    headers = {"Authorization": f"Bearer {bearer_token}"}
+    semaphore = asyncio.Semaphore(USER_PROVISIONING_CONCURRENCY)
+
+    async with aiohttp_client(ssl_context) as client:
+        tokens = await get_valid_cached_tokens(
+            synapse_fqdn, [username for username, _ in users], ssl_context, pytestconfig, client
+        )
+        users_to_create = {username: admin for username, admin in users if username not in tokens}
+        if not users_to_create:
+            return [tokens[username] for username, _ in users]
+
+        site_config = await aiohttp_get_json(
+            f"https://{mas_fqdn}/api/admin/v1/site-config", headers=headers, ssl_context=ssl_context, client=client
+        )
+
+        async def _create(username: str, admin: bool) -> None:
+            async with semaphore:
+                access_token = await _provision_mas_user(
+                    mas_fqdn,
+                    username,
+                    password,
+                    admin,
+                    site_config["password_login_enabled"],
+                    headers,
+                    ssl_context,
+                    client,
+                )
+            pytestconfig.cache.set(f"ess-helm/cached-tokens/{username}", access_token)
+            tokens[username] = access_token
+
+        await asyncio.gather(*[_create(username, admin) for username, admin in users_to_create.items()])
+
+    return [tokens[username] for username, _ in users]
+
+
+async def create_mas_user(
+    mas_fqdn: str,
+    synapse_fqdn: str,
+    username: str,
+    password: str,
+    admin: bool,
+    bearer_token: str,
+    ssl_context: SSLContext,
+    pytestconfig: pytest.Config,
+) -> str:
+    """
+    Create the user and return their access token
+    """
+    (access_token,) = await create_mas_users(
+        mas_fqdn, synapse_fqdn, [(username, admin)], password, bearer_token, ssl_context, pytestconfig
+    )
+    return access_token
@@ -3,23 +3,31 @@
 #
 # SPDX-License-Identifier: AGPL-3.0-only
 
+import asyncio
 import hashlib
 import hmac
 import mimetypes
+from collections.abc import Iterable
 from pathlib import Path
 from ssl import SSLContext
 
 import aiohttp
 import pytest
+from aiohttp_retry import RetryClient
 
 from .utils import KubeCtl, aiohttp_client, aiohttp_get_json, aiohttp_post_json
 
+# How many users we create or validate the cached tokens of at once
+USER_PROVISIONING_CONCURRENCY = 8
 
-async def get_nonce(synapse_fqdn: str, ssl_context) -> str:
+
+async def get_nonce(synapse_fqdn: str, ssl_context, client: RetryClient | None = None) -> str:
     """
     Call Synapse for a nonce.
     """
-    response = await aiohttp_get_json(f"https://{synapse_fqdn}/_synapse/admin/v1/register", {}, ssl_context)
+    response = await aiohttp_get_json(
+        f"https://{synapse_fqdn}/_synapse/admin/v1/register", {}, ssl_context, client=client
+    )
     return response.get("nonce", "")
 
 
@@ -43,6 +51,99 @@ def generate_mac(username: str, password: str, admin: bool, registration_shared_
     return mac.hexdigest()
 
 
+async def get_valid_cached_tokens(
+    synapse_fqdn: str,
+    usernames: Iterable[str],
+    ssl_context: SSLContext,
+    pytestconfig: pytest.Config,
+    client: RetryClient | None = None,
+) -> dict[str, str]:
+    """
+    Validate the cached access tokens of the given users in one concurrent sweep.
+
+    Returns the still valid tokens keyed by username. Invalid tokens are removed from the cache.
+    """
+    semaphore = asyncio.Semaphore(USER_PROVISIONING_CONCURRENCY)
+
+    async def _validate(username: str, cached_user_token: str) -> str | None:
+        # Locally the cached token may be from a previous run but we don't know whether it is with the same DB or not
+        # We still want the caching in-case we request this for the same user multiple times in the same run
+        async with semaphore:
+            try:
+                response = await aiohttp_get_json(
+                    f"https://{synapse_fqdn}/_matrix/client/v3/account/whoami",
+                    headers={"Authorization": f"Bearer {cached_user_token}"},
+                    ssl_context=ssl_context,
+                    client=client,
+                )
+                if response["user_id"].split(":")[0] == f"@{username}":
+                    return cached_user_token
+            except aiohttp.ClientResponseError:
+                pass
+
+        pytestconfig.cache.set(f"ess-helm/cached-tokens/{username}", None)
+        # Creating the user is going to fail if this is a subsequent run against the same DB (as the user ID will
+        # exist) but the access token wasn't valid/for the correct user. Unsure how we could ever get into this state,
+        # but at least now we're succeeding in the case that this is a run against a new DB. `pytest --cache-clear`
+        # would be helpful in this scenario.
+        return None
+
+    cached_tokens = {
+        username: cached_user_token
+        for username in set(usernames)
+        if (cached_user_token := pytestconfig.cache.get(f"ess-helm/cached-tokens/{username}", None))
+    }
+    validated_tokens = await asyncio.gather(
+        *[_validate(username, cached_user_token) for username, cached_user_token in cached_tokens.items()]
+    )
+    return {username: token for username, token in zip(cached_tokens, validated_tokens, strict=True) if token}
+
+
+async def create_synapse_users(
+    synapse_fqdn: str,
+    users: Iterable[tuple[str, bool]],
+    password: str,
+    registration_shared_secret: str,
+    ssl_context: SSLContext,
+    pytestconfig: pytest.Config,
+) -> list[str]:
+    """
+    Create the (username, admin) users with shared-secret registration and return their access_tokens in order.
+
+    Users with a valid cached access token aren't recreated. Every registration needs its own
+    single-use nonce, so rather than batching requests we register with bounded concurrency.
+    """
+    users = list(users)
+    semaphore = asyncio.Semaphore(USER_PROVISIONING_CONCURRENCY)
+
+    async with aiohttp_client(ssl_context) as client:
+        tokens = await get_valid_cached_tokens(
+            synapse_fqdn, [username for username, _ in users], ssl_context, pytestconfig, client
+        )
+
+        async def _register(username: str, admin: bool) -> None:
+            async with semaphore:
+                nonce = await get_nonce(synapse_fqdn, ssl_context, client)
+                mac = generate_mac(username, password, admin, registration_shared_secret, nonce)
+                data = {
+                    "nonce": nonce,
+                    "username": username,
+                    "password": password,
+                    "admin": admin,
+                    "mac": mac,
+                }
+                response = await aiohttp_post_json(
+                    f"https://{synapse_fqdn}/_synapse/admin/v1/register", data, {}, ssl_context, client=client
+                )
+            pytestconfig.cache.set(f"ess-helm/cached-tokens/{username}", response["access_token"])
+            tokens[username] = response["access_token"]
+
+        users_to_create = {username: admin for username, admin in users if username not in tokens}
+        await asyncio.gather(*[_register(username, admin) for username, admin in users_to_create.items()])
+
+    return [tokens[username] for username, _ in users]
+
+
 async def create_synapse_user(
     synapse_fqdn: str,
     username: str,
@@ -55,38 +156,10 @@ async def create_synapse_user(
     """
     Create the user and return access_token
     """
-    cached_user_token = pytestconfig.cache.get(f"ess-helm/cached-tokens/{username}", None)
-    if cached_user_token:
-        # Locally the cached token may be from a previous run but we don't know whether it is with the same DB or not
-        # We still want the caching in-case we request this for the same user multiple times in the same run
-        try:
-            headers = {"Authorization": f"Bearer {cached_user_token}"}
-            response = await aiohttp_get_json(
-                f"https://{synapse_fqdn}/_matrix/client/v3/account/whoami", headers=headers, ssl_context=ssl_context
-            )
-            if response["user_id"].split(":")[0] == f"@{username}":
-                return cached_user_token
-        except aiohttp.ClientResponseError:
-            pass
-
-        pytestconfig.cache.set(f"ess-helm/cached-tokens/{username}", None)
-        # The below is going to fail if this is a subsequent run against the same DB (as the user ID will exist) but
-        # the access token wasn't valid/for the correct user. Unsure how we could ever get into this state, but at
-        # least now we're succeeding in the case that this is a run against a new DB. `pytest --cache-clear` would
-        # be helpful in this scenario.
-
-    nonce = await get_nonce(synapse_fqdn, ssl_context)
-    mac = generate_mac(username, password, admin, registration_shared_secret, nonce)
-    data = {
-        "nonce": nonce,
-        "username": username,
-        "password": password,
-        "admin": admin,
-        "mac": mac,
-    }
-    response = await aiohttp_post_json(f"https://{synapse_fqdn}/_synapse/admin/v1/register", data, {}, ssl_context)
-    pytestconfig.cache.set(f"ess-helm/cached-tokens/{username}", response["access_token"])
-    return response["access_token"]
+    (access_token,) = await create_synapse_users(
+        synapse_fqdn, [(username, admin)], password, registration_shared_secret, ssl_context, pytestconfig
+    )
+    return access_token
 
 
 async def upload_media(synapse_fqdn: str, user_access_token: str, file_path: Path, ssl_context: SSLContext):
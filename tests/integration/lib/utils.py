@@ -79,13 +79,25 @@ async def aiohttp_client(ssl_context: SSLContext) -> AsyncGenerator[RetryClient]
         yield client
 
 
-async def aiohttp_get_json(url: str, headers: dict, ssl_context: SSLContext) -> Any:
+@asynccontextmanager
+async def _existing_or_new_aiohttp_client(
+    client: RetryClient | None, ssl_context: SSLContext
+) -> AsyncGenerator[RetryClient]:
+    if client is not None:
+        yield client
+    else:
+        async with aiohttp_client(ssl_context) as new_client:
+            yield new_client
+
+
+async def aiohttp_get_json(url: str, headers: dict, ssl_context: SSLContext, client: RetryClient | None = None) -> Any:
     """Do an async HTTP GET against a url, retry exponentially on 429s. It expects a JSON response.
 
     Args:
         url (str): The URL to hit
         headers (dict): Any headers to add
         ssl_context (SSLContext): The SSL Context with test CA loaded
+        client (RetryClient | None): An existing client to share connections with. A new one is made if not provided
 
     Returns:
         Any: the Json dict response
@@ -95,7 +107,7 @@ async def aiohttp_get_json(url: str, headers: dict, ssl_context: SSLContext) ->
         raise ValueError(f"{url} does not have a hostname")
 
     async with (
-        aiohttp_client(ssl_context) as client,
+        _existing_or_new_aiohttp_client(client, ssl_context) as client,
         client.get(
             url.replace(host, "127.0.0.1"),
             headers=headers | {"Host": host},
@@ -105,7 +117,9 @@ async def aiohttp_get_json(url: str, headers: dict, ssl_context: SSLContext) ->
         return await response.json()
 
 
-async def aiohttp_post_json(url: str, data: dict, headers: dict, ssl_context: SSLContext) -> Any:
+async def aiohttp_post_json(
+    url: str, data: dict, headers: dict, ssl_context: SSLContext, client: RetryClient | None = None
+) -> Any:
     """Do an async HTTP POST against a url, retry exponentially on 429s. IT expects a JSON resposne.
 
     Due to synapse bootstrap, when helm has finished deploying, HAProxy can still return
@@ -116,6 +130,7 @@ async def aiohttp_post_json(url: str, data: dict, headers: dict, ssl_context: SS
         data (dict): The data to post
         headers (dict): Headers to use
         ssl_context (SSLContext): The SSL Context with test CA loaded
+        client (RetryClient | None): An existing client to share connections with. A new one is made if not provided
 
     Returns:
         Any: the Json dict response
@@ -125,7 +140,7 @@ async def aiohttp_post_json(url: str, data: dict, headers: dict, ssl_context: SS
         raise ValueError("f{url} does not have a hostname")
 
     async with (
-        aiohttp_client(ssl_context) as client,
+        _existing_or_new_aiohttp_client(client, ssl_context) as client,
         client.post(
             url.replace(host, "127.0.0.1"), headers=headers | {"Host": host}, server_hostname=host, json=data
         ) as response,
@@ -198,24 +213,3 @@ async def get_pods_matching_labels(kube_client: AsyncClient, namespace: str, lab
 
         if event in ["MODIFIED", "DELETED"] and pod_name in active_pods and pod.status.phase != "Running":
             active_pods.remove(pod_name)
-
-
-async def stream_logs_from_pod(kube_client: AsyncClient, namespace: str, pod_name: str, log_queue: asyncio.Queue):
-    async for line in kube_client.log(pod_name, namespace=namespace, follow=True, newlines=False):
-        log_queue.put_nowait(line)
-
-
-async def stream_logs_from_pods_matching_labels(
-    kube_client: AsyncClient, namespace: str, labels: dict[str, str], log_queue: asyncio.Queue
-):
-    async with asyncio.TaskGroup() as task_group:
-        async for pod_name in get_pods_matching_labels(kube_client, namespace, labels):
-            task_group.create_task(stream_logs_from_pod(kube_client, namespace, pod_name, log_queue))
-
-
-async def forward_matching_logs(input_logs_queue: asyncio.Queue, output_matchers_to_logs_queues: list):
-    while True:
-        log_line = await input_logs_queue.get()
-        for matcher, output_logs_queue in output_matchers_to_logs_queues:
-            if matcher(log_line):
-                output_logs_queue.put_nowait(log_line)
@@ -0,0 +1,203 @@
+# Copyright 2025 New Vector Ltd
+# Copyright 2025 Element Creations Ltd
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import asyncio
+import os
+from urllib.parse import quote
+
+import pyhelm3
+import pytest
+import yaml
+from lightkube import AsyncClient
+
+from .fixtures import ESSData, User
+from .lib.benchmark import (
+    MATRIX_CLIENT_FEDERATION_MIX,
+    BenchmarkRequest,
+    ScalingPoint,
+    backend_report,
+    generate_load,
+    merge_load_results,
+    requests_report,
+    scrape_haproxy_backend_metrics,
+    write_benchmark_report,
+)
+from .lib.helpers import deploy_with_values_patch
+from .lib.logs import haproxy_log_pipeline
+from .lib.utils import aiohttp_get_json, aiohttp_post_json, value_file_has
+
+benchmark_duration = float(os.environ.get("PYTEST_BENCHMARK_DURATION", "30"))
+benchmark_concurrency = int(os.environ.get("PYTEST_BENCHMARK_CONCURRENCY", "16"))
+benchmark_worker_replicas = [
+    int(replicas) for replicas in os.environ.get("PYTEST_BENCHMARK_WORKER_REPLICAS", "1,2,4").split(",")
+]
+
+# The worker types that we scale in the worker scaling benchmark
+scaled_worker_types = ["event-persister", "federation-sender", "synchrotron"]
+
+# The benchmarks share the deployment and would skew each other's results if run concurrently
+benchmark_lock = asyncio.Lock()
+
+
+@pytest.mark.skipif(os.environ.get("PYTEST_RUN_BENCHMARKS", "") != "1", reason="Benchmarks not requested")
+@pytest.mark.skipif(value_file_has("synapse.enabled", False), reason="Synapse not deployed")
+@pytest.mark.asyncio_cooperative
+async def test_haproxy_routing_load(
+    pytestconfig, ingress_ready, kube_client: AsyncClient, ssl_context, generated_data: ESSData
+):
+    await ingress_ready("synapse")
+    async with benchmark_lock:
+        await _haproxy_routing_load(pytestconfig, kube_client, ssl_context, generated_data)
+
+
+async def _haproxy_routing_load(pytestconfig, kube_client: AsyncClient, ssl_context, generated_data: ESSData):
+    # Large enough to attribute every request of a run to its backend
+    haproxy_logs = haproxy_log_pipeline(index_size=500_000)
+    haproxy_logs_streaming_task = asyncio.create_task(
+        haproxy_logs.tail_pods_matching_labels(
+            kube_client, generated_data.ess_namespace, {"app.kubernetes.io/name": "haproxy"}
+        )
+    )
+
+    metrics_before = await scrape_haproxy_backend_metrics(kube_client, generated_data)
+    result = await generate_load(
+        f"synapse.{generated_data.server_name}",
+        MATRIX_CLIENT_FEDERATION_MIX,
+        ssl_context,
+        benchmark_duration,
+        benchmark_concurrency,
+    )
+    metrics_after = await scrape_haproxy_backend_metrics(kube_client, generated_data)
+    # Give the last log lines time to make it through
+    await asyncio.sleep(2)
+    haproxy_logs_streaming_task.cancel()
+
+    report = backend_report(result, haproxy_logs, metrics_before, metrics_after)
+    report["scenario"] = {
+        "values_file": os.environ["TEST_VALUES_FILE"],
+        "concurrency": benchmark_concurrency,
+        "requests": {request.name: request.weight for request in MATRIX_CLIENT_FEDERATION_MIX},
+    }
+    report_path = write_benchmark_report("haproxy-routing", report, pytestconfig)
+    print(f"HAProxy routing benchmark report written to {report_path}")
+
+    assert result.samples, f"No requests completed. {result.errors=}"
+
+
+@pytest.mark.skipif(os.environ.get("PYTEST_RUN_BENCHMARKS", "") != "1", reason="Benchmarks not requested")
+@pytest.mark.skipif(
+    not all(value_file_has(f"synapse.workers.{worker_type}.enabled", True) for worker_type in scaled_worker_types),
+    reason="The Synapse workers to scale aren't all enabled",
+)
+@pytest.mark.parametrize("users", [tuple(User(name=f"scaling-benchmark-{index}") for index in range(8))], indirect=True)
+@pytest.mark.asyncio_cooperative
+async def test_synapse_worker_scaling(
+    pytestconfig, ingress_ready, helm_client: pyhelm3.Client, users, ssl_context, generated_data: ESSData
+):
+    synapse_fqdn = f"synapse.{generated_data.server_name}"
+
+    # Everyone is in the same room so that every event sent has to be sent down every syncing user's sync
+    room = await aiohttp_post_json(
+        f"https://{synapse_fqdn}/_matrix/client/v3/createRoom",
+        {"preset": "public_chat"},
+        {"Authorization": f"Bearer {users[0].access_token}"},
+        ssl_context,
+    )
+    room_id = quote(room["room_id"])
+    for user in users[1:]:
+        await aiohttp_post_json(
+            f"https://{synapse_fqdn}/_matrix/client/v3/join/{room_id}",
+            {},
+            {"Authorization": f"Bearer {user.access_token}"},
+            ssl_context,
+        )
+
+    async def _load_as_user(user: User):
+        headers = {"Authorization": f"Bearer {user.access_token}"}
+        # Incremental syncs go to the synchrotrons, initial syncs would go to the initial-synchrotrons
+        initial_sync = await aiohttp_get_json(
+            f"https://{synapse_fqdn}/_matrix/client/v3/sync?timeout=0", headers, ssl_context
+        )
+        since = initial_sync["next_batch"]
+        requests = [
+            BenchmarkRequest("sync", "GET", f"/_matrix/client/v3/sync?since={since}&timeout=0", weight=3),
+            BenchmarkRequest(
+                "send-event",
+                "PUT",
+                f"/_matrix/client/v3/rooms/{room_id}/send/m.room.message/{{txn_id}}",
+                json={"msgtype": "m.text", "body": "Scaling benchmark"},
+            ),
+        ]
+        return await generate_load(
+            synapse_fqdn,
+            requests,
+            ssl_context,
+            benchmark_duration,
+            max(1, benchmark_concurrency // len(users)),
+            headers=headers,
+        )
+
+    scaling: list[ScalingPoint] = []
+    async with benchmark_lock:
+        try:
+            for replicas in benchmark_worker_replicas:
+                _, error = await deploy_with_values_patch(
+                    generated_data,
+                    helm_client,
+                    _scaled_workers_patch(replicas),
+                )
+                assert error is None, f"Failed to scale {scaled_worker_types} to {replicas} replicas: {error}"
+                await ingress_ready("synapse")
+
+                result = merge_load_results(await asyncio.gather(*[_load_as_user(user) for user in users]))
+                scaling.append(
+                    {
+                        "replicas": replicas,
+                        "requests": len(result.samples),
+                        "throughput_rps": len(result.samples) / result.duration,
+                        "errors": dict(result.errors),
+                        "by_request": requests_report(result),
+                    }
+                )
+        finally:
+            # Put the deployment back to how the values file has it for any tests that follow
+            await deploy_with_values_patch(generated_data, helm_client, _scaled_workers_patch())
+
+    report = {
+        "scenario": {
+            "values_file": os.environ["TEST_VALUES_FILE"],
+            "scaled_worker_types": scaled_worker_types,
+            "users": len(users),
+            "concurrency": benchmark_concurrency,
+            "duration_seconds": benchmark_duration,
+        },
+        "scaling": scaling,
+    }
+    report_path = write_benchmark_report("synapse-worker-scaling", report, pytestconfig)
+    print(f"Synapse worker scaling benchmark report written to {report_path}")
+
+    for point in scaling:
+        assert point["by_request"].get("send-event", {}).get("successful_throughput_rps"), (
+            f"No events were sent with {point['replicas']} replicas"
+        )
+        assert point["by_request"].get("sync", {}).get("successful_throughput_rps"), (
+            f"No syncs completed with {point['replicas']} replicas"
+        )
+
+
+def _scaled_workers_patch(replicas: int | None = None) -> dict:
+    """
+    Values to scale the scaled worker types to the given replicas, or back to their replicas in the values file
+    """
+    with open(os.environ["TEST_VALUES_FILE"]) as stream:
+        workers = yaml.safe_load(stream)["synapse"]["workers"]
+    return {
+        "synapse": {
+            "workers": {
+                worker_type: {"replicas": replicas or workers[worker_type].get("replicas", 1)}
+                for worker_type in scaled_worker_types
+            }
+        }
+    }
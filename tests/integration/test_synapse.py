@@ -15,14 +15,13 @@ from lightkube import AsyncClient
 
 from .fixtures import ESSData, User
 from .lib.helpers import deploy_with_values_patch, get_deployment_marker
+from .lib.logs import haproxy_log_pipeline
 from .lib.synapse import assert_downloaded_content, download_media, upload_media
 from .lib.utils import (
     KubeCtl,
     aiohttp_client,
     aiohttp_get_json,
     aiohttp_post_json,
-    forward_matching_logs,
-    stream_logs_from_pods_matching_labels,
     value_file_has,
 )
 
@@ -119,6 +118,11 @@ async def test_routes_to_synapse_workers_correctly(
     else:
         initial_synchrotron_backend = synchrotron_backend
 
+    if value_file_has("synapse.workers.client-reader.enabled", True):
+        client_reader_backend = "client-reader/client-reader"
+    else:
+        client_reader_backend = main_backend
+
     # We don't care about any of these succeeding, only that the requests are made and HAProxy dispatches correctly
     # So no auth required and parameters can be made up
     paths_to_backends = {
@@ -133,71 +137,68 @@ async def test_routes_to_synapse_workers_correctly(
         "/_matrix/client/v3/events?from=recently": synchrotron_backend,
         # sliding-sync
         "/_matrix/client/unstable/org.matrix.simplified_msc3575/sync": sliding_sync_backend,
-        # Would be client-reader but not configured in tests
-        "/_matrix/client/versions": main_backend,
+        # client-reader
+        "/_matrix/client/versions": client_reader_backend,
     }
 
-    all_haproxy_logs: asyncio.Queue = asyncio.Queue()
+    haproxy_logs = haproxy_log_pipeline()
     haproxy_logs_streaming_task = asyncio.create_task(
-        stream_logs_from_pods_matching_labels(
-            kube_client, generated_data.ess_namespace, {"app.kubernetes.io/name": "haproxy"}, all_haproxy_logs
+        haproxy_logs.tail_pods_matching_labels(
+            kube_client, generated_data.ess_namespace, {"app.kubernetes.io/name": "haproxy"}
         )
     )
 
-    async def make_request_and_assert_backend_used(path, backend, ssl_context, logs_matching_path: asyncio.Queue):
-        attempt_ids = []
-        matching_lines = []
+    async def make_request_and_assert_backend_used(path, backend, ssl_context):
+        attempt_ids = set[str]()
+        logs_matching_path = haproxy_logs.subscribe(lambda record: record.request_id in attempt_ids)
+        expected_backend, expected_server = backend.split("/")
         attempts = 0
-        while attempts < 30:
-            attempt_id = str(uuid.uuid4())
-            attempt_ids.append(attempt_id)
-            try:
-                await aiohttp_get_json(
-                    f"https://synapse.{generated_data.server_name}{path}", {"User-agent": attempt_id}, ssl_context
-                )
-            except aiohttp.ClientResponseError as e:
-                # We can't use pytest.raises as no exception (200) is valid
-                assert e.status in [401, 405], f"{path} had an unexpected status. {e=}"  # noqa P1017
-
-            while True:
-                # Given we've made at least one request, we know there should be something here and we can block for it
-                # However sometimes it appears that logs aren't emitted from HAProxy so don't block indefinitely
+        try:
+            while attempts < 30:
+                attempt_id = str(uuid.uuid4())
+                attempt_ids.add(attempt_id)
                 try:
-                    log_line = await asyncio.wait_for(logs_matching_path.get(), timeout=1.0)
-                except TimeoutError:
-                    print(f"No HAProxy logs relating to {path} emitted after 1s. Retrying")
-                    break
-
-                # Save off lines from any run we encounter, not just the current one
-                if any([id in log_line for id in attempt_ids]):
-                    matching_lines.append(log_line)
-
-                if attempt_id in log_line:
-                    if f"synapse-http-in synapse-{backend}" in log_line:
+                    await aiohttp_get_json(
+                        f"https://synapse.{generated_data.server_name}{path}", {"User-agent": attempt_id}, ssl_context
+                    )
+                except aiohttp.ClientResponseError as e:
+                    # We can't use pytest.raises as no exception (200) is valid
+                    assert e.status in [401, 405], f"{path} had an unexpected status. {e=}"  # noqa P1017
+
+                while True:
+                    # Given we've made at least one request, we know there should be something here and we can block
+                    # However sometimes it appears that logs aren't emitted from HAProxy so don't block indefinitely
+                    try:
+                        record = await logs_matching_path.get(timeout=1.0)
+                    except TimeoutError:
+                        print(f"No HAProxy logs relating to {path} emitted after 1s. Retrying")
+                        break
+
+                    if (
+                        record.frontend == "synapse-http-in"
+                        and record.backend == f"synapse-{expected_backend}"
+                        and record.server.startswith(expected_server)
+                    ):
                         return
                     else:
-                        print(f"Request for {path} routed elsewhere: {log_line}")
+                        print(f"Request for {path} routed elsewhere: {record.raw}")
+
+                attempts += 1
+                await asyncio.sleep(1)
+        finally:
+            haproxy_logs.unsubscribe(logs_matching_path)
 
-            attempts += 1
-            await asyncio.sleep(1)
+        matching_lines = [record.raw for attempt_id in attempt_ids for record in haproxy_logs.records_for(attempt_id)]
         raise AssertionError(
             f"Requests to {path} did not end up at synapse-{backend} over 30s/attempts. "
             f"Log lines={'\n*'.join(matching_lines)}"
         )
 
     async with asyncio.TaskGroup() as task_group:
-        path_matchers_and_log_queues = []
         for path, backend in paths_to_backends.items():
-            logs_matching_path: asyncio.Queue = asyncio.Queue()
-            path_matchers_and_log_queues.append((lambda log_line, path=path: path in log_line, logs_matching_path))
-            task_group.create_task(make_request_and_assert_backend_used(path, backend, ssl_context, logs_matching_path))
-
-        forward_matching_logs_task = asyncio.create_task(
-            forward_matching_logs(all_haproxy_logs, path_matchers_and_log_queues)
-        )
+            task_group.create_task(make_request_and_assert_backend_used(path, backend, ssl_context))
 
     haproxy_logs_streaming_task.cancel()
-    forward_matching_logs_task.cancel()
 
 
 @pytest.mark.skipif(value_file_has("synapse.enabled", False), reason="Synapse not deployed")
@@ -245,6 +246,49 @@ async def test_synapse_media_upload_fetch_authenticated(
     )
 
 
+@pytest.mark.skipif(value_file_has("synapse.media.s3.enabled", False), reason="Synapse media not stored in S3")
+@pytest.mark.parametrize("users", [(User(name="media-upload-s3"),)], indirect=True)
+@pytest.mark.asyncio_cooperative
+async def test_synapse_media_fetched_from_s3(
+    cluster,
+    ssl_context,
+    users,
+    generated_data: ESSData,
+):
+    user_access_token = users[0].access_token
+
+    filepath = Path(__file__).parent.resolve() / Path("artifacts/files/minimal.png")
+    with open(filepath, "rb") as file:
+        source_sha256 = hashlib.file_digest(file, "sha256").hexdigest()
+
+    content_upload_json = await upload_media(
+        synapse_fqdn=f"synapse.{generated_data.server_name}",
+        user_access_token=user_access_token,
+        file_path=filepath,
+        ssl_context=ssl_context,
+    )
+
+    # Remove the media from the local media store so that it can only come from the object store
+    media_pod_suffix = (
+        "synapse-media-repo-0" if value_file_has("synapse.workers.media-repository.enabled", True) else "synapse-main-0"
+    )
+    content_id = content_upload_json["content_uri"].replace(f"mxc://{generated_data.server_name}/", "")
+    await KubeCtl(cluster).exec(
+        f"{generated_data.release_name}-{media_pod_suffix}",
+        generated_data.ess_namespace,
+        ["rm", f"/media/media_store/local_content/{content_id[0:2]}/{content_id[2:4]}/{content_id[4:]}"],
+    )
+
+    content_download_sha256 = await download_media(
+        server_name=generated_data.server_name,
+        user_access_token=user_access_token,
+        synapse_fqdn=f"synapse.{generated_data.server_name}",
+        content_upload_json=content_upload_json,
+        ssl_context=ssl_context,
+    )
+    assert source_sha256 == content_download_sha256
+
+
 @pytest.mark.skipif(value_file_has("synapse.enabled", False), reason="Synapse not deployed")
 @pytest.mark.asyncio_cooperative
 async def test_rendezvous_cors_headers_are_only_set_with_mas(ingress_ready, generated_data: ESSData, ssl_context):
@@ -11,6 +11,7 @@ from typing import Any
 
 class PropertyType(Enum):
     AdditionalConfig = "additional"
+    Autoscaling = "autoscaling"
     Enabled = "enabled"
     Env = "extraEnv"
     HostAliases = "hostAliases"
@@ -19,11 +20,13 @@ class PropertyType(Enum):
     Labels = "labels"
     LivenessProbe = "livenessProbe"
     NodeSelector = "nodeSelector"
+    PodDisruptionBudget = "podDisruptionBudget"
     PodSecurityContext = "podSecurityContext"
     Postgres = "postgres"
     Replicas = "replicas"
     ReadinessProbe = "readinessProbe"
     Resources = "resources"
+    RollingUpdate = "rollingUpdate"
     StartupProbe = "startupProbe"
     ServiceAccount = "serviceAccount"
     ServiceMonitor = "serviceMonitors"
@@ -103,6 +106,7 @@ class DeployableDetails(abc.ABC):
     has_automount_service_account_token: bool = field(default=False, hash=False)
     has_workloads: bool = field(default=True, hash=False)
     has_replicas: bool = field(default=None, hash=False)  # type: ignore[assignment]
+    has_autoscaling: bool = field(default=False, hash=False)
     requires_one_by_one_rollout: bool = field(default=False, hash=False)
     has_service_monitor: bool = field(default=None, hash=False)  # type: ignore[assignment]
     has_storage: bool = field(default=False, hash=False)
@@ -374,7 +378,8 @@ def make_synapse_worker_sub_component(worker_name: str, worker_type: str) -> Sub
         values_file_path_overrides=values_file_path_overrides,
         has_ingress=False,
         is_synapse_process=True,
-        has_replicas=(worker_type == "scalable"),
+        has_replicas=(worker_type in ["scalable", "autoscalable"]),
+        has_autoscaling=(worker_type == "autoscalable"),
         ignore_unreferenced_mounts={"synapse": ("/tmp",)},
         content_volumes_mapping={
             "/media": ("media_store",),
@@ -388,23 +393,23 @@ synapse_workers_details = tuple(
         "account-data": "single",
         "appservice": "single",
         "background": "single",
-        "client-reader": "scalable",
+        "client-reader": "autoscalable",
         "device-lists": "scalable",
         "encryption": "single",
-        "event-creator": "scalable",
+        "event-creator": "autoscalable",
         "event-persister": "scalable",
-        "federation-inbound": "scalable",
-        "federation-reader": "scalable",
+        "federation-inbound": "autoscalable",
+        "federation-reader": "autoscalable",
         "federation-sender": "scalable",
-        "initial-synchrotron": "scalable",
-        "media-repository": "single",
+        "initial-synchrotron": "autoscalable",
+        "media-repository": "scalable",
         "presence-writer": "single",
         "push-rules": "single",
         "pusher": "scalable",
         "receipts": "scalable",
-        "sliding-sync": "scalable",
+        "sliding-sync": "autoscalable",
         "sso-login": "single",
-        "synchrotron": "scalable",
+        "synchrotron": "autoscalable",
         "typing-persister": "single",
         "user-dir": "single",
     }.items()
@@ -487,6 +492,33 @@ all_components_details = [
                 makes_outbound_requests=False,
             ),
         ),
+        sub_components=(
+            SubComponentDetails(
+                name="postgres-pgbouncer",
+                values_file_path=ValuesFilePath.read_write("postgres", "pgbouncer"),
+                has_additional_config=False,
+                has_ingress=False,
+                has_replicas=False,
+                makes_outbound_requests=False,
+                sidecars=(
+                    SidecarDetails(
+                        name="pgbouncer-exporter",
+                        values_file_path=ValuesFilePath.read_write("postgres", "pgbouncer", "pgbouncerExporter"),
+                        values_file_path_overrides={
+                            # No manifests of its own, so no labels to set
+                            PropertyType.Labels: ValuesFilePath.not_supported(),
+                        },
+                        has_additional_config=False,
+                        has_ingress=False,
+                        has_service_monitor=False,
+                        makes_outbound_requests=False,
+                    ),
+                ),
+                content_volumes_mapping={
+                    "/userlist": ("userlist.txt",),
+                },
+            ),
+        ),
         is_shared_component=True,
         makes_outbound_requests=False,
         content_volumes_mapping={
@@ -509,7 +541,6 @@ all_components_details = [
                 name="matrix-rtc-sfu",
                 values_file_path=ValuesFilePath.read_write("matrixRTC", "sfu"),
                 has_ingress=False,
-                has_replicas=False,
                 makes_outbound_requests=False,
             ),
         ),
@@ -694,6 +725,8 @@ all_deployables_details = _get_all_deployables_details()
 
 _extra_values_files_to_test: list[str] = [
     "example-default-enabled-components-values.yaml",
+    "postgres-pgbouncer-values.yaml",
+    "matrix-authentication-service-synapse-via-haproxy-values.yaml",
     "matrix-authentication-service-synapse-syn2mas-dry-run-secrets-in-helm-values.yaml",
     "matrix-authentication-service-synapse-syn2mas-dry-run-secrets-externally-values.yaml",
     "matrix-authentication-service-synapse-syn2mas-migrate-secrets-in-helm-values.yaml",
@@ -55,3 +55,38 @@ async def test_config_json_override(values, make_templates):
             break
     else:
         raise RuntimeError("Could not find config.json")
+
+
+@pytest.mark.parametrize("values_file", ["element-web-minimal-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_nginx_tuning(release_name, values, make_templates):
+    def nginx_config(templates):
+        for template in templates:
+            if template["kind"] == "ConfigMap" and template["metadata"]["name"] == f"{release_name}-element-web-nginx":
+                return template["data"]["default.conf"]
+        raise RuntimeError("Could not find default.conf")
+
+    default_conf = nginx_config(await make_templates(values))
+    assert "sendfile on;" in default_conf
+    assert "tcp_nopush on;" in default_conf
+    assert "gzip_static on;" in default_conf
+    assert "open_file_cache max=1000 inactive=60s;" in default_conf
+    assert (
+        "location /bundles/ {\n"
+        '      add_header Cache-Control "public, max-age=31536000, immutable";\n'
+        "      include /etc/nginx/security_headers.conf;\n"
+        "  }"
+    ) in default_conf
+
+    values["elementWeb"]["nginx"] = {
+        "immutableBundles": False,
+        "gzip": False,
+        "sendfile": False,
+        "openFileCache": {"maxFiles": 0},
+    }
+    default_conf = nginx_config(await make_templates(values))
+    assert "sendfile" not in default_conf
+    assert "gzip" not in default_conf
+    assert "open_file_cache" not in default_conf
+    assert "/bundles/" not in default_conf
+    assert "max-age=31536000" not in default_conf
@@ -6,6 +6,8 @@
 import re
 
 import pytest
+import yaml
+from pyhelm3.errors import FailedToRenderChartError
 
 from . import values_files_to_test
 from .utils import template_id, template_to_deployable_details
@@ -79,3 +81,259 @@ async def test_haproxy_config_ends_in_2_newlines(templates):
     assert haproxy_configmap["data"]["haproxy.cfg"].endswith("\n\n"), (
         f"{template_id(haproxy_configmap)}/haproxy.cfg should end with at least 2 \\n"
     )
+
+
+def haproxy_config(release_name, templates):
+    for template in templates:
+        if template["kind"] == "ConfigMap" and template["metadata"]["name"] == f"{release_name}-haproxy":
+            return template["data"]["haproxy.cfg"]
+    raise RuntimeError("Could not find HAProxy ConfigMap")
+
+
+def haproxy_config_section(release_name, templates, section_name):
+    for template in templates:
+        if template["kind"] == "ConfigMap" and template["metadata"]["name"] == f"{release_name}-haproxy":
+            section = {}
+            in_section = False
+            for line in template["data"]["haproxy.cfg"].splitlines():
+                if line and not line.startswith(" "):
+                    in_section = line.strip() == section_name
+                elif in_section and line.strip() and not line.strip().startswith("#"):
+                    key, _, value = line.strip().partition(" ")
+                    section[key] = value
+            return section
+    raise RuntimeError("Could not find HAProxy ConfigMap")
+
+
+@pytest.mark.parametrize("values_file", ["synapse-minimal-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_haproxy_global_tuning_derived_from_resources(release_name, values, make_templates):
+    global_section = haproxy_config_section(release_name, await make_templates(values), "global")
+    assert "nbthread" not in global_section
+    assert "maxconn" not in global_section
+    assert "tune.bufsize" not in global_section
+    assert "tune.http.maxhdr" not in global_section
+
+    values.setdefault("haproxy", {})["resources"] = {"limits": {"cpu": "1500m", "memory": "1G"}}
+    values["haproxy"]["bufferSizeBytes"] = 32768
+    global_section = haproxy_config_section(release_name, await make_templates(values), "global")
+    assert global_section["nbthread"] == "2"
+    # The memory limit doesn't cap connections, as these include long-polling /sync requests
+    assert "maxconn" not in global_section
+    assert global_section["tune.bufsize"] == "32768"
+
+    values["haproxy"]["resources"] = {"limits": None}
+    global_section = haproxy_config_section(release_name, await make_templates(values), "global")
+    assert "nbthread" not in global_section
+
+
+@pytest.mark.parametrize("values_file", ["synapse-minimal-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_haproxy_global_tuning_overrides(release_name, values, make_templates):
+    values.setdefault("haproxy", {}).update({"threads": 4, "maxConnections": 10000, "maxHeaders": 200})
+    global_section = haproxy_config_section(release_name, await make_templates(values), "global")
+    assert global_section["nbthread"] == "4"
+    assert "cpu-map" not in global_section
+    assert global_section["maxconn"] == "10000"
+    assert global_section["tune.http.maxhdr"] == "200"
+
+
+@pytest.mark.parametrize("values_file", ["synapse-minimal-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_synapse_haproxy_backends_can_be_tuned_per_process(release_name, values, make_templates):
+    values["synapse"].setdefault("workers", {}).update(
+        {
+            "synchrotron": {"enabled": True},
+            "federation-reader": {"enabled": True},
+            "media-repository": {"enabled": True},
+        }
+    )
+    templates = await make_templates(values)
+    main_backend = haproxy_config_section(release_name, templates, "backend synapse-main")
+    assert main_backend["default-server"] == "maxconn 250"
+    assert "timeout" not in main_backend
+
+    synchrotron_backend = haproxy_config_section(release_name, templates, "backend synapse-synchrotron")
+    assert synchrotron_backend["balance"] == "hdr(X-Matrix-User)"
+    assert synchrotron_backend["timeout"] == "queue 5s"
+    assert synchrotron_backend["default-server"] == "maxconn 2000"
+
+    federation_reader_backend = haproxy_config_section(release_name, templates, "backend synapse-federation-reader")
+    assert federation_reader_backend["balance"] == "uri whole"
+
+    media_repository_backend = haproxy_config_section(release_name, templates, "backend synapse-media-repository")
+    assert media_repository_backend["balance"] == "hdr(X-Matrix-Media)"
+    assert "default-server" not in media_repository_backend
+
+    values["synapse"]["haproxyBackend"] = {"maxConnections": 100, "queueTimeout": "10s"}
+    values["synapse"]["workers"]["synchrotron"]["haproxyBackend"] = {"balance": "leastconn", "queueTimeout": "1s"}
+    values["synapse"]["workers"]["federation-reader"]["haproxyBackend"] = {"healthCheckInterval": "5s"}
+    values["synapse"]["workers"]["media-repository"]["haproxyBackend"] = {
+        "maxConnections": 1000,
+        "healthCheckInterval": "10s",
+    }
+    templates = await make_templates(values)
+    main_backend = haproxy_config_section(release_name, templates, "backend synapse-main")
+    assert main_backend["default-server"] == "maxconn 100"
+    assert main_backend["timeout"] == "queue 10s"
+
+    synchrotron_backend = haproxy_config_section(release_name, templates, "backend synapse-synchrotron")
+    assert synchrotron_backend["balance"] == "leastconn"
+    assert synchrotron_backend["timeout"] == "queue 1s"
+    assert synchrotron_backend["default-server"] == "maxconn 2000"
+
+    federation_reader_backend = haproxy_config_section(release_name, templates, "backend synapse-federation-reader")
+    assert federation_reader_backend["balance"] == "uri whole"
+    assert federation_reader_backend["default-server"] == "inter 5s"
+
+    media_repository_backend = haproxy_config_section(release_name, templates, "backend synapse-media-repository")
+    assert media_repository_backend["default-server"] == "maxconn 1000 inter 10s"
+
+
+@pytest.mark.parametrize("values_file", ["synapse-minimal-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_synapse_haproxy_backends_balancing(release_name, values, make_templates):
+    values["synapse"].setdefault("workers", {}).update(
+        {
+            "event-creator": {"enabled": True},
+            "initial-synchrotron": {"enabled": True},
+            "media-repository": {"enabled": True},
+            "sliding-sync": {"enabled": True},
+            "synchrotron": {"enabled": True},
+        }
+    )
+    templates = await make_templates(values)
+    config = haproxy_config(release_name, templates)
+    assert (
+        "set-var(req.matrix_user) var(req.access_token),field(-3,_,0) if { var(req.access_token) -m beg syt_ }"
+        in config
+    )
+    assert "http-request set-header X-Matrix-User %[var(req.matrix_user)]" in config
+
+    for worker_type in ["initial-synchrotron", "sliding-sync", "synchrotron"]:
+        backend = haproxy_config_section(release_name, templates, f"backend synapse-{worker_type}")
+        assert backend["balance"] == "hdr(X-Matrix-User)", f"{worker_type} isn't balanced on the user"
+    assert (
+        haproxy_config_section(release_name, templates, "backend synapse-event-creator")["balance"]
+        == "hdr(X-Matrix-Room)"
+    )
+    assert (
+        haproxy_config_section(release_name, templates, "backend synapse-media-repository")["balance"]
+        == "hdr(X-Matrix-Media)"
+    )
+    assert "http-request set-header X-Matrix-Media %[path] if { path -m reg /(download|thumbnail)/ }" in config
+
+    # Matrix Authentication Service's access tokens don't include the user
+    values.setdefault("matrixAuthenticationService", {}).update(
+        {"enabled": True, "ingress": {"host": "mas.ess.localhost"}}
+    )
+    templates = await make_templates(values)
+    for worker_type in ["initial-synchrotron", "sliding-sync", "synchrotron"]:
+        backend = haproxy_config_section(release_name, templates, f"backend synapse-{worker_type}")
+        assert backend["balance"] == "hdr(X-Access-Token)", f"{worker_type} isn't balanced on the access token"
+
+    values["matrixAuthenticationService"]["enabled"] = False
+    values["synapse"]["workers"]["synchrotron"]["haproxyBackend"] = {"balance": "hdr(X-Access-Token)"}
+    values["synapse"]["workers"]["event-creator"]["haproxyBackend"] = {"balance": "hdr(X-Matrix-User)"}
+    templates = await make_templates(values)
+    assert (
+        haproxy_config_section(release_name, templates, "backend synapse-synchrotron")["balance"]
+        == "hdr(X-Access-Token)"
+    )
+    assert (
+        haproxy_config_section(release_name, templates, "backend synapse-sliding-sync")["balance"]
+        == "hdr(X-Matrix-User)"
+    )
+    assert (
+        haproxy_config_section(release_name, templates, "backend synapse-event-creator")["balance"]
+        == "hdr(X-Matrix-User)"
+    )
+
+
+@pytest.mark.parametrize("values_file", ["synapse-minimal-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_haproxy_cache(release_name, values, make_templates):
+    templates = await make_templates(values)
+    assert haproxy_config_section(release_name, templates, "cache ess") == {}
+    assert "filter" not in haproxy_config_section(release_name, templates, "frontend synapse-http-in")
+
+    values.setdefault("haproxy", {})["cache"] = {"enabled": True, "totalMaxSizeMB": 32, "maxAgeSeconds": 30}
+    templates = await make_templates(values)
+    assert haproxy_config_section(release_name, templates, "cache ess") == {
+        "total-max-size": "32",
+        "max-age": "30",
+    }
+
+    config = haproxy_config(release_name, templates)
+    assert "filter cache ess\n  filter compression\n" in config
+    assert "acl cacheable_path path /_matrix/client/versions" in config
+    assert "thumbnail" not in config
+    assert "http-request cache-use ess if { var(txn.cacheable) -m bool }" in config
+    assert "http-response cache-store ess if { var(txn.cacheable) -m bool }" in config
+    assert 'set-header Cache-Control "public, max-age=30"' in config
+
+    values["haproxy"]["cache"]["thumbnails"] = True
+    values["haproxy"]["cache"]["maxObjectSizeBytes"] = 262144
+    templates = await make_templates(values)
+    assert haproxy_config_section(release_name, templates, "cache ess")["max-object-size"] == "262144"
+    config = haproxy_config(release_name, templates)
+    assert "acl cacheable_path path_beg /_matrix/media/r0/thumbnail/ /_matrix/media/v3/thumbnail/" in config
+
+    values["haproxy"]["cache"]["maxObjectSizeBytes"] = 16 * 1024 * 1024
+    with pytest.raises(FailedToRenderChartError, match="maxObjectSizeBytes must be less than half"):
+        await make_templates(values)
+
+    values["haproxy"]["cache"]["maxObjectSizeBytes"] = None
+    values["haproxy"]["cache"]["totalMaxSizeMB"] = 200
+    with pytest.raises(FailedToRenderChartError, match="totalMaxSizeMB \\(200\\) must be less than"):
+        await make_templates(values)
+
+
+@pytest.mark.parametrize("values_file", ["well-known-minimal-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_haproxy_cache_well_known_cache_control(release_name, values, make_templates):
+    assert "Cache-Control" not in haproxy_config(release_name, await make_templates(values))
+
+    values.setdefault("haproxy", {})["cache"] = {"enabled": True}
+    assert 'http-after-response set-header Cache-Control "public, max-age=60" if { status 200 }' in haproxy_config(
+        release_name, await make_templates(values)
+    )
+
+
+@pytest.mark.parametrize("values_file", ["synapse-minimal-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_haproxy_balances_synapse_requests_to_matrix_authentication_service(release_name, values, make_templates):
+    values["matrixAuthenticationService"] = {"enabled": True, "ingress": {"host": "mas.ess.localhost"}, "replicas": 3}
+
+    def synapse_mas_endpoint(templates):
+        for template in templates:
+            if template["kind"] == "ConfigMap" and template["metadata"]["name"] == f"{release_name}-synapse":
+                config = yaml.safe_load(template["data"]["04-homeserver-overrides.yaml"])
+                return config["matrix_authentication_service"]["endpoint"]
+        raise RuntimeError("Could not find Synapse ConfigMap")
+
+    templates = await make_templates(values)
+    assert synapse_mas_endpoint(templates).startswith(f"http://{release_name}-matrix-authentication-service.")
+    assert "matrix-authentication-service" not in haproxy_config(release_name, templates)
+
+    values["matrixAuthenticationService"]["synapseViaHAProxy"] = {"enabled": True, "maxConnections": 20}
+    templates = await make_templates(values)
+    assert synapse_mas_endpoint(templates).startswith(f"http://{release_name}-haproxy.")
+    assert synapse_mas_endpoint(templates).endswith(":8011/")
+
+    backend = haproxy_config_section(release_name, templates, "backend matrix-authentication-service")
+    assert backend["balance"] == "leastconn"
+    assert backend["default-server"] == "maxconn 20"
+    assert backend["http-check"] == "send meth GET uri /health"
+    assert backend["server-template"].startswith(f"mas 3 _http._tcp.{release_name}-matrix-authentication-service-srv.")
+    assert "http-check connect port 8081" in haproxy_config(release_name, templates)
+
+    services = {template["metadata"]["name"]: template for template in templates if template["kind"] == "Service"}
+    assert services[f"{release_name}-matrix-authentication-service-srv"]["spec"]["clusterIP"] == "None"
+    assert {"name": "haproxy-mas", "port": 8011, "targetPort": "haproxy-mas"} in services[f"{release_name}-haproxy"][
+        "spec"
+    ]["ports"]
+
+    values["synapse"]["enabled"] = False
+    with pytest.raises(FailedToRenderChartError, match="synapseViaHAProxy.enabled=true requires synapse.enabled=true"):
+        await make_templates(values)
@@ -4,6 +4,8 @@
 # SPDX-License-Identifier: AGPL-3.0-only
 
 import pytest
+import yaml
+from pyhelm3.errors import FailedToRenderChartError
 
 
 @pytest.mark.parametrize("values_file", ["matrix-authentication-service-minimal-values.yaml"])
@@ -30,3 +32,49 @@ async def test_matrix_authentication_service_env_overrides(values, make_template
             break
     else:
         raise RuntimeError("Could not find Matrix Authentication Service deployment")
+
+
+@pytest.mark.parametrize("values_file", ["matrix-authentication-service-minimal-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_matrix_authentication_service_replicas(values, make_templates, release_name):
+    values["matrixAuthenticationService"]["replicas"] = 3
+    values["matrixAuthenticationService"]["podDisruptionBudget"] = {"enabled": True}
+    values["matrixAuthenticationService"]["databasePool"] = {"minConnections": 2, "maxConnections": 20}
+
+    templates = {
+        (template["kind"], template["metadata"]["name"]): template for template in await make_templates(values)
+    }
+    name = f"{release_name}-matrix-authentication-service"
+    deployment = templates[("Deployment", name)]
+    assert deployment["spec"]["replicas"] == 3
+    assert deployment["spec"]["strategy"]["rollingUpdate"]["maxSurge"] == 0
+    container = deployment["spec"]["template"]["spec"]["containers"][0]
+    assert container["readinessProbe"]["httpGet"] == {"path": "/health", "port": "internal", "scheme": "HTTP"}
+    assert {"containerPort": 8081, "protocol": "TCP", "name": "internal"} in container["ports"]
+
+    pdb = templates[("PodDisruptionBudget", name)]
+    assert pdb["spec"]["selector"]["matchLabels"] == deployment["spec"]["selector"]["matchLabels"]
+    assert pdb["spec"]["maxUnavailable"] == 1
+
+    config = yaml.safe_load(templates[("ConfigMap", name)]["data"]["mas-config-overrides.yaml"])
+    assert config["database"]["min_connections"] == 2
+    assert config["database"]["max_connections"] == 20
+
+    values["matrixAuthenticationService"]["databasePool"]["minConnections"] = 21
+    with pytest.raises(FailedToRenderChartError, match="minConnections \\(21\\) must not be greater"):
+        await make_templates(values)
+    values["matrixAuthenticationService"]["databasePool"]["minConnections"] = 2
+
+    # 3 replicas * 20 connections, with 4 connections reserved
+    values.setdefault("postgres", {}).setdefault("resources", {})["limits"] = {"memory": "1024Mi"}
+    await make_templates(values)
+    values["postgres"]["resources"]["limits"] = {"memory": "1008Mi"}
+    with pytest.raises(FailedToRenderChartError, match="need up to 60 connections but Postgres only allows 59"):
+        await make_templates(values)
+
+    values["postgres"]["resources"]["limits"] = {"memory": "4Gi"}
+    values["postgres"]["pgbouncer"] = {"enabled": True}
+    with pytest.raises(FailedToRenderChartError, match="matrixAuthenticationServicePoolSize is 10 and uses session"):
+        await make_templates(values)
+    values["postgres"]["pgbouncer"]["matrixAuthenticationServicePoolSize"] = 60
+    await make_templates(values)
@@ -5,6 +5,7 @@
 
 import pytest
 import yaml
+from pyhelm3.errors import FailedToRenderChartError
 
 from .utils import template_id
 
@@ -89,3 +90,112 @@ async def test_udp_range_services_are_sharded(values, make_templates):
     assert_sharded_udp_range_ports(start_port + 250, start_port + 499, services[1])
     assert_sharded_udp_range_ports(start_port + 500, start_port + 749, services[2])
     assert_sharded_udp_range_ports(start_port + 750, start_port + 999, services[3])
+
+
+def sfu_config_overrides(release_name, templates):
+    for template in templates:
+        if template["kind"] == "ConfigMap" and template["metadata"]["name"] == f"{release_name}-matrix-rtc-sfu":
+            return yaml.safe_load(template["data"]["config-overrides.yaml"])
+    raise RuntimeError("Could not find SFU ConfigMap")
+
+
+@pytest.mark.parametrize("values_file", ["matrix-rtc-minimal-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_sfu_replicas(values, make_templates, release_name):
+    assert "redis" not in sfu_config_overrides(release_name, await make_templates(values))
+
+    values["matrixRTC"]["sfu"] = {"replicas": 3}
+    with pytest.raises(FailedToRenderChartError, match="requires matrixRTC.sfu.redis.address"):
+        await make_templates(values)
+
+    values["matrixRTC"]["sfu"]["redis"] = {"address": "redis.example.com:6379"}
+    with pytest.raises(FailedToRenderChartError, match="exposedServices.rtcMuxedUdp.portType=HostPort"):
+        await make_templates(values)
+
+    values["matrixRTC"]["sfu"]["exposedServices"] = {
+        "rtcTcp": {"portType": "HostPort"},
+        "rtcMuxedUdp": {"portType": "HostPort"},
+    }
+    templates = await make_templates(values)
+    deployment = next(
+        template
+        for template in templates
+        if template["kind"] == "Deployment" and template["metadata"]["name"] == f"{release_name}-matrix-rtc-sfu"
+    )
+    assert deployment["spec"]["replicas"] == 3
+    ports = {port["name"]: port for port in deployment["spec"]["template"]["spec"]["containers"][0]["ports"]}
+    assert ports["rtc-tcp"]["hostPort"] == 30881
+    assert ports["rtc-muxed-udp"]["hostPort"] == 30882
+    assert "hostPort" not in ports["http"]
+    assert not [template for template in templates if template["kind"] == "Service" and "NodePort" in str(template)]
+    assert sfu_config_overrides(release_name, templates)["redis"] == {"address": "redis.example.com:6379", "db": 1}
+
+    values["matrixRTC"]["sfu"]["manualIP"] = "198.51.100.2"
+    with pytest.raises(FailedToRenderChartError, match="can't be used with matrixRTC.sfu.manualIP"):
+        await make_templates(values)
+    values["matrixRTC"]["sfu"]["manualIP"] = ""
+
+    # Synapse's Redis evicts keys when it is full so isn't used even when Synapse has workers
+    values["matrixRTC"]["sfu"]["redis"] = {"db": 2}
+    values["serverName"] = "ess.localhost"
+    values["synapse"] = {
+        "enabled": True,
+        "ingress": {"host": "synapse.ess.localhost"},
+        "workers": {"client-reader": {"enabled": True}},
+    }
+    with pytest.raises(FailedToRenderChartError, match="requires matrixRTC.sfu.redis.address"):
+        await make_templates(values)
+
+
+@pytest.mark.parametrize("values_file", ["matrix-rtc-minimal-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_sfu_media_tuning(values, make_templates, release_name):
+    def sfu_init_containers(templates):
+        for template in templates:
+            if template["kind"] == "Deployment" and template["metadata"]["name"] == f"{release_name}-matrix-rtc-sfu":
+                init_containers = template["spec"]["template"]["spec"]["initContainers"]
+                return {container["name"]: container for container in init_containers}
+        raise RuntimeError("Could not find SFU Deployment")
+
+    templates = await make_templates(values)
+    rtc = sfu_config_overrides(release_name, templates)["rtc"]
+    assert rtc["use_ice_lite"] is False
+    assert rtc["congestion_control"] == {"enabled": True, "allow_pause": False}
+    assert "packet_buffer_size_video" not in rtc
+    assert "packet_buffer_size_audio" not in rtc
+    assert "udp-buffers" not in sfu_init_containers(templates)
+
+    values["matrixRTC"]["sfu"] = {
+        "useIceLite": True,
+        "congestionControl": {"allowPause": True},
+        "packetBufferSizeVideo": 1000,
+        "packetBufferSizeAudio": 400,
+        "udpBuffers": {"enabled": True, "receiveMaxBytes": 8388608},
+    }
+    with pytest.raises(FailedToRenderChartError, match="udpBuffers.enabled=true requires matrixRTC.sfu.hostNetwork"):
+        await make_templates(values)
+
+    values["matrixRTC"]["sfu"]["hostNetwork"] = True
+    templates = await make_templates(values)
+    rtc = sfu_config_overrides(release_name, templates)["rtc"]
+    assert rtc["use_ice_lite"] is True
+    assert rtc["congestion_control"] == {"enabled": True, "allow_pause": True}
+    assert rtc["packet_buffer_size_video"] == 1000
+    assert rtc["packet_buffer_size_audio"] == 400
+    udp_buffers = sfu_init_containers(templates)["udp-buffers"]
+    assert list(udp_buffers["command"]) == ["sysctl", "-w", "net.core.rmem_max=8388608", "net.core.wmem_max=5000000"]
+    assert udp_buffers["securityContext"]["privileged"] is True
+    assert udp_buffers["image"].startswith("docker.io/livekit/livekit-server:")
+
+    # 31000 to 32000 is 1001 ports, enough for 500 participants with 2 ports each
+    values["matrixRTC"]["sfu"]["exposedServices"] = {"rtcUdp": {"enabled": True}}
+    values["matrixRTC"]["sfu"]["expectedParticipants"] = 500
+    await make_templates(values)
+
+    values["matrixRTC"]["sfu"]["expectedParticipants"] = 501
+    with pytest.raises(FailedToRenderChartError, match="1001 ports but 501 expected participants need at least 1002"):
+        await make_templates(values)
+
+    values["matrixRTC"]["sfu"]["exposedServices"]["rtcUdp"]["portRange"] = {"startPort": 32000, "endPort": 31000}
+    with pytest.raises(FailedToRenderChartError, match="endPort must not be less than its startPort"):
+        await make_templates(values)
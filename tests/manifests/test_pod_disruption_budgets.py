@@ -0,0 +1,80 @@
+# Copyright 2025 New Vector Ltd
+# Copyright 2025 Element Creations Ltd
+#
+# SPDX-License-Identifier: AGPL-3.0-only
+
+from typing import Any
+
+import pytest
+
+from . import DeployableDetails, PropertyType, values_files_to_test
+from .utils import (
+    assert_covers_expected_workloads,
+    find_workload_ids_matching_selector,
+    iterate_deployables_parts,
+    template_id,
+    template_to_deployable_details,
+)
+
+
+@pytest.mark.parametrize("values_file", values_files_to_test)
+@pytest.mark.asyncio_cooperative
+async def test_no_pod_disruption_budgets_by_default(templates):
+    for template in templates:
+        assert template["kind"] != "PodDisruptionBudget", f"{template_id(template)} is present by default"
+
+
+@pytest.mark.parametrize("values_file", values_files_to_test)
+@pytest.mark.asyncio_cooperative
+async def test_pod_disruption_budgets_cover_scalable_workloads(values, make_templates):
+    def workload_ids_covered_by_pod_disruption_budget(
+        pod_disruption_budget_template: dict[str, Any], templates_by_kind: dict[str, list[dict[str, Any]]]
+    ):
+        return find_workload_ids_matching_selector(
+            templates_by_kind.get("Deployment", []) + templates_by_kind.get("StatefulSet", []),
+            pod_disruption_budget_template["spec"]["selector"]["matchLabels"],
+        )
+
+    await assert_covers_expected_workloads(
+        values,
+        make_templates,
+        "PodDisruptionBudget",
+        PropertyType.PodDisruptionBudget,
+        lambda deployable_details: deployable_details.has_replicas,
+        workload_ids_covered_by_pod_disruption_budget,
+    )
+
+
+@pytest.mark.parametrize("values_file", values_files_to_test)
+@pytest.mark.asyncio_cooperative
+async def test_pod_disruption_budgets_availability(values, make_templates):
+    counter = 0
+
+    def set_pod_disruption_budget(deployable_details: DeployableDetails):
+        nonlocal counter
+        counter += 1
+        # Alternate between the ways of configuring the PodDisruptionBudget
+        pod_disruption_budget: dict[str, Any]
+        if counter % 3 == 0:
+            pod_disruption_budget = {"enabled": True}
+        elif counter % 3 == 1:
+            pod_disruption_budget = {"enabled": True, "minAvailable": f"{counter}%"}
+        else:
+            pod_disruption_budget = {"enabled": True, "maxUnavailable": counter}
+        deployable_details.set_helm_values(values, PropertyType.PodDisruptionBudget, pod_disruption_budget)
+
+    iterate_deployables_parts(set_pod_disruption_budget, lambda deployable_details: deployable_details.has_replicas)
+
+    for template in await make_templates(values):
+        if template["kind"] != "PodDisruptionBudget":
+            continue
+
+        deployable_details = template_to_deployable_details(template)
+        pod_disruption_budget = deployable_details.get_helm_values(values, PropertyType.PodDisruptionBudget)
+        assert template["spec"]["unhealthyPodEvictionPolicy"] == "AlwaysAllow"
+        if "minAvailable" in pod_disruption_budget:
+            assert template["spec"]["minAvailable"] == pod_disruption_budget["minAvailable"]
+            assert "maxUnavailable" not in template["spec"], f"{template_id(template)} has both availability fields"
+        else:
+            assert template["spec"]["maxUnavailable"] == pod_disruption_budget.get("maxUnavailable", 1)
+            assert "minAvailable" not in template["spec"], f"{template_id(template)} has both availability fields"
@@ -85,6 +85,49 @@ async def test_deployments_statefulsets_respect_replicas(values, make_templates)
                 )
 
 
+@pytest.mark.parametrize("values_file", values_files_to_test)
+@pytest.mark.asyncio_cooperative
+async def test_rolling_updates_can_be_configured(values, make_templates):
+    counter = 0
+
+    def set_rolling_update(deployable_details: DeployableDetails):
+        nonlocal counter
+        counter += 1
+        if deployable_details.is_synapse_process:
+            deployable_details.set_helm_values(values, PropertyType.RollingUpdate, {"partition": counter})
+        elif not deployable_details.requires_one_by_one_rollout:
+            deployable_details.set_helm_values(
+                values, PropertyType.RollingUpdate, {"maxSurge": f"{counter}%", "maxUnavailable": 0}
+            )
+
+    iterate_deployables_parts(set_rolling_update, lambda deployable_details: deployable_details.has_replicas)
+
+    for template in await make_templates(values):
+        if template["kind"] not in ["Deployment", "StatefulSet"]:
+            continue
+
+        deployable_details = template_to_deployable_details(template)
+        rolling_update = deployable_details.get_helm_values(values, PropertyType.RollingUpdate) or {}
+        if template["kind"] == "StatefulSet":
+            assert template["spec"]["updateStrategy"]["type"] == "RollingUpdate"
+            if deployable_details.has_replicas:
+                assert template["spec"]["updateStrategy"]["rollingUpdate"] == rolling_update, (
+                    f"{template_id(template)} has an incorrect rollingUpdate"
+                )
+            else:
+                assert "rollingUpdate" not in template["spec"]["updateStrategy"], (
+                    f"{template_id(template)} has a rollingUpdate when it can't be configured"
+                )
+        elif deployable_details.has_replicas and not deployable_details.requires_one_by_one_rollout:
+            assert template["spec"]["strategy"]["rollingUpdate"] == rolling_update, (
+                f"{template_id(template)} has an incorrect rollingUpdate"
+            )
+        elif deployable_details.requires_one_by_one_rollout:
+            assert template["spec"]["strategy"]["rollingUpdate"] == {"maxSurge": 0, "maxUnavailable": 1}, (
+                f"{template_id(template)} doesn't roll out one-by-one"
+            )
+
+
 def set_replicas_details(values):
     # We have a counter that increments for each replicas field for each deployable details
     # That way we can assert a) the correct value is going into the correct field and
@@ -97,3 +140,87 @@ def set_replicas_details(values):
         deployable_details.set_helm_values(values, PropertyType.Replicas, counter)
 
     iterate_deployables_parts(set_replicas_details, lambda deployable_details: deployable_details.has_replicas)
+    allow_postgres_connections_for_replicas(values)
+    allow_matrix_rtc_sfu_replicas(values)
+
+
+def allow_matrix_rtc_sfu_replicas(values):
+    # Multiple SFU replicas need Redis to coordinate and must be limited to one per node
+    values.setdefault("matrixRTC", {}).setdefault("sfu", {}).update(
+        {"hostNetwork": True, "manualIP": "", "redis": {"address": "redis.example.com:6379"}}
+    )
+
+
+def allow_postgres_connections_for_replicas(values):
+    # Synapse's and Matrix Authentication Service's database pools for every replica must fit within the bundled
+    # Postgres' max_connections, which is derived from its memory limit, or within PgBouncer's limits
+    values.setdefault("postgres", {}).setdefault("resources", {}).setdefault("limits", {})["memory"] = "256Gi"
+    if values["postgres"].get("pgbouncer", {}).get("enabled"):
+        values["postgres"]["pgbouncer"].setdefault("maxClientConnections", 100000)
+        values["postgres"]["pgbouncer"].setdefault("matrixAuthenticationServicePoolSize", 2000)
+
+
+@pytest.mark.parametrize("values_file", values_files_to_test)
+@pytest.mark.asyncio_cooperative
+async def test_no_horizontal_pod_autoscalers_by_default(templates):
+    for template in templates:
+        assert template["kind"] != "HorizontalPodAutoscaler", f"{template_id(template)} is present by default"
+
+
+@pytest.mark.parametrize("values_file", values_files_to_test)
+@pytest.mark.asyncio_cooperative
+async def test_autoscaling_replaces_replicas(values, make_templates):
+    counter = 1
+
+    def set_autoscaling_details(deployable_details: DeployableDetails):
+        nonlocal counter
+        counter += 1
+        deployable_details.set_helm_values(
+            values,
+            PropertyType.Autoscaling,
+            {
+                "enabled": True,
+                "minReplicas": counter,
+                "maxReplicas": counter + 1,
+                "targetCPUUtilizationPercentage": 70,
+                "metrics": [{"type": "Pods", "pods": {"metric": {"name": "a_metric"}}}],
+                "behavior": {"scaleDown": {"stabilizationWindowSeconds": 300}},
+            },
+        )
+
+    iterate_deployables_parts(set_autoscaling_details, lambda deployable_details: deployable_details.has_autoscaling)
+    allow_postgres_connections_for_replicas(values)
+
+    templates = await make_templates(values)
+    hpas_by_target = {
+        (template["spec"]["scaleTargetRef"]["kind"], template["spec"]["scaleTargetRef"]["name"]): template
+        for template in templates
+        if template["kind"] == "HorizontalPodAutoscaler"
+    }
+    for template in templates:
+        if template["kind"] not in ["Deployment", "StatefulSet"]:
+            continue
+
+        deployable_details = template_to_deployable_details(template)
+        hpa = hpas_by_target.pop((template["kind"], template["metadata"]["name"]), None)
+        if not deployable_details.has_autoscaling:
+            assert "replicas" in template["spec"], f"{template_id(template)} does not specify replicas"
+            assert hpa is None, f"{template_id(template)} is autoscaled when it can't be"
+            continue
+
+        assert "replicas" not in template["spec"], f"{template_id(template)} specifies replicas when autoscaled"
+        assert hpa is not None, f"{template_id(template)} is not autoscaled"
+        assert hpa["spec"]["scaleTargetRef"]["apiVersion"] == "apps/v1"
+        autoscaling = deployable_details.get_helm_values(values, PropertyType.Autoscaling)
+        assert hpa["spec"]["minReplicas"] == autoscaling["minReplicas"], f"{template_id(hpa)} has incorrect minReplicas"
+        assert hpa["spec"]["maxReplicas"] == autoscaling["maxReplicas"], f"{template_id(hpa)} has incorrect maxReplicas"
+        assert list(hpa["spec"]["metrics"]) == [
+            {
+                "type": "Resource",
+                "resource": {"name": "cpu", "target": {"type": "Utilization", "averageUtilization": 70}},
+            },
+            *autoscaling["metrics"],
+        ], f"{template_id(hpa)} has incorrect metrics"
+        assert hpa["spec"]["behavior"] == autoscaling["behavior"], f"{template_id(hpa)} has incorrect behavior"
+
+    assert not hpas_by_target, f"HorizontalPodAutoscalers without a matching workload: {list(hpas_by_target)}"
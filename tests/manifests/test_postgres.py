@@ -4,6 +4,8 @@
 # SPDX-License-Identifier: AGPL-3.0-only
 
 import pytest
+import yaml
+from pyhelm3.errors import FailedToRenderChartError
 
 
 @pytest.mark.parametrize("values_file", ["synapse-minimal-values.yaml"])
@@ -30,3 +32,190 @@ async def test_postgres_env_overrides(values, make_templates):
             break
     else:
         raise RuntimeError("Could not find Postgres statefulset")
+
+
+def postgres_settings(release_name, templates):
+    for template in templates:
+        if template["kind"] == "StatefulSet" and template["metadata"]["name"] == f"{release_name}-postgres":
+            args = template["spec"]["template"]["spec"]["containers"][0]["args"]
+            assert args[::2] == tuple(["-c"] * (len(args) // 2))
+            return dict(arg.split("=", 1) for arg in args[1::2])
+    raise RuntimeError("Could not find Postgres statefulset")
+
+
+@pytest.mark.parametrize("values_file", ["synapse-minimal-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_postgres_default_tuning(release_name, templates):
+    assert postgres_settings(release_name, templates) == {
+        "max_connections": "256",
+        "shared_buffers": "1024MB",
+        "effective_cache_size": "3840MB",
+    }
+
+
+@pytest.mark.parametrize("values_file", ["synapse-minimal-values.yaml"])
+@pytest.mark.parametrize(
+    ("tuning_profile", "expected_settings"),
+    [
+        (
+            "small",
+            {
+                "max_connections": "128",
+                "shared_buffers": "256MB",
+                "effective_cache_size": "1024MB",
+                "work_mem": "4MB",
+                "maintenance_work_mem": "64MB",
+                "wal_buffers": "-1",
+                "checkpoint_completion_target": "0.9",
+                "random_page_cost": "1.1",
+                "effective_io_concurrency": "100",
+                "max_wal_size": "1GB",
+            },
+        ),
+        (
+            "synapse-heavy",
+            {
+                "max_connections": "128",
+                "shared_buffers": "512MB",
+                "effective_cache_size": "1536MB",
+                "work_mem": "4MB",
+                "maintenance_work_mem": "128MB",
+                "wal_buffers": "16MB",
+                "checkpoint_completion_target": "0.9",
+                "random_page_cost": "1.1",
+                "effective_io_concurrency": "200",
+                "max_wal_size": "4GB",
+                "autovacuum_max_workers": "4",
+                "autovacuum_vacuum_scale_factor": "0.02",
+                "autovacuum_analyze_scale_factor": "0.01",
+                "autovacuum_vacuum_cost_limit": "1000",
+            },
+        ),
+        (
+            "large",
+            {
+                "max_connections": "128",
+                "shared_buffers": "512MB",
+                "effective_cache_size": "1536MB",
+                "work_mem": "6MB",
+                "maintenance_work_mem": "128MB",
+                "wal_buffers": "16MB",
+                "checkpoint_completion_target": "0.9",
+                "random_page_cost": "1.1",
+                "effective_io_concurrency": "200",
+                "max_wal_size": "8GB",
+                "autovacuum_max_workers": "6",
+                "autovacuum_vacuum_scale_factor": "0.02",
+                "autovacuum_analyze_scale_factor": "0.01",
+                "autovacuum_vacuum_cost_limit": "2000",
+            },
+        ),
+    ],
+)
+@pytest.mark.asyncio_cooperative
+async def test_postgres_tuning_profiles(release_name, values, make_templates, tuning_profile, expected_settings):
+    values["postgres"]["tuningProfile"] = tuning_profile
+    values["postgres"]["resources"] = {"limits": {"memory": "2Gi"}}
+
+    assert postgres_settings(release_name, await make_templates(values)) == expected_settings
+
+
+@pytest.mark.parametrize("values_file", ["synapse-minimal-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_postgres_tuning_caps_large_memory(release_name, values, make_templates):
+    values["postgres"]["tuningProfile"] = "large"
+    values["postgres"]["resources"] = {"limits": {"memory": "64Gi"}}
+
+    settings = postgres_settings(release_name, await make_templates(values))
+    assert settings["maintenance_work_mem"] == "2048MB"
+    assert settings["wal_buffers"] == "64MB"
+
+
+@pytest.mark.parametrize("values_file", ["postgres-pgbouncer-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_pgbouncer_pools_sized_by_synapse_processes(release_name, values, make_templates):
+    def pgbouncer_databases(templates):
+        for template in templates:
+            if template["kind"] == "ConfigMap" and template["metadata"]["name"] == f"{release_name}-postgres-pgbouncer":
+                databases = {}
+                for line in template["data"]["pgbouncer.ini"].split("[pgbouncer]")[0].splitlines()[1:]:
+                    if line.strip():
+                        name, options = line.split(" = ")
+                        databases[name] = dict(option.split("=") for option in options.split(" "))
+                return databases
+        raise RuntimeError("Could not find PgBouncer ConfigMap")
+
+    # With session pooling each of Synapse's connections needs its own server connection
+    databases = pgbouncer_databases(await make_templates(values))
+    assert databases["synapse"]["pool_size"] == "10"
+    assert databases["synapse"]["pool_mode"] == "session"
+    assert databases["matrixauthenticationservice"]["pool_size"] == "10"
+    assert databases["matrixauthenticationservice"]["pool_mode"] == "session"
+
+    values["synapse"]["workers"] = {
+        "event-persister": {"enabled": True, "replicas": 2},
+        "synchrotron": {"enabled": True, "autoscaling": {"enabled": True, "maxReplicas": 5}},
+    }
+    databases = pgbouncer_databases(await make_templates(values))
+    # cpMax of main, 2 event-persisters and up to 5 synchrotrons
+    assert databases["synapse"]["pool_size"] == str(10 + 2 * 10 + 5 * 5)
+
+    values["postgres"]["pgbouncer"]["poolMode"] = "transaction"
+    databases = pgbouncer_databases(await make_templates(values))
+    # main + 2 event-persisters + up to 5 synchrotrons
+    assert databases["synapse"]["pool_size"] == str(3 * 8)
+    assert databases["synapse"]["pool_mode"] == "transaction"
+    assert databases["matrixauthenticationservice"]["pool_mode"] == "session"
+
+
+@pytest.mark.parametrize("values_file", ["postgres-pgbouncer-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_pgbouncer_used_by_synapse_and_mas(release_name, namespace, templates):
+    pgbouncer_host = f"{release_name}-postgres-pgbouncer.{namespace}.svc.cluster.local."
+    seen_configs = set()
+    for template in templates:
+        if template["kind"] != "ConfigMap":
+            continue
+        if template["metadata"]["name"] == f"{release_name}-synapse":
+            database_args = yaml.safe_load(template["data"]["04-homeserver-overrides.yaml"])["database"]["args"]
+            assert database_args["host"] == pgbouncer_host
+            assert database_args["port"] == 6432
+            seen_configs.add("synapse")
+        elif template["metadata"]["name"] == f"{release_name}-matrix-authentication-service":
+            database_uri = yaml.safe_load(template["data"]["mas-config-overrides.yaml"])["database"]["uri"]
+            assert f"@{pgbouncer_host}:6432/matrixauthenticationservice?" in database_uri
+            seen_configs.add("matrix-authentication-service")
+        elif template["metadata"]["name"] == f"{release_name}-postgres-pgbouncer":
+            # Synapse sets statement_timeout etc once per connection, which transaction pooling wouldn't keep
+            assert "synapse = " in template["data"]["pgbouncer.ini"]
+            assert "matrixauthenticationservice = " in template["data"]["pgbouncer.ini"]
+            for line in template["data"]["pgbouncer.ini"].split("[pgbouncer]")[0].splitlines()[1:]:
+                if line.strip():
+                    assert line.endswith(" pool_mode=session"), f"{line} doesn't use session pooling"
+            seen_configs.add("pgbouncer")
+    assert seen_configs == {"synapse", "matrix-authentication-service", "pgbouncer"}
+
+
+@pytest.mark.parametrize("values_file", ["postgres-pgbouncer-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_pgbouncer_pools_must_fit_in_postgres(values, make_templates):
+    values["postgres"]["resources"] = {"limits": {"memory": "128Mi"}}
+    values["postgres"]["pgbouncer"]["matrixAuthenticationServicePoolSize"] = 20
+
+    with pytest.raises(FailedToRenderChartError, match="postgres.pgbouncer pools need 30 Postgres connections"):
+        await make_templates(values)
+
+    # Postgres' superuser_reserved_connections and the exporter's connection aren't available to the pools
+    values["postgres"]["resources"] = {"limits": {"memory": "544Mi"}}
+    await make_templates(values)
+    values["postgres"]["resources"] = {"limits": {"memory": "528Mi"}}
+    with pytest.raises(FailedToRenderChartError, match="need 30 Postgres connections but Postgres only allows 29"):
+        await make_templates(values)
+
+    # Transaction pooling shares server connections between Synapse's connections
+    values["postgres"]["pgbouncer"]["poolMode"] = "transaction"
+    values["postgres"]["resources"] = {"limits": {"memory": "432Mi"}}
+    await make_templates(values)
+    values["postgres"]["resources"] = {"limits": {"memory": "416Mi"}}
+    with pytest.raises(FailedToRenderChartError, match="need 23 Postgres connections but Postgres only allows 22"):
+        await make_templates(values)
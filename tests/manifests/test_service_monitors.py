@@ -24,7 +24,7 @@ async def test_service_monitored_as_appropriate(values: dict, make_templates):
     ):
         service_templates = templates_by_kind["Service"]
         matching_service_templates = find_services_matching_selector(
-            service_templates, service_monitor_template["spec"]["selector"]["matchLabels"]
+            service_templates, service_monitor_template["spec"]["selector"]
         )
         assert matching_service_templates != []
 
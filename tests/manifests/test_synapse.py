@@ -4,8 +4,11 @@
 # SPDX-License-Identifier: AGPL-3.0-only
 
 
+import base64
+
 import pytest
 import yaml
+from pyhelm3.errors import Error, FailedToRenderChartError
 
 from . import DeployableDetails, PropertyType
 from .utils import (
@@ -179,3 +182,476 @@ async def test_synapse_resources_shared_by_default(values, make_templates):
                     f"{template_id(template)} has container {container['name']} "
                     "which doesn't have the expected resources"
                 )
+
+
+def redis_config(release_name, templates):
+    for template in templates:
+        if template["kind"] == "ConfigMap" and template["metadata"]["name"] == f"{release_name}-synapse-redis":
+            config = {}
+            for line in template["data"]["redis.conf"].splitlines():
+                if line and not line.startswith("#"):
+                    key, value = line.split(" ", 1)
+                    config.setdefault(key, []).append(value)
+            return config
+    raise RuntimeError("Could not find Synapse Redis ConfigMap")
+
+
+@pytest.mark.parametrize("values_file", ["synapse-worker-example-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_redis_tuning_derived_from_memory_limit(release_name, values, make_templates):
+    config = redis_config(release_name, await make_templates(values))
+    assert config["maxmemory"] == ["100mb"]
+    assert config["maxmemory-policy"] == ["allkeys-lru"]
+    assert config["io-threads"] == ["1"]
+    assert config["hz"] == ["1"]
+    assert config["tcp-backlog"] == ["511"]
+    assert "pubsub 50mb 25mb 60" in config["client-output-buffer-limit"]
+
+    values["synapse"].setdefault("redis", {})["resources"] = {"limits": {"memory": "1Gi"}}
+    config = redis_config(release_name, await make_templates(values))
+    assert config["maxmemory"] == ["512mb"]
+    assert "pubsub 256mb 128mb 60" in config["client-output-buffer-limit"]
+
+    values["synapse"]["redis"]["resources"] = {"limits": None}
+    config = redis_config(release_name, await make_templates(values))
+    assert "maxmemory" not in config
+    assert "pubsub 32mb 8mb 60" in config["client-output-buffer-limit"]
+
+
+@pytest.mark.parametrize("values_file", ["synapse-checkov-with-workers-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_redis_tuning_accepts_any_memory_quantity(release_name, values, make_templates):
+    for memory, expected_max_memory in [
+        ("512M", "244mb"),
+        ("1G", "476mb"),
+        ("2e9", "953mb"),
+        ("536870912", "256mb"),
+        ("1.5Gi", "768mb"),
+    ]:
+        values["synapse"].setdefault("redis", {})["resources"] = {"limits": {"memory": memory}}
+        config = redis_config(release_name, await make_templates(values))
+        assert config["maxmemory"] == [expected_max_memory], f"Incorrect maxmemory for {memory}"
+
+    # Quantities that can't be parsed skip the derived tuning rather than failing the chart
+    values["synapse"]["redis"]["resources"] = {"limits": {"memory": "1e2.5"}}
+    config = redis_config(release_name, await make_templates(values))
+    assert "maxmemory" not in config
+
+
+@pytest.mark.parametrize("values_file", ["synapse-worker-example-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_redis_tuning_overrides(release_name, values, make_templates):
+    values["synapse"].setdefault("redis", {}).update(
+        {
+            "maxMemoryMB": 40,
+            "maxMemoryPolicy": "volatile-lru",
+            "ioThreads": 4,
+            "hz": 10,
+            "tcpBacklog": 1024,
+            "pubsubClientOutputBufferLimit": {"hardLimitMB": 80, "softLimitMB": 0, "softLimitSeconds": 0},
+        }
+    )
+    config = redis_config(release_name, await make_templates(values))
+    assert config["maxmemory"] == ["40mb"]
+    assert config["maxmemory-policy"] == ["volatile-lru"]
+    assert config["io-threads"] == ["4"]
+    assert config["hz"] == ["10"]
+    assert config["tcp-backlog"] == ["1024"]
+    assert "pubsub 80mb 0mb 0" in config["client-output-buffer-limit"]
+
+
+@pytest.mark.parametrize("values_file", ["synapse-worker-example-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_redis_tuning_must_fit_in_memory_limit(values, make_templates):
+    values["synapse"].setdefault("redis", {})["maxMemoryMB"] = 180
+
+    with pytest.raises(FailedToRenderChartError, match="must fit within synapse.redis.resources.limits.memory"):
+        await make_templates(values)
+
+    values["synapse"]["redis"]["maxMemoryMB"] = 50
+    values["synapse"]["redis"]["pubsubClientOutputBufferLimit"] = {"hardLimitMB": 10, "softLimitMB": 20}
+    with pytest.raises(FailedToRenderChartError, match="softLimitMB must not be greater than"):
+        await make_templates(values)
+
+
+def synapse_process_configs(release_name, templates):
+    for template in templates:
+        if template["kind"] == "ConfigMap" and template["metadata"]["name"] == f"{release_name}-synapse":
+            return {
+                key.removeprefix("05-").removesuffix(".yaml"): yaml.safe_load(value)
+                for key, value in template["data"].items()
+                if key.startswith("05-")
+            }
+    raise RuntimeError("Could not find Synapse ConfigMap")
+
+
+def synapse_process_caches(release_name, templates):
+    return {
+        process_type: process_config["caches"]
+        for process_type, process_config in synapse_process_configs(release_name, templates).items()
+    }
+
+
+@pytest.mark.parametrize("values_file", ["synapse-worker-example-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_synapse_caches_derived_from_memory_limit(release_name, values, make_templates):
+    caches = synapse_process_caches(release_name, await make_templates(values))
+    assert caches["main"] == {
+        "expire_caches": True,
+        "cache_entry_ttl": "30m",
+        "cache_autotuning": {
+            "max_cache_memory_usage": "3072M",
+            "target_cache_memory_usage": "2457M",
+            "min_cache_ttl": "5m",
+        },
+    }
+    assert all(process_caches == caches["main"] for process_caches in caches.values())
+
+    values["synapse"]["caches"] = {"globalFactor": 1.5, "perCacheFactors": {"get_users_in_room": 4}}
+    values["synapse"]["workers"]["synchrotron"]["resources"] = {"limits": {"memory": "1Gi"}}
+    values["synapse"]["workers"]["synchrotron"]["caches"] = {
+        "globalFactor": 3,
+        "autotuning": {"targetCacheMemoryUsagePercent": 50},
+    }
+    values["synapse"]["workers"]["event-persister"]["caches"] = {
+        "expireCaches": False,
+        "autotuning": {"enabled": False},
+    }
+    caches = synapse_process_caches(release_name, await make_templates(values))
+    assert caches["main"]["global_factor"] == 1.5
+    assert caches["main"]["per_cache_factors"] == {"get_users_in_room": 4}
+    assert caches["synchrotron"]["global_factor"] == 3
+    assert caches["synchrotron"]["per_cache_factors"] == {"get_users_in_room": 4}
+    assert caches["synchrotron"]["cache_autotuning"] == {
+        "max_cache_memory_usage": "768M",
+        "target_cache_memory_usage": "512M",
+        "min_cache_ttl": "5m",
+    }
+    assert caches["event-persister"]["global_factor"] == 1.5
+    assert not caches["event-persister"]["expire_caches"]
+    assert "cache_autotuning" not in caches["event-persister"]
+
+    values["synapse"]["resources"] = {"limits": None}
+    caches = synapse_process_caches(release_name, await make_templates(values))
+    assert "cache_autotuning" not in caches["main"]
+    assert "cache_autotuning" in caches["synchrotron"]
+
+
+@pytest.mark.parametrize("values_file", ["synapse-minimal-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_synapse_cache_autotuning_accepts_any_memory_quantity(release_name, values, make_templates):
+    values["synapse"]["resources"] = {"limits": {"memory": "4G"}}
+    caches = synapse_process_caches(release_name, await make_templates(values))
+    assert caches["main"]["cache_autotuning"]["max_cache_memory_usage"] == "2860M"
+    assert caches["main"]["cache_autotuning"]["target_cache_memory_usage"] == "2288M"
+
+    values["synapse"]["resources"] = {"limits": {"memory": "1e2.5"}}
+    caches = synapse_process_caches(release_name, await make_templates(values))
+    assert "cache_autotuning" not in caches["main"]
+
+
+@pytest.mark.parametrize("values_file", ["synapse-worker-example-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_synapse_cache_autotuning_target_must_be_below_max(values, make_templates):
+    values["synapse"]["workers"]["synchrotron"]["caches"] = {"autotuning": {"targetCacheMemoryUsagePercent": 80}}
+
+    with pytest.raises(FailedToRenderChartError, match="Synapse synchrotron cache autotuning target memory usage"):
+        await make_templates(values)
+
+
+@pytest.mark.parametrize("values_file", ["synapse-minimal-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_synapse_media_s3_storage_provider(release_name, values, make_templates):
+    def media_volume(templates):
+        for template in templates:
+            if template["kind"] == "StatefulSet" and template["metadata"]["name"] == f"{release_name}-synapse-main":
+                volumes = template["spec"]["template"]["spec"]["volumes"]
+                return next(volume for volume in volumes if volume["name"] == "media")
+        raise RuntimeError("Could not find Synapse main StatefulSet")
+
+    def media_pvcs(templates):
+        return [
+            template
+            for template in templates
+            if template["kind"] == "PersistentVolumeClaim"
+            and template["metadata"]["name"] == f"{release_name}-synapse-media"
+        ]
+
+    templates = await make_templates(values)
+    assert "media_storage_providers" not in synapse_process_configs(release_name, templates)["main"]
+    assert media_volume(templates)["persistentVolumeClaim"]["claimName"] == f"{release_name}-synapse-media"
+
+    values["synapse"]["media"] = {
+        "s3": {
+            "enabled": True,
+            "bucket": "synapse-media",
+            "endpointUrl": "http://minio:9000",
+            "prefix": "media/",
+            "threadpoolSize": 10,
+            "accessKeyId": {"value": "access-key-id"},
+            "secretAccessKey": {"secret": "{{ $.Release.Name }}-s3", "secretKey": "secretAccessKey"},
+        }
+    }
+    templates = await make_templates(values)
+    assert synapse_process_configs(release_name, templates)["main"]["media_storage_providers"] == [
+        {
+            "module": "s3_storage_provider.S3StorageProviderBackend",
+            "store_local": True,
+            "store_remote": False,
+            "store_synchronous": True,
+            "config": {
+                "bucket": "synapse-media",
+                "endpoint_url": "http://minio:9000",
+                "prefix": "media/",
+                "threadpool_size": 10,
+                "access_key_id": "${SYNAPSE_S3_ACCESS_KEY_ID}",
+                "secret_access_key": "${SYNAPSE_S3_SECRET_ACCESS_KEY}",
+            },
+        }
+    ]
+    for template in templates:
+        if template["kind"] == "Secret" and template["metadata"]["name"] == f"{release_name}-synapse":
+            assert template["data"]["S3_ACCESS_KEY_ID"] == base64.b64encode(b"access-key-id").decode()
+        elif template["kind"] == "StatefulSet" and template["metadata"]["name"] == f"{release_name}-synapse-main":
+            render_config = next(
+                container
+                for container in template["spec"]["template"]["spec"]["initContainers"]
+                if container["name"] == "render-config"
+            )
+            env = {env["name"]: env["value"] for env in render_config["env"]}
+            assert env["SYNAPSE_S3_ACCESS_KEY_ID"] == (
+                f'{{{{ readfile "/secrets/{release_name}-synapse/S3_ACCESS_KEY_ID" | quote }}}}'
+            )
+            assert env["SYNAPSE_S3_SECRET_ACCESS_KEY"] == (
+                f'{{{{ readfile "/secrets/{release_name}-s3/secretAccessKey" | quote }}}}'
+            )
+    assert media_volume(templates)["persistentVolumeClaim"]["claimName"] == f"{release_name}-synapse-media"
+    assert len(media_pvcs(templates)) == 1
+
+    values["synapse"]["media"]["s3"]["localCache"] = {"persistent": False, "sizeLimit": "5Gi"}
+    templates = await make_templates(values)
+    assert media_volume(templates) == {"name": "media", "emptyDir": {"sizeLimit": "5Gi"}}
+    assert len(media_pvcs(templates)) == 0
+
+    values["synapse"]["media"]["s3"]["asynchronousUploads"] = True
+    with pytest.raises(FailedToRenderChartError, match="asynchronousUploads requires"):
+        await make_templates(values)
+
+    values["synapse"]["media"]["s3"] = {"enabled": True}
+    with pytest.raises(FailedToRenderChartError, match="synapse.media.s3.bucket is required"):
+        await make_templates(values)
+
+
+@pytest.mark.parametrize("values_file", ["synapse-minimal-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_synapse_media_repository_replicas(release_name, values, make_templates):
+    def background_jobs_instance(templates):
+        for template in templates:
+            if template["kind"] == "ConfigMap" and template["metadata"]["name"] == f"{release_name}-synapse":
+                overrides = yaml.safe_load(template["data"]["04-homeserver-overrides.yaml"])
+                return overrides.get("media_instance_running_background_jobs")
+        raise RuntimeError("Could not find Synapse ConfigMap")
+
+    templates = await make_templates(values)
+    assert background_jobs_instance(templates) is None
+
+    values["synapse"].setdefault("workers", {})["media-repository"] = {"enabled": True}
+    templates = await make_templates(values)
+    assert background_jobs_instance(templates) == f"{release_name}-synapse-media-repo-0"
+
+    values["synapse"]["workers"]["media-repository"]["replicas"] = 3
+    values["synapse"]["media"] = {
+        "backgroundJobsReplica": 2,
+        "s3": {"enabled": True, "bucket": "synapse-media", "localCache": {"persistent": False}},
+    }
+    templates = await make_templates(values)
+    assert background_jobs_instance(templates) == f"{release_name}-synapse-media-repo-2"
+    for template in templates:
+        if template["kind"] == "StatefulSet" and template["metadata"]["name"] == f"{release_name}-synapse-media-repo":
+            assert template["spec"]["replicas"] == 3
+
+    values["synapse"]["media"]["backgroundJobsReplica"] = 3
+    with pytest.raises(FailedToRenderChartError, match="backgroundJobsReplica must be less than"):
+        await make_templates(values)
+
+
+@pytest.mark.parametrize("values_file", ["synapse-minimal-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_synapse_database_pools(release_name, values, make_templates):
+    def database_pools(templates):
+        return {
+            process_type: process_config["database"]["args"]
+            for process_type, process_config in synapse_process_configs(release_name, templates).items()
+        }
+
+    values["synapse"].setdefault("workers", {}).update(
+        {
+            "event-persister": {"enabled": True},
+            "synchrotron": {"enabled": True, "replicas": 4},
+            "typing-persister": {"enabled": True},
+        }
+    )
+    templates = await make_templates(values)
+    assert database_pools(templates) == {
+        "main": {"cp_min": 5, "cp_max": 10},
+        "event-persister": {"cp_min": 5, "cp_max": 10},
+        "synchrotron": {"cp_min": 3, "cp_max": 5},
+        "typing-persister": {"cp_min": 1, "cp_max": 3},
+    }
+
+    values["synapse"]["databasePool"] = {"cpMax": 20}
+    values["synapse"]["workers"]["synchrotron"]["databasePool"] = {"cpMin": 1, "cpMax": 2}
+    templates = await make_templates(values)
+    assert database_pools(templates)["main"] == {"cp_min": 5, "cp_max": 20}
+    assert database_pools(templates)["synchrotron"] == {"cp_min": 1, "cp_max": 2}
+
+    # 20 + 10 + 4 * 2 + 3 = 41 connections, with 4 connections reserved
+    values.setdefault("postgres", {}).setdefault("resources", {})["limits"] = {"memory": "720Mi"}
+    templates = await make_templates(values)
+    values["postgres"]["resources"]["limits"] = {"memory": "704Mi"}
+    with pytest.raises(FailedToRenderChartError, match="need up to 41 connections but Postgres only allows 40"):
+        await make_templates(values)
+
+    values["postgres"]["pgbouncer"] = {"enabled": True, "maxClientConnections": 40}
+    with pytest.raises(FailedToRenderChartError, match="postgres.pgbouncer.maxClientConnections is 40"):
+        await make_templates(values)
+
+    values["synapse"]["workers"]["synchrotron"]["databasePool"] = {"cpMin": 3, "cpMax": 2}
+    with pytest.raises(FailedToRenderChartError, match="synchrotron database pool cpMin \\(3\\) must not be greater"):
+        await make_templates(values)
+
+
+@pytest.mark.parametrize("values_file", ["synapse-minimal-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_synapse_gc_settings(release_name, values, make_templates):
+    def gc_settings(templates):
+        return {
+            process_type: {key: value for key, value in process_config.items() if key.startswith("gc_")}
+            for process_type, process_config in synapse_process_configs(release_name, templates).items()
+        }
+
+    values["synapse"].setdefault("workers", {}).update(
+        {
+            "federation-reader": {"enabled": True},
+            "synchrotron": {"enabled": True},
+            "typing-persister": {"enabled": True},
+        }
+    )
+    templates = await make_templates(values)
+    assert gc_settings(templates) == {
+        "main": {"gc_thresholds": [1000, 20, 20], "gc_min_interval": ["1s", "30s", "120s"]},
+        "federation-reader": {"gc_thresholds": [700, 10, 10], "gc_min_interval": ["1s", "10s", "60s"]},
+        "synchrotron": {"gc_thresholds": [1000, 20, 20], "gc_min_interval": ["1s", "30s", "120s"]},
+        "typing-persister": {},
+    }
+
+    values["synapse"]["gc"] = {"minInterval": ["500ms", "1m", "5m"]}
+    values["synapse"]["workers"]["typing-persister"]["gc"] = {"thresholds": [500, 5, 5]}
+    templates = await make_templates(values)
+    assert gc_settings(templates)["main"] == {
+        "gc_thresholds": [1000, 20, 20],
+        "gc_min_interval": ["500ms", "1m", "5m"],
+    }
+    assert gc_settings(templates)["typing-persister"] == {"gc_thresholds": [500, 5, 5]}
+    assert gc_settings(templates)["synchrotron"] == {
+        "gc_thresholds": [1000, 20, 20],
+        "gc_min_interval": ["1s", "30s", "120s"],
+    }
+
+    # Synapse only accepts whole numbers of each unit, so this must be rejected by the schema
+    values["synapse"]["gc"] = {"minInterval": ["1.5s", "30s", "120s"]}
+    with pytest.raises(Error, match="synapse.gc.minInterval.0: Does not match pattern"):
+        await make_templates(values)
+
+
+@pytest.mark.parametrize("values_file", ["synapse-worker-example-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_synapse_jemalloc(values, make_templates):
+    def synapse_envs(templates):
+        envs = {}
+        for template in templates:
+            if template["kind"] not in ["StatefulSet", "Job"]:
+                continue
+            for container in template["spec"]["template"]["spec"]["containers"]:
+                if container["name"] == "synapse":
+                    envs[template["metadata"]["name"]] = {env["name"]: env["value"] for env in container.get("env", [])}
+        assert len(envs) > 0
+        return envs
+
+    for name, env in synapse_envs(await make_templates(values)).items():
+        assert env["LD_PRELOAD"] == "libjemalloc.so.2", f"{name} doesn't use jemalloc"
+        assert env["MALLOC_CONF"] == "background_thread:true", f"{name} has the wrong jemalloc options"
+
+    malloc_conf = "background_thread:true,dirty_decay_ms:1000"
+    values["synapse"]["jemalloc"] = {"mallocConf": malloc_conf}
+    for name, env in synapse_envs(await make_templates(values)).items():
+        assert env["MALLOC_CONF"] == malloc_conf, f"{name} has the wrong jemalloc options"
+
+    values["synapse"]["jemalloc"] = {"enabled": False}
+    for name, env in synapse_envs(await make_templates(values)).items():
+        assert "LD_PRELOAD" not in env, f"{name} uses jemalloc"
+        assert "MALLOC_CONF" not in env, f"{name} has jemalloc options"
+
+
+@pytest.mark.parametrize("values_file", ["synapse-minimal-values.yaml"])
+@pytest.mark.asyncio_cooperative
+async def test_log_formats_handlers_and_worker_levels(release_name, values, make_templates):
+    def log_configs(templates):
+        for template in templates:
+            if template["kind"] == "ConfigMap" and template["metadata"]["name"] == f"{release_name}-synapse":
+                data = template["data"]
+                return {key: yaml.safe_load(value) for key, value in data.items() if key.startswith("log_config")}
+        raise RuntimeError("Could not find Synapse ConfigMap")
+
+    def log_config_mounts(templates):
+        mounts = {}
+        for template in templates:
+            if template["kind"] == "StatefulSet":
+                synapse_container = template["spec"]["template"]["spec"]["containers"][0]
+                for volume_mount in synapse_container["volumeMounts"]:
+                    if volume_mount["mountPath"] == "/conf/log_config.yaml":
+                        mounts[template["metadata"]["name"]] = volume_mount["subPath"]
+        return mounts
+
+    values["synapse"].setdefault("workers", {}).update(
+        {
+            "federation-reader": {"enabled": True, "logging": {"rootLevel": "WARNING"}},
+            "synchrotron": {"enabled": True},
+        }
+    )
+    templates = await make_templates(values)
+    configs = log_configs(templates)
+    assert set(configs.keys()) == {
+        "log_config.yaml",
+        "log_config-federation-reader.yaml",
+        "log_config-synchrotron.yaml",
+    }
+    assert configs["log_config.yaml"]["root"] == {"level": "INFO", "handlers": ["console"]}
+    assert configs["log_config-synchrotron.yaml"]["root"] == {"level": "INFO", "handlers": ["console"]}
+    assert configs["log_config-federation-reader.yaml"]["root"] == {"level": "WARNING", "handlers": ["console"]}
+    for config in configs.values():
+        assert list(config["formatters"].keys()) == ["precise"]
+        assert config["handlers"] == {"console": {"class": "logging.StreamHandler", "formatter": "precise"}}
+    assert log_config_mounts(templates) == {
+        f"{release_name}-synapse-main": "log_config.yaml",
+        f"{release_name}-synapse-fed-reader": "log_config-federation-reader.yaml",
+        f"{release_name}-synapse-synchrotron": "log_config-synchrotron.yaml",
+    }
+
+    values["synapse"]["logging"] = {"format": "json", "queued": True}
+    configs = log_configs(await make_templates(values))
+    for config in configs.values():
+        assert config["formatters"] == {"json": {"class": "synapse.logging.TerseJsonFormatter"}}
+        assert config["handlers"] == {
+            "console": {"class": "logging.StreamHandler", "formatter": "json"},
+            "queued": {"class": "logging.handlers.QueueHandler", "handlers": ["console"]},
+        }
+        assert config["root"]["handlers"] == ["queued"]
+    assert configs["log_config-federation-reader.yaml"]["root"]["level"] == "WARNING"
+
+    values["synapse"]["logging"] = {"format": "compact", "rootLevel": "DEBUG"}
+    configs = log_configs(await make_templates(values))
+    assert list(configs["log_config.yaml"]["formatters"].keys()) == ["compact"]
+    assert configs["log_config.yaml"]["root"]["level"] == "DEBUG"
+    assert configs["log_config-synchrotron.yaml"]["root"]["level"] == "DEBUG"
+    assert configs["log_config-federation-reader.yaml"]["root"]["level"] == "WARNING"
@@ -320,10 +320,12 @@ def find_workload_ids_matching_selector(templates: list[dict[str, Any]], selecto
     return workload_ids
 
 
-def find_services_matching_selector(templates: list[dict[str, Any]], selector: dict[str, str]) -> list[dict[str, Any]]:
+def find_services_matching_selector(
+    templates: list[dict[str, Any]], label_selector: dict[str, Any]
+) -> list[dict[str, Any]]:
     services = []
     for template in templates:
-        if template["kind"] == "Service" and selector_match(template["metadata"]["labels"], selector):
+        if template["kind"] == "Service" and label_selector_match(template["metadata"]["labels"], label_selector):
             services.append(template)
     return services
 
@@ -332,6 +334,19 @@ def selector_match(labels: dict[str, str], selector: dict[str, str]) -> bool:
     return all(labels.get(key) == value for key, value in selector.items())
 
 
+def label_selector_match(labels: dict[str, str], label_selector: dict[str, Any]) -> bool:
+    operators = {
+        "In": lambda key, values: key in labels and labels[key] in values,
+        "NotIn": lambda key, values: key not in labels or labels[key] not in values,
+        "Exists": lambda key, _: key in labels,
+        "DoesNotExist": lambda key, _: key not in labels,
+    }
+    return selector_match(labels, label_selector.get("matchLabels", {})) and all(
+        operators[expression["operator"]](expression["key"], expression.get("values", []))
+        for expression in label_selector.get("matchExpressions", [])
+    )
+
+
 async def assert_covers_expected_workloads(
     values,
     make_templates,